@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def get_feature_fields(feature):
+    """Helper function to get the fields of a GeoJSON or Esri JSON feature
+
+    :param feature: ArcGIS feature
+    :returns: Feature properties or attributes
+    :rtype: dict
+    """
+    return feature.get('properties') or feature.get('attributes') or {}
+
+
+def to_timestamp_literal(epoch_ms):
+    """Helper function to get the SQL literal of an ArcGIS date, truncated to
+    the second
+
+    :param epoch_ms: Epoch milliseconds
+    :returns: TIMESTAMP literal of a where clause
+    :rtype: str
+    """
+    dt = datetime.fromtimestamp(epoch_ms // 1000, timezone.utc)
+    return f"TIMESTAMP '{dt.strftime('%Y-%m-%d %H:%M:%S')}'"
+
+
+class LayerState:
+    """
+    Converted features of an ArcGIS layer from the previous runs and the
+    latest edit date among them, so following runs only query and re-project
+    the features edited since then
+    """
+    def __init__(self, file_name, object_id_field, edit_date_field):
+        """
+        :param file_name: State file name
+        :param object_id_field: Object ID field of the layer
+        :param edit_date_field: Editor tracking field of the layer
+        """
+        self.file_name = file_name
+        self.object_id_field = object_id_field
+        self.edit_date_field = edit_date_field
+        self.refreshed_at = None
+        self.high_water_mark = None
+        self.features = {}
+
+        if os.path.exists(file_name):
+            with open(file_name) as file:
+                state = json.load(file)
+            if (
+                state.get('version') == FORMAT_VERSION
+                and state.get('editDateField') == edit_date_field
+            ):
+                self.refreshed_at = datetime.fromisoformat(
+                    state['refreshedAt']
+                )
+                self.high_water_mark = state['highWaterMark']
+                for feature in state['features']:
+                    self.features[self.get_object_id(feature)] = feature
+            else:
+                logger.info(f'Ignoring outdated layer state {file_name}')
+
+    def get_object_id(self, feature):
+        object_id = get_feature_fields(feature).get(self.object_id_field)
+        return feature.get('id') if object_id is None else object_id
+
+    def needs_full_refresh(self, full_refresh_hours, now=None):
+        """Check if all the features should be fetched again
+
+        :param full_refresh_hours: Hours between full refreshes
+        :param now: Current datetime, in UTC
+        :returns: Whether there is no usable state or it is due
+        :rtype: bool
+        """
+        if self.refreshed_at is None or self.high_water_mark is None:
+            return True
+        now = now or datetime.utcnow()
+        return now - self.refreshed_at >= timedelta(hours=full_refresh_hours)
+
+    def get_delta_where(self, where):
+        """Get the where clause of the features edited since the last run.
+        The mark is truncated to the second, so the features edited later
+        within that second are fetched again.
+
+        :param where: Where clause of the full query
+        :returns: Where clause
+        :rtype: str
+        """
+        edited = (
+            f'{self.edit_date_field} > '
+            f'{to_timestamp_literal(self.high_water_mark)}'
+        )
+        return f'({where or "1=1"}) AND {edited}'
+
+    def update(self, features, full_refresh, object_ids=None):
+        """Merge fetched features into the state and advance the high-water
+        mark
+
+        :param features: Fetched features
+        :param full_refresh: Whether the features are all the features,
+                             replacing the state
+        :param object_ids: IDs of all the current features of the layer, the
+                           other ones being deleted
+        :returns: Number of deleted features
+        :rtype: int
+        """
+        deleted = 0
+        if full_refresh:
+            self.features = {}
+            self.refreshed_at = datetime.utcnow()
+            self.high_water_mark = None
+        elif object_ids is not None:
+            object_ids = set(object_ids)
+            for object_id in list(self.features):
+                if object_id not in object_ids:
+                    del self.features[object_id]
+                    deleted += 1
+
+        for feature in features:
+            object_id = self.get_object_id(feature)
+            if object_id is None:
+                logger.warning(
+                    f'{self.file_name}: features without '
+                    f'{self.object_id_field}, only full refreshes are run'
+                )
+                self.features = {}
+                self.high_water_mark = None
+                return deleted
+            self.features[object_id] = feature
+            edit_date = get_feature_fields(feature).get(self.edit_date_field)
+            if edit_date is not None and (
+                self.high_water_mark is None
+                or edit_date > self.high_water_mark
+            ):
+                self.high_water_mark = edit_date
+        return deleted
+
+    def save(self):
+        """Write the state, replacing the previous one atomically
+        """
+        os.makedirs(os.path.dirname(self.file_name) or '.', exist_ok=True)
+        temporary_file = f'{self.file_name}.tmp'
+        with open(temporary_file, 'w') as file:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'editDateField': self.edit_date_field,
+                'refreshedAt': self.refreshed_at.isoformat(),
+                'highWaterMark': self.high_water_mark,
+                'features': list(self.features.values())
+            }, file)
+        os.replace(temporary_file, self.file_name)
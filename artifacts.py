@@ -0,0 +1,239 @@
+"""
+Sharded NDJSON artifacts with an ID index, so single documents can be looked
+up, shards read in parallel and builds diffed without decoding everything:
+
+    $ python artifacts.py get build/artifacts/locations <id>
+    $ python artifacts.py diff previous/artifacts/locations \
+        build/artifacts/locations
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+
+
+INDEX_FILE = 'index.json'
+FORMAT_VERSION = 1
+
+
+class ArtifactWriter:
+    """
+    Writer of documents into NDJSON shards of a bounded size and of the index
+    of their shard, offset, length and content hash
+    """
+    def __init__(self, folder, shard_bytes=4 * 1024 ** 2):
+        """
+        :param folder: Artifact folder, emptied of previous shards
+        :param shard_bytes: Size in bytes after which a new shard is started
+        """
+        self.folder = folder
+        self.shard_bytes = shard_bytes
+        self.shards = []
+        self.documents = {}
+        self._file = None
+        self._offset = 0
+
+        os.makedirs(folder, exist_ok=True)
+        for file_name in os.listdir(folder):
+            if file_name.endswith('.ndjson') or file_name == INDEX_FILE:
+                os.remove(os.path.join(folder, file_name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _start_shard(self):
+        if self._file:
+            self._file.close()
+        shard = f'shard-{len(self.shards):05d}.ndjson'
+        self.shards.append(shard)
+        self._file = open(os.path.join(self.folder, shard), 'wb')
+        self._offset = 0
+
+    def write(self, doc):
+        """Append a document
+
+        :param doc: Document with an id
+        """
+        if not self._file or self._offset >= self.shard_bytes:
+            self._start_shard()
+
+        line = json.dumps(doc).encode('utf-8')
+        self._file.write(line)
+        self._file.write(b'\n')
+        self.documents[doc['id']] = [
+            len(self.shards) - 1,
+            self._offset,
+            len(line),
+            hashlib.md5(line).hexdigest()
+        ]
+        self._offset += len(line) + 1
+
+    def close(self):
+        """Close the last shard and write the index
+        """
+        if self._file:
+            self._file.close()
+            self._file = None
+
+        with open(os.path.join(self.folder, INDEX_FILE), 'w') as file:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'shards': self.shards,
+                'documents': self.documents
+            }, file)
+
+
+class ArtifactReader:
+    """
+    Random-access reader of an artifact folder. Shards are memory-mapped on
+    first use, and only the documents read are decoded.
+    """
+    def __init__(self, folder):
+        """
+        :param folder: Artifact folder
+        """
+        self.folder = folder
+        with open(os.path.join(folder, INDEX_FILE)) as file:
+            index = json.load(file)
+
+        if index['version'] != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported artifact format version {index['version']}."
+            )
+        self.shards = index['shards']
+        self.documents = index['documents']
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+
+    def __iter__(self):
+        for shard in range(len(self.shards)):
+            yield from self.iter_shard(shard)
+
+    def _get_map(self, shard):
+        if shard not in self._maps:
+            with open(os.path.join(self.folder, self.shards[shard])) as file:
+                self._maps[shard] = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        return self._maps[shard]
+
+    def get_raw(self, doc_id):
+        """Get the encoded document of an ID
+
+        :param doc_id: Document ID
+        :returns: JSON encoded document
+        :rtype: bytes
+        """
+        shard, offset, length, _ = self.documents[doc_id]
+        return self._get_map(shard)[offset:offset + length]
+
+    def get(self, doc_id):
+        """Get the document of an ID
+
+        :param doc_id: Document ID
+        :returns: Document
+        :rtype: dict
+        """
+        return json.loads(self.get_raw(doc_id))
+
+    def iter_shard(self, shard):
+        """Iterate the documents of a shard, e.g. to read shards in parallel
+
+        :param shard: Shard number
+        :returns: Documents of the shard
+        :rtype: generator
+        """
+        with open(os.path.join(self.folder, self.shards[shard]), 'rb') as file:
+            for line in file:
+                yield json.loads(line)
+
+    def diff(self, previous):
+        """Compare the documents with a previous build by their content hash
+
+        :param previous: ArtifactReader of the previous build, or None
+        :returns: Created, updated and deleted document IDs
+        :rtype: tuple
+        """
+        previous_documents = previous.documents if previous else {}
+        created, updated = set(), set()
+        for doc_id, entry in self.documents.items():
+            previous_entry = previous_documents.get(doc_id)
+            if not previous_entry:
+                created.add(doc_id)
+            elif previous_entry[3] != entry[3]:
+                updated.add(doc_id)
+        deleted = set(previous_documents) - set(self.documents)
+        return created, updated, deleted
+
+    def close(self):
+        for shard_map in self._maps.values():
+            shard_map.close()
+        self._maps = {}
+
+
+def write_artifact(folder, docs, shard_bytes=4 * 1024 ** 2):
+    """Helper function to write documents into an artifact folder
+
+    :param folder: Artifact folder
+    :param docs: Documents
+    :param shard_bytes: Size in bytes after which a new shard is started
+    """
+    with ArtifactWriter(folder, shard_bytes) as writer:
+        for doc in docs:
+            writer.write(doc)
+
+
+def parse_arguments():
+    """Helper function for parsing command-line arguments
+
+    :returns: Parsed arguments
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    get_parser = commands.add_parser('get', help='Print a document')
+    get_parser.add_argument('folder')
+    get_parser.add_argument('id')
+
+    diff_parser = commands.add_parser(
+        'diff',
+        help='Print the IDs created, updated and deleted since a build'
+    )
+    diff_parser.add_argument('previous')
+    diff_parser.add_argument('folder')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+
+    with ArtifactReader(arguments.folder) as reader:
+        if arguments.command == 'get':
+            print(reader.get_raw(arguments.id).decode('utf-8'))
+        else:
+            with ArtifactReader(arguments.previous) as previous:
+                created, updated, deleted = reader.diff(previous)
+            for action, ids in [
+                ('CREATE', created),
+                ('UPDATE', updated),
+                ('DELETE', deleted)
+            ]:
+                for doc_id in sorted(ids):
+                    print(f'[{action}] {doc_id}')
@@ -0,0 +1,165 @@
+"""
+Compare the ingest throughput and index size of the build artifacts indexed
+with dynamic mappings and with the managed index templates of es_templates.py.
+Scratch indices are created on the configured cluster and deleted afterwards:
+
+    $ python build_artifacts.py --config=configuration.yaml
+    $ python benchmarks/compare_mappings.py --config=configuration.yaml
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from es_templates import get_index_template, INDICES  # noqa: E402
+from es_transport import create_client  # noqa: E402
+from utils import load_json, load_yaml  # noqa: E402
+
+
+logger = logging.getLogger(__name__)
+
+MAPPINGS = ['dynamic', 'template']
+
+
+def get_bulk_body(docs):
+    """Build the bulk body indexing documents
+
+    :param docs: Documents
+    :returns: Bulk body
+    :rtype: str
+    """
+    body = io.StringIO()
+    for doc in docs:
+        body.write(json.dumps({'index': {'_id': doc['id']}}))
+        body.write('\n')
+        body.write(json.dumps(doc))
+        body.write('\n')
+    return body.getvalue()
+
+
+def create_scratch_index(es, index, mapping):
+    """Create a scratch index with dynamic mappings or with the settings and
+    mappings of the index template
+
+    :param es: Elasticsearch client
+    :param index: Index alias, one of INDICES
+    :param mapping: One of MAPPINGS
+    :returns: Scratch index name
+    :rtype: str
+    """
+    name = f'{index}-compare-{mapping}'
+    es.indices.delete(index=name, ignore=404)
+
+    template = get_index_template(index)
+    body = {'settings': template['settings']}
+    if mapping == 'template':
+        body['mappings'] = template['mappings']
+    es.indices.create(index=name, body=body)
+    return name
+
+
+def measure(es, index, mapping, docs, rounds):
+    """Index the documents into a scratch index several times
+
+    :param es: Elasticsearch client
+    :param index: Index alias, one of INDICES
+    :param mapping: One of MAPPINGS
+    :param docs: Documents
+    :param rounds: Number of times the documents are indexed
+    :returns: Table row
+    :rtype: list
+    """
+    name = create_scratch_index(es, index, mapping)
+    body = get_bulk_body(docs)
+
+    try:
+        elapsed = 0.0
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = es.bulk(body=body, index=name, doc_type=index)
+            elapsed += time.perf_counter() - start
+            if result['errors']:
+                logger.warning(f'{name} bulk request had errors')
+
+        es.indices.refresh(index=name)
+        es.indices.forcemerge(index=name, max_num_segments=1)
+        stats = es.indices.stats(index=name, metric='store')
+        size = stats['_all']['primaries']['store']['size_in_bytes']
+        mapping_size = len(json.dumps(es.indices.get_mapping(index=name)))
+    finally:
+        es.indices.delete(index=name, ignore=404)
+
+    return [
+        index,
+        mapping,
+        len(docs) * rounds,
+        round(len(docs) * rounds / elapsed, 1),
+        round(size / 1024 ** 2, 3),
+        mapping_size
+    ]
+
+
+def parse_arguments():
+    """Helper function for parsing command-line arguments
+
+    :returns: Parsed arguments
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--config',
+        required=True,
+        help='Path to the config file with the awsElasticsearch section')
+    parser.add_argument(
+        '--artifacts',
+        default='build',
+        help='Folder of the build artifacts')
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        default=5,
+        help='Number of times the artifacts are indexed')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('elasticsearch').setLevel(logging.WARNING)
+
+    config = load_yaml(arguments.config)['awsElasticsearch']
+    es = create_client(config)
+    artifacts = {
+        'locations': load_json(
+            f'{arguments.artifacts}/locations-combined.json'
+        ),
+        'services': load_json(f'{arguments.artifacts}/services.json')
+    }
+
+    table = []
+    for index in INDICES:
+        for mapping in MAPPINGS:
+            table.append(measure(
+                es, index, mapping, artifacts[index], arguments.rounds
+            ))
+
+    logger.info('\n' + tabulate(
+        table,
+        headers=[
+            'Index',
+            'Mapping',
+            'Documents',
+            'Docs/s',
+            'Store Size (MB)',
+            'Mapping Size (bytes)'
+        ],
+        tablefmt='fancy_grid'
+    ))
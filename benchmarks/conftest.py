@@ -0,0 +1,209 @@
+import io
+import json
+import os
+import sys
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+import yaml
+
+from fake_es import FakeElasticsearch
+from fake_upstream import FakeUpstream
+from generators import Dataset, make_config
+import utils
+
+
+BASE_URL = 'http://upstream.test'
+ES_HOST = 'elasticsearch.test'
+ES_PORT = 9200
+DEFAULT_SCALES = '1,10,100'
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--scales',
+        default=os.environ.get('BENCHMARK_SCALES', DEFAULT_SCALES),
+        help='Comma separated data scales to benchmark (default: 1,10,100)'
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if 'scale' in metafunc.fixturenames:
+        scales = metafunc.config.getoption('scales')
+        metafunc.parametrize(
+            'scale',
+            [int(scale) for scale in scales.split(',')],
+            ids=lambda scale: f'{scale}x',
+            scope='module'
+        )
+
+
+class FakeUpstreamAdapter(BaseAdapter):
+    """
+    Transport adapter answering every request from a fake upstream without
+    going through the network
+    """
+    def __init__(self, dataset):
+        super().__init__()
+        self.upstream = FakeUpstream(dataset)
+
+    def send(self, request, **kwargs):
+        status, content_type, body = self.upstream.respond(
+            request.method,
+            request.path_url
+        )
+
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = 'utf-8'
+        response.status_code = status
+        response.headers['Content-Type'] = content_type
+        response.raw = io.BytesIO(body)
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeElasticsearchAdapter(BaseAdapter):
+    """
+    Transport adapter answering the requests of the Elasticsearch client from
+    a fake cluster without going through the network
+    """
+    def __init__(self):
+        super().__init__()
+        self.elasticsearch = FakeElasticsearch()
+
+    def send(self, request, **kwargs):
+        status, body = self.elasticsearch.respond(
+            request.method,
+            request.path_url,
+            request.body,
+            request.headers
+        )
+
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = 'utf-8'
+        response.status_code = status
+        response.headers['Content-Type'] = 'application/json'
+        response.raw = io.BytesIO(
+            b'' if body is None else json.dumps(body).encode('utf-8')
+        )
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope='module')
+def dataset(scale):
+    return Dataset(scale=scale)
+
+
+@pytest.fixture(scope='module')
+def upstream(dataset):
+    """Route every requests session, including the one of the calendar
+    fetcher threads, to the synthetic dataset
+    """
+    adapter = FakeUpstreamAdapter(dataset)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(
+            requests.Session,
+            'get_adapter',
+            lambda session, url: adapter
+        )
+        yield adapter
+
+
+@pytest.fixture(scope='module')
+def elasticsearch(upstream):
+    """Route the requests of the Elasticsearch client to a fake cluster, and
+    the other ones to the synthetic dataset as before
+    """
+    adapter = FakeElasticsearchAdapter()
+    get_adapter = requests.Session.get_adapter
+    es_url = f'http://{ES_HOST}:{ES_PORT}'
+
+    def _get_adapter(session, url):
+        if url.startswith(es_url):
+            return adapter
+        return get_adapter(session, url)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(requests.Session, 'get_adapter', _get_adapter)
+        yield adapter.elasticsearch
+
+
+@pytest.fixture(scope='module')
+def es_config(tmp_path_factory):
+    """Write a configuration file pointing es_manager.py at the fake cluster
+    """
+    config_file = tmp_path_factory.mktemp('elasticsearch') / 'config.yaml'
+    with open(config_file, 'w') as file:
+        yaml.safe_dump({
+            'awsElasticsearch': {
+                'host': ES_HOST,
+                'port': ES_PORT,
+                'useSsl': False
+            }
+        }, file)
+    return str(config_file)
+
+
+@pytest.fixture(scope='module')
+def workspace(dataset, tmp_path_factory):
+    """Create a working directory with the configuration and contrib files
+    the generator reads
+    """
+    folder = tmp_path_factory.mktemp('workspace')
+    os.makedirs(folder / 'contrib')
+    dataset.write_contrib(folder / 'contrib')
+    with open(folder / 'configuration.yaml', 'w') as file:
+        yaml.safe_dump(make_config(BASE_URL), file)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(folder)
+        yield folder
+
+
+@pytest.fixture(scope='module')
+def generator(workspace, upstream):
+    # Imported here so the benchmarks can select the scales to run first
+    from build_artifacts import LocationsGenerator
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(
+            sys,
+            'argv',
+            ['build_artifacts.py', '--config=configuration.yaml']
+        )
+        arguments = utils.parse_arguments(generator=True)
+    return LocationsGenerator(arguments)
+
+
+@pytest.fixture
+def run(benchmark, scale):
+    """Run a function under the benchmark with fewer rounds at larger scales
+
+    :returns: Runner function
+    """
+    rounds = max(1, 10 // scale)
+
+    def _run(function, *args, setup=None, **kwargs):
+        if setup:
+            return benchmark.pedantic(
+                function,
+                setup=setup,
+                rounds=rounds
+            )
+        return benchmark.pedantic(
+            function,
+            args=args,
+            kwargs=kwargs,
+            rounds=rounds
+        )
+    return _run
@@ -0,0 +1,567 @@
+"""
+A local stand-in for the Elasticsearch 6.x endpoints es_manager.py uses:
+index templates, indices, aliases, scroll searches and bulk requests with
+realistic per-item responses, plus configurable latency and injected item
+errors and throttling. It only keeps the IDs and versions of the documents,
+so its memory stays small next to the client's. Run it and point
+es_manager.py at it (host 127.0.0.1, useSsl false):
+
+    $ python benchmarks/fake_es.py --port=9200 --latency=0.02 \\
+          --throttle-rate=0.01
+    $ python es_manager.py --config=configuration.yaml
+"""
+import argparse
+from fnmatch import fnmatch
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+logger = logging.getLogger(__name__)
+
+SHARDS = {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}
+
+# Errors of the items rejected by a bulk request, keyed by status
+ITEM_ERRORS = {
+    400: {
+        'type': 'mapper_parsing_exception',
+        'reason': 'failed to parse',
+        'caused_by': {
+            'type': 'illegal_argument_exception',
+            'reason': 'Injected mapping error'
+        }
+    },
+    429: {
+        'type': 'es_rejected_execution_exception',
+        'reason': 'rejected execution of coordinating operation'
+    }
+}
+
+
+def _error(status, error_type, reason):
+    return status, {
+        'error': {'type': error_type, 'reason': reason},
+        'status': status
+    }
+
+
+class FakeElasticsearch:
+    """
+    Cluster state of the stand-in and the failure model applied to its
+    requests
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=400, throttle_rate=0.0, seed=0):
+        """
+        :param latency: Seconds to wait before answering each request
+        :param jitter: Maximum random seconds added to the latency
+        :param error_rate: Ratio of bulk items rejected with error_status
+        :param error_status: HTTP status of the rejected items, 400 or 429
+        :param throttle_rate: Ratio of bulk requests answered with a 429
+        :param seed: Random seed of the injected latency and errors
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop every template, index and alias, and reset the counters
+        """
+        with self._lock:
+            self.templates = {}
+            # Versions of the documents of each index, keyed by ID
+            self.indices = {}
+            self.aliases = {}
+            self.scrolls = {}
+            self._scroll_count = 0
+            self.stats = {
+                'requests': 0,
+                'bulk_requests': 0,
+                'bytes_received': 0,
+                'items': 0,
+                'item_errors': 0,
+                'throttled': 0
+            }
+
+    def count(self, name):
+        """Count the documents of an index or alias
+
+        :param name: Index name or alias
+        :returns: Number of documents
+        :rtype: int
+        """
+        with self._lock:
+            return sum(
+                len(self.indices[index]) for index in self._resolve(name)
+            )
+
+    def _wait(self):
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+    def _resolve(self, name):
+        """Get the indices of an index name, alias or pattern
+
+        :param name: Comma separated names
+        :returns: Index names
+        :rtype: list
+        """
+        indices = []
+        for part in name.split(','):
+            if part in self.aliases:
+                indices.extend(sorted(self.aliases[part]))
+            elif '*' in part:
+                indices.extend(
+                    index for index in sorted(self.indices)
+                    if fnmatch(index, part)
+                )
+            elif part in self.indices:
+                indices.append(part)
+        return indices
+
+    def _get_write_index(self, name):
+        if not name:
+            return None
+        indices = self._resolve(name)
+        if len(indices) == 1:
+            return indices[0]
+        if not indices and name not in self.aliases:
+            # Indices are created on the first write, like auto_create_index
+            self.indices[name] = {}
+            return name
+        return None
+
+    def _template(self, method, name, body):
+        if method == 'PUT':
+            self.templates[name] = body
+            return 200, {'acknowledged': True}
+        if method == 'DELETE':
+            if self.templates.pop(name, None) is None:
+                return 404, {}
+            return 200, {'acknowledged': True}
+        if name in self.templates:
+            return 200, {name: self.templates[name]}
+        return 404, {}
+
+    def _update_aliases(self, body):
+        for action in body.get('actions', []):
+            (action_type, params), = action.items()
+            if action_type == 'remove_index':
+                for index in self._resolve(params['index']):
+                    self._delete_index(index)
+                continue
+
+            indices = self._resolve(params['index'])
+            if not indices:
+                return _error(
+                    404, 'index_not_found_exception',
+                    f"no such index [{params['index']}]"
+                )
+            for index in indices:
+                if action_type == 'add':
+                    self.aliases.setdefault(params['alias'], set()).add(index)
+                else:
+                    self.aliases.get(params['alias'], set()).discard(index)
+        self.aliases = {
+            alias: indices for alias, indices in self.aliases.items()
+            if indices
+        }
+        return 200, {'acknowledged': True}
+
+    def _delete_index(self, index):
+        del self.indices[index]
+        for indices in self.aliases.values():
+            indices.discard(index)
+
+    def _get_aliases(self, name):
+        return {
+            index: {'aliases': {name: {}}}
+            for index in sorted(self.aliases.get(name, ()))
+        }
+
+    def _search(self, name, query):
+        """Start a search, returning the document IDs without sources
+
+        :param name: Index name or alias
+        :param query: Parsed query string
+        :returns: Status and response
+        :rtype: tuple
+        """
+        indices = self._resolve(name)
+        if not indices:
+            return _error(
+                404, 'index_not_found_exception', f'no such index [{name}]'
+            )
+        hits = [
+            {'_index': index, '_type': '_doc', '_id': doc_id, '_score': None}
+            for index in indices
+            for doc_id in self.indices[index]
+        ]
+        size = int(query.get('size', ['10'])[0])
+        if 'scroll' not in query:
+            return 200, self._page(None, hits, size, len(hits))
+
+        self._scroll_count += 1
+        scroll_id = f'scroll-{self._scroll_count}'
+        self.scrolls[scroll_id] = (hits, size, len(hits))
+        return 200, self._page(scroll_id, hits, size, len(hits))
+
+    def _page(self, scroll_id, hits, size, total):
+        page = hits[:size]
+        del hits[:size]
+        response = {
+            'took': 1,
+            'timed_out': False,
+            '_shards': SHARDS,
+            'hits': {'total': total, 'max_score': None, 'hits': page}
+        }
+        if scroll_id:
+            response['_scroll_id'] = scroll_id
+        return response
+
+    def _scroll(self, method, query, body):
+        scroll_ids = body.get('scroll_id') or query.get('scroll_id', [''])[0]
+        if method == 'DELETE':
+            if isinstance(scroll_ids, str):
+                scroll_ids = scroll_ids.split(',')
+            freed = sum(
+                self.scrolls.pop(scroll_id, None) is not None
+                for scroll_id in scroll_ids
+            )
+            return 200, {'succeeded': True, 'num_freed': freed}
+
+        if scroll_ids not in self.scrolls:
+            return _error(
+                404, 'search_context_missing_exception',
+                f'No search context found for id [{scroll_ids}]'
+            )
+        hits, size, total = self.scrolls[scroll_ids]
+        return 200, self._page(scroll_ids, hits, size, total)
+
+    def _bulk(self, name, body):
+        """Apply a bulk request
+
+        :param name: Default index name or alias of the items
+        :param body: NDJSON body
+        :returns: Status and response
+        :rtype: tuple
+        """
+        self.stats['bulk_requests'] += 1
+        if self._random.random() < self.throttle_rate:
+            self.stats['throttled'] += 1
+            return _error(
+                429, 'es_rejected_execution_exception',
+                'rejected execution of coordinating operation'
+            )
+
+        started = time.perf_counter()
+        lines = body.splitlines()
+        items = []
+        position = 0
+        while position < len(lines):
+            if not lines[position].strip():
+                position += 1
+                continue
+            (action, params), = json.loads(lines[position]).items()
+            position += 1
+            if action in ('index', 'create', 'update'):
+                # Only the ID of the document is kept
+                position += 1
+            items.append(self._bulk_item(action, params, name))
+
+        self.stats['items'] += len(items)
+        return 200, {
+            'took': int((time.perf_counter() - started) * 1000),
+            'errors': any('error' in next(iter(item.values()))
+                          for item in items),
+            'items': items
+        }
+
+    def _bulk_item(self, action, params, name):
+        index = self._get_write_index(params.get('_index') or name)
+        doc_id = params.get('_id')
+        item = {
+            '_index': index,
+            '_type': params.get('_type', '_doc'),
+            '_id': doc_id
+        }
+        if index is None:
+            item['_index'] = name
+            item['status'] = 400
+            item['error'] = {
+                'type': 'illegal_argument_exception',
+                'reason': f'no write index is defined for [{name}]'
+            }
+            return {action: item}
+
+        if self._random.random() < self.error_rate:
+            self.stats['item_errors'] += 1
+            item['status'] = self.error_status
+            item['error'] = ITEM_ERRORS.get(
+                self.error_status, ITEM_ERRORS[400]
+            )
+            return {action: item}
+
+        docs = self.indices[index]
+        if action == 'delete':
+            version = docs.pop(doc_id, None)
+            found = version is not None
+            item.update({
+                '_version': (version or 0) + 1,
+                'result': 'deleted' if found else 'not_found',
+                'status': 200 if found else 404
+            })
+        else:
+            created = doc_id not in docs
+            docs[doc_id] = docs.get(doc_id, 0) + 1
+            item.update({
+                '_version': docs[doc_id],
+                'result': 'created' if created else 'updated',
+                'status': 201 if created else 200
+            })
+        item.update({
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            '_seq_no': self.stats['items'],
+            '_primary_term': 1
+        })
+        return {action: item}
+
+    def _index(self, method, path, query, body):
+        name = path[0]
+        indices = self._resolve(name)
+        if len(path) == 1:
+            if method == 'HEAD':
+                return (200 if indices else 404), None
+            if method == 'PUT':
+                if name in self.indices:
+                    return _error(
+                        400, 'resource_already_exists_exception',
+                        f'index [{name}] already exists'
+                    )
+                self.indices[name] = {}
+                return 200, {
+                    'acknowledged': True,
+                    'shards_acknowledged': True,
+                    'index': name
+                }
+            if method == 'DELETE':
+                if not indices:
+                    return _error(
+                        404, 'index_not_found_exception',
+                        f'no such index [{name}]'
+                    )
+                for index in indices:
+                    self._delete_index(index)
+                return 200, {'acknowledged': True}
+            return 200, {
+                index: {'aliases': {}, 'mappings': {}, 'settings': {}}
+                for index in indices
+            }
+
+        # The document type of ES 6.x paths is ignored
+        endpoint = path[-1]
+        if endpoint == '_alias' or (len(path) == 3 and path[1] == '_alias'):
+            alias = path[2] if len(path) == 3 else None
+            aliases = {
+                alias_name: alias_indices & set(indices)
+                for alias_name, alias_indices in self.aliases.items()
+                if alias in (None, alias_name) and alias_indices & set(indices)
+            }
+            if method == 'HEAD':
+                return (200 if aliases else 404), None
+            return 200, {
+                index: {'aliases': {
+                    alias_name: {} for alias_name, alias_indices
+                    in aliases.items() if index in alias_indices
+                }}
+                for index in sorted(indices)
+            }
+        if endpoint == '_refresh':
+            return 200, {'_shards': SHARDS}
+        if endpoint == '_search':
+            return self._search(name, query)
+        if endpoint == '_count':
+            count = sum(len(self.indices[index]) for index in indices)
+            return 200, {'count': count, '_shards': SHARDS}
+        return _error(
+            400, 'illegal_argument_exception',
+            f"Unsupported endpoint [{method} /{'/'.join(path)}]"
+        )
+
+    def respond(self, method, url, body=b'', headers=None):
+        """Build the response of a request
+
+        :param method: HTTP method
+        :param url: Request URL or path with query string
+        :param body: Request body
+        :param headers: Request headers
+        :returns: Status and JSON body, None for HEAD requests
+        :rtype: tuple
+        """
+        self._wait()
+        headers = {
+            key.lower(): value for key, value in (headers or {}).items()
+        }
+        body = body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        with self._lock:
+            self.stats['bytes_received'] += len(body)
+        if headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        body = body.decode('utf-8')
+
+        parsed = urlparse(url)
+        path = [part for part in parsed.path.split('/') if part]
+        query = parse_qs(parsed.query)
+
+        with self._lock:
+            if path and path[-1] == '_bulk':
+                name = path[0] if len(path) > 1 else None
+                status, response = self._bulk(name, body)
+            else:
+                json_body = json.loads(body) if body.strip() else {}
+                status, response = self._route(method, path, query, json_body)
+
+        if method == 'HEAD':
+            return status, None
+        return status, response
+
+    def _route(self, method, path, query, body):
+        if not path:
+            return 200, {
+                'name': 'fake-es',
+                'cluster_name': 'fake-es',
+                'version': {'number': '6.8.0'},
+                'tagline': 'You Know, for Search'
+            }
+        if path[0] == '_template' and len(path) == 2:
+            return self._template(method, path[1], body)
+        if path == ['_aliases']:
+            return self._update_aliases(body)
+        if path[0] == '_alias' and len(path) == 2:
+            aliases = self._get_aliases(path[1])
+            if method == 'HEAD':
+                return (200 if aliases else 404), None
+            return (200 if aliases else 404), aliases
+        if path[:2] == ['_search', 'scroll']:
+            return self._scroll(method, query, body)
+        return self._index(method, path, query, body)
+
+
+def make_handler(elasticsearch):
+    """Create a request handler class bound to a fake Elasticsearch
+
+    :param elasticsearch: FakeElasticsearch instance
+    :returns: Request handler class
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _respond(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+
+            status, response = elasticsearch.respond(
+                self.command, self.path, body, dict(self.headers)
+            )
+            data = b'' if response is None else json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _respond
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def parse_arguments():
+    """Helper function for parsing command-line arguments
+
+    :returns: Parsed arguments
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.0,
+        help='Seconds to wait before answering each request')
+    parser.add_argument(
+        '--jitter',
+        type=float,
+        default=0.0,
+        help='Maximum random seconds added to the latency')
+    parser.add_argument(
+        '--error-rate',
+        type=float,
+        default=0.0,
+        help='Ratio of bulk items rejected with --error-status')
+    parser.add_argument(
+        '--error-status',
+        type=int,
+        default=400,
+        choices=sorted(ITEM_ERRORS))
+    parser.add_argument(
+        '--throttle-rate',
+        type=float,
+        default=0.0,
+        help='Ratio of bulk requests answered with a 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--debug', action='store_true')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+
+    logging.basicConfig(
+        level=(logging.DEBUG if arguments.debug else logging.INFO)
+    )
+
+    elasticsearch = FakeElasticsearch(
+        latency=arguments.latency,
+        jitter=arguments.jitter,
+        error_rate=arguments.error_rate,
+        error_status=arguments.error_status,
+        throttle_rate=arguments.throttle_rate,
+        seed=arguments.seed
+    )
+    server = ThreadingHTTPServer(
+        (arguments.host, arguments.port),
+        make_handler(elasticsearch)
+    )
+
+    logger.info(
+        f'Serving fake Elasticsearch on '
+        f'http://{arguments.host}:{server.server_port}'
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(', '.join(
+            f'{key} {value}' for key, value in elasticsearch.stats.items()
+        ))
+        server.server_close()
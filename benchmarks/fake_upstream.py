@@ -0,0 +1,461 @@
+"""
+A local stand-in for every upstream of the locations generator, serving the
+synthetic data of generators.Dataset over HTTP with configurable latency,
+error rates and payload sizes, plus a SQLite stand-in for the Banner facil
+query. Run it and point build_artifacts.py at the configuration it writes:
+
+    $ python benchmarks/fake_upstream.py --scale=10 --latency=0.05 \\
+          --output=build/fake-upstream
+    $ python build_artifacts.py --config=build/fake-upstream/configuration.yaml
+"""
+import argparse
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import operator
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+
+import yaml
+
+from generators import ROUTES, Dataset, make_config
+
+
+logger = logging.getLogger(__name__)
+
+# ArcGIS layers which support paging, keyed by route path
+ARCGIS_LAYERS = {
+    ROUTES['genderInclusiveRR']: 'gender_inclusive_restrooms',
+    ROUTES['buildingGeometries']: 'building_geometries',
+    ROUTES['parkingGeometries']: 'parking_geometries',
+    ROUTES['fields']: 'fields',
+    ROUTES['places']: 'places'
+}
+
+# Editor tracking date of the features until they are edited, in epoch ms
+EDIT_DATE = 1546300800000
+
+# Comparisons of the where clauses of the ArcGIS queries, e.g.
+# EditDate >= TIMESTAMP '2019-01-01 00:00:00'
+WHERE_CONDITION = re.compile(
+    r"^(\w+)\s*(>=|<=|>|<|=)\s*(?:TIMESTAMP\s*'([^']+)'|(-?\d+))$",
+    re.IGNORECASE
+)
+WHERE_OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+    '=': operator.eq
+}
+
+FACIL_COLUMNS = [
+    'id', 'abbreviation', 'name', 'campus', 'address1', 'address2', 'city',
+    'state', 'zip'
+]
+
+
+class FakeUpstream:
+    """
+    Synthetic responses of every upstream endpoint and the failure model
+    applied to them
+    """
+    def __init__(self, dataset, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=503, max_record_count=0, seed=0):
+        """
+        :param dataset: Synthetic dataset to serve
+        :param latency: Seconds to wait before answering each request
+        :param jitter: Maximum random seconds added to the latency
+        :param error_rate: Ratio of requests answered with error_status
+        :param error_status: HTTP status of the injected errors
+        :param max_record_count: Maximum features per ArcGIS query page,
+                                 unlimited if 0
+        :param seed: Random seed of the injected latency and errors
+        """
+        self.dataset = dataset
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_record_count = max_record_count
+        self.payloads = dataset.payloads()
+        self.layers = {
+            path: getattr(dataset, method)()
+            for path, method in ARCGIS_LAYERS.items()
+        }
+        for path, layer in self.layers.items():
+            for feature in layer['features']:
+                self._get_fields(feature)['EditDate'] = EDIT_DATE
+            self._encode_layer(path)
+        self.calendars = {}
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_fields(feature):
+        return feature.get('properties') or feature['attributes']
+
+    def _encode_layer(self, path):
+        self.payloads[path] = (
+            json.dumps(self.layers[path]).encode('utf-8'),
+            'application/json'
+        )
+
+    def edit_features(self, path, object_ids, **fields):
+        """Edit features of a layer, bumping their editor tracking date
+
+        :param path: Layer route path
+        :param object_ids: OBJECTIDs of the edited features
+        :param fields: Field values to set
+        """
+        edit_date = int(time.time() * 1000)
+        with self._lock:
+            for feature in self.layers[path]['features']:
+                feature_fields = self._get_fields(feature)
+                if feature_fields.get('OBJECTID') in object_ids:
+                    feature_fields.update(fields, EditDate=edit_date)
+            self._encode_layer(path)
+
+    def delete_features(self, path, object_ids):
+        """Delete features of a layer
+
+        :param path: Layer route path
+        :param object_ids: OBJECTIDs of the deleted features
+        """
+        with self._lock:
+            layer = self.layers[path]
+            layer['features'] = [
+                feature for feature in layer['features']
+                if self._get_fields(feature).get('OBJECTID') not in object_ids
+            ]
+            self._encode_layer(path)
+
+    def _filter_features(self, features, where):
+        """Filter features with a where clause of 1=1 and field comparisons
+        joined by AND
+
+        :param features: Layer features
+        :param where: Where clause
+        :returns: Matched features
+        :rtype: list
+        """
+        conditions = []
+        for clause in re.split(r'\s+AND\s+', where, flags=re.IGNORECASE):
+            clause = clause.strip().strip('()').strip()
+            if clause == '1=1':
+                continue
+            match = WHERE_CONDITION.match(clause)
+            if not match:
+                raise ValueError(f'Unsupported where clause: {clause}')
+            field, comparison, timestamp, number = match.groups()
+            if timestamp:
+                dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+                value = int(dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
+            else:
+                value = int(number)
+            conditions.append((field, WHERE_OPERATORS[comparison], value))
+
+        if not conditions:
+            return features
+        return [
+            feature for feature in features
+            if all(
+                compare(self._get_fields(feature).get(field), value)
+                for field, compare, value in conditions
+            )
+        ]
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        time.sleep(delay)
+        return failed
+
+    def _query_layer(self, path, query):
+        """Answer an ArcGIS layer query with paging, count-only and IDs-only
+        support
+
+        :param path: Layer route path
+        :param query: Parsed query string
+        :returns: Response body
+        :rtype: bytes
+        """
+        def _param(name, default=None):
+            return query.get(name, [default])[0]
+
+        layer = self.layers[path]
+        features = self._filter_features(
+            layer['features'], _param('where', '1=1')
+        )
+        filtered = len(features) != len(layer['features'])
+        geojson = layer.get('type') == 'FeatureCollection'
+
+        def _object_id(feature):
+            if geojson:
+                return feature['properties']['OBJECTID']
+            return feature['attributes'].get('OBJECTID')
+
+        if _param('returnCountOnly', 'false').lower() == 'true':
+            return json.dumps({'count': len(features)}).encode('utf-8')
+        if _param('returnIdsOnly', 'false').lower() == 'true':
+            return json.dumps({
+                'objectIdFieldName': 'OBJECTID',
+                'objectIds': [_object_id(feature) for feature in features]
+            }).encode('utf-8')
+
+        offset = int(_param('resultOffset', 0))
+        count = int(_param('resultRecordCount', 0) or len(features))
+        if self.max_record_count:
+            count = min(count, self.max_record_count)
+        if offset == 0 and count >= len(features) and not filtered:
+            # Serve the pre-encoded payload when nothing is sliced
+            return self.payloads[path][0]
+
+        page = dict(layer, features=features[offset:offset + count])
+        if offset + count < len(features):
+            if geojson:
+                page['properties'] = {'exceededTransferLimit': True}
+            else:
+                page['exceededTransferLimit'] = True
+        return json.dumps(page).encode('utf-8')
+
+    def _get_calendar(self, calendar_id):
+        with self._lock:
+            if calendar_id not in self.calendars:
+                self.calendars[calendar_id] = (
+                    self.dataset.ical(calendar_id).encode('utf-8')
+                )
+            return self.calendars[calendar_id]
+
+    def respond(self, method, url):
+        """Build the response of a request
+
+        :param method: HTTP method
+        :param url: Request URL with query string
+        :returns: Status, content type and body
+        :rtype: tuple
+        """
+        if self._should_fail():
+            return self.error_status, 'text/plain', b'Injected error'
+
+        parsed = urlparse(url)
+        path = parsed.path
+
+        if method == 'GET' and path in ARCGIS_LAYERS:
+            try:
+                body = self._query_layer(path, parse_qs(parsed.query))
+            except ValueError as error:
+                # ArcGIS reports query errors in the body of a 200
+                body = json.dumps({'error': {
+                    'code': 400,
+                    'message': 'Unable to complete operation.',
+                    'details': [str(error)]
+                }}).encode('utf-8')
+            return 200, 'application/json', body
+        if method == 'GET' and path.startswith(ROUTES['ical']):
+            calendar_id = unquote(path[len(ROUTES['ical']):])
+            return 200, 'text/calendar', self._get_calendar(calendar_id)
+        if (
+            path in self.payloads
+            and (method == 'POST') == (path == ROUTES['library'])
+        ):
+            body, content_type = self.payloads[path]
+            return 200, content_type, body
+        return 404, 'text/plain', b'Not found'
+
+
+def make_handler(upstream):
+    """Create a request handler class bound to a fake upstream
+
+    :param upstream: Fake upstream instance
+    :returns: Request handler class
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _respond(self, method):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+
+            status, content_type, body = upstream.respond(method, self.path)
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._respond('GET')
+
+        def do_POST(self):
+            self._respond('POST')
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def write_facil_database(dataset, file_name):
+    """Write the Banner facil rows into a SQLite database
+
+    :param dataset: Synthetic dataset
+    :param file_name: SQLite database file name
+    """
+    if os.path.exists(file_name):
+        os.remove(file_name)
+
+    connection = sqlite3.connect(file_name)
+    with connection:
+        # activity_date is the high-water mark column of the delta mode
+        connection.execute(
+            f'CREATE TABLE facil_locations '
+            f'({", ".join(FACIL_COLUMNS)}, activity_date)'
+        )
+        connection.executemany(
+            f'INSERT INTO facil_locations VALUES '
+            f'({", ".join("?" for _ in FACIL_COLUMNS)}, ?)',
+            [
+                [row[column] for column in FACIL_COLUMNS]
+                + ['2019-01-01T00:00:00']
+                for row in dataset.facil_rows().values()
+            ]
+        )
+    connection.close()
+
+
+def write_workspace(dataset, base_url, output_folder):
+    """Write the configuration, contrib files and Banner stand-in needed to
+    run build_artifacts.py against the fake upstream
+
+    :param dataset: Synthetic dataset
+    :param base_url: Base URL of the fake upstream
+    :param output_folder: Output folder
+    :returns: Configuration file name
+    :rtype: str
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    dataset.write_contrib(output_folder)
+    database = f'{output_folder}/banner.sqlite3'
+    write_facil_database(dataset, database)
+
+    config = make_config(base_url)
+    config['database'] = {'driver': 'sqlite', 'url': database}
+    config['contrib'] = {
+        'extraData': f'{output_folder}/extra-data.yaml',
+        'facilQuery': f'{output_folder}/get_facil_locations.sql'
+    }
+
+    config_file = f'{output_folder}/configuration.yaml'
+    with open(config_file, 'w') as file:
+        yaml.safe_dump(config, file)
+    return config_file
+
+
+def parse_arguments():
+    """Helper function for parsing command-line arguments
+
+    :returns: Parsed arguments
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument(
+        '--output',
+        default='build/fake-upstream',
+        help='Folder to write the configuration and Banner stand-in to')
+    parser.add_argument(
+        '--scale',
+        type=int,
+        default=1,
+        help='Number of records of each source relative to a nightly build')
+    parser.add_argument(
+        '--vertices',
+        type=int,
+        default=40,
+        help='Average number of vertices of each polygon ring')
+    parser.add_argument(
+        '--events',
+        type=int,
+        default=1000,
+        help='Number of events of each iCal feed')
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.0,
+        help='Seconds to wait before answering each request')
+    parser.add_argument(
+        '--jitter',
+        type=float,
+        default=0.0,
+        help='Maximum random seconds added to the latency')
+    parser.add_argument(
+        '--error-rate',
+        type=float,
+        default=0.0,
+        help='Ratio of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument(
+        '--max-record-count',
+        type=int,
+        default=0,
+        help='Maximum features per ArcGIS query page, unlimited if 0')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--debug', action='store_true')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+
+    logging.basicConfig(
+        level=(logging.DEBUG if arguments.debug else logging.INFO)
+    )
+
+    dataset = Dataset(
+        scale=arguments.scale,
+        seed=arguments.seed,
+        vertices=arguments.vertices,
+        events_per_calendar=arguments.events
+    )
+    upstream = FakeUpstream(
+        dataset,
+        latency=arguments.latency,
+        jitter=arguments.jitter,
+        error_rate=arguments.error_rate,
+        error_status=arguments.error_status,
+        max_record_count=arguments.max_record_count,
+        seed=arguments.seed
+    )
+    server = ThreadingHTTPServer(
+        (arguments.host, arguments.port),
+        make_handler(upstream)
+    )
+    base_url = f'http://{arguments.host}:{server.server_port}'
+    config_file = write_workspace(dataset, base_url, arguments.output)
+
+    logger.info(f'Serving fake upstream on {base_url}')
+    logger.info(f'Run: python build_artifacts.py --config={config_file}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(
+            f'Served {upstream.requests} requests, '
+            f'{upstream.errors} injected errors'
+        )
+        server.server_close()
@@ -0,0 +1,587 @@
+"""
+Synthetic upstream data for benchmarking the locations generator. Every source
+is generated at a configurable scale so the same shapes can be measured at
+1x, 10x and 100x of the size of a nightly build.
+"""
+from datetime import datetime, timedelta
+import hashlib
+import json
+import math
+import random
+from xml.sax.saxutils import escape
+
+import yaml
+
+
+# Number of records of each source at 1x scale
+BASE_COUNTS = {
+    'facil': 300,
+    'buildings': 300,
+    'parkings': 200,
+    'fields': 100,
+    'places': 50,
+    'gender_inclusive_restrooms': 100,
+    'diners': 40,
+    'extra_locations': 20,
+    'extra_calendars': 20,
+    'extensions': 40
+}
+
+# Number of events of each iCal feed at 1x scale
+BASE_EVENTS_PER_CALENDAR = 1000
+
+# Corvallis campus center in the projected coordinates of each WKID (feet)
+CENTERS = {
+    2913: (7477858.697370041, 339531.53054973844),
+    3857: (-45024278.32447601, 18218865.31142381)
+}
+CENTER_LON_LAT = (-123.2794, 44.5638)
+
+# Paths of every upstream endpoint relative to the base URL
+ROUTES = {
+    'genderInclusiveRR': '/arcgis/genderInclusiveRR/query',
+    'buildingGeometries': '/arcgis/buildingGeometries/query',
+    'parkingGeometries': '/arcgis/parkingGeometries/query',
+    'fields': '/arcgis/fields/query',
+    'places': '/arcgis/places/query',
+    'campusMap': '/campus-map/locations.json',
+    'extension': '/extension/locations.xml',
+    'ical': '/ical/',
+    'library': '/library/hours',
+    'uhdsCalendar': '/uhds/calendar/index',
+    'uhdsWeeklyMenu': '/uhds/weeklymenu/index'
+}
+
+
+def get_bldg_id(index):
+    """Helper function to generate a Banner building ID
+
+    :param index: Building index
+    :returns: Building ID
+    :rtype: str
+    """
+    return f'{index + 1:04d}'
+
+
+def get_calendar_id(prefix, index):
+    """Helper function to generate a calendar ID
+
+    :param prefix: Calendar ID prefix
+    :param index: Calendar index
+    :returns: Calendar ID
+    :rtype: str
+    """
+    return f'{prefix}{index:05d}@group.calendar.example.com'
+
+
+def make_config(base_url):
+    """Generate a configuration object pointing every source at a base URL
+
+    :param base_url: Base URL of the upstream serving the synthetic data
+    :returns: Configuration object
+    :rtype: dict
+    """
+    def _layer(name, f='pgeojson'):
+        return {
+            'endpoint': ROUTES[name].replace('/arcgis', '', 1),
+            'params': {
+                'where': '1=1',
+                'outFields': '*',
+                'returnGeometry': True,
+                'returnCentroid': True,
+                'f': f
+            }
+        }
+
+    return {
+        'awsElasticsearch': {
+            'host': 'localhost',
+            'port': 9200,
+            'region': 'us-west-2',
+            'accessId': 'access-id',
+            'accessKey': 'access-key'
+        },
+        'locationsApi': {'url': 'http://localhost/api/v1'},
+        'locations': {
+            'arcGIS': {
+                'url': f'{base_url}/arcgis',
+                'genderInclusiveRR': _layer('genderInclusiveRR', 'pjson'),
+                'buildingGeometries': _layer('buildingGeometries'),
+                'parkingGeometries': _layer('parkingGeometries'),
+                'fields': _layer('fields', 'pjson'),
+                'places': _layer('places', 'pjson')
+            },
+            'campusMap': {'url': f'{base_url}{ROUTES["campusMap"]}'},
+            'extension': {'url': f'{base_url}{ROUTES["extension"]}'},
+            'ical': {'url': f'{base_url}{ROUTES["ical"]}calendar-id'},
+            'library': {'url': f'{base_url}{ROUTES["library"]}'},
+            'uhds': {
+                'url': f'{base_url}/uhds',
+                'calendar': 'calendar/index',
+                'weeklyMenu': 'weeklymenu/index'
+            }
+        },
+        'database': {
+            'url': 'example_url',
+            'user': 'user',
+            'password': 'password'
+        }
+    }
+
+
+class Dataset:
+    """
+    Synthetic data of every upstream source at a given scale
+    """
+    def __init__(self, scale=1, seed=0, vertices=40, multipolygon_ratio=0.1,
+                 events_per_calendar=None):
+        """
+        :param scale: Multiplier of BASE_COUNTS
+        :param seed: Random seed, the same seed always generates the same data
+        :param vertices: Average number of vertices of each polygon ring
+        :param multipolygon_ratio: Ratio of geometries being multipolygons
+        :param events_per_calendar: Number of events of each iCal feed
+        """
+        self.scale = scale
+        self.seed = seed
+        self.vertices = vertices
+        self.multipolygon_ratio = multipolygon_ratio
+        self.events_per_calendar = (
+            events_per_calendar or BASE_EVENTS_PER_CALENDAR
+        )
+        self.today = datetime.utcnow().date()
+        self.counts = {
+            source: count * scale for source, count in BASE_COUNTS.items()
+        }
+
+    def _random(self, source):
+        """Get a random generator seeded per source so the data of a source
+        does not depend on which other sources are generated
+
+        :param source: Source name
+        :returns: Random generator
+        :rtype: random.Random
+        """
+        return random.Random(f'{self.seed}-{source}')
+
+    def _ring(self, rng, center, radius):
+        """Generate a closed polygon ring around a center
+
+        :param rng: Random generator
+        :param center: Ring center
+        :param radius: Ring radius
+        :returns: Ring coordinates
+        :rtype: list
+        """
+        count = max(4, int(rng.gauss(self.vertices, self.vertices / 4)))
+        ring = []
+        for index in range(count):
+            angle = 2 * math.pi * index / count
+            distance = radius * rng.uniform(0.8, 1.2)
+            ring.append([
+                center[0] + distance * math.cos(angle),
+                center[1] + distance * math.sin(angle)
+            ])
+        ring.append(list(ring[0]))
+        return ring
+
+    def _geometry(self, rng, wkid, geojson=True):
+        """Generate a polygon or multipolygon geometry in a projected WKID
+
+        :param rng: Random generator
+        :param wkid: WKID of the coordinates, one of CENTERS
+        :param geojson: Whether to generate GeoJSON or Esri JSON geometry
+        :returns: Center and geometry object
+        :rtype: tuple
+        """
+        center_x, center_y = CENTERS[wkid]
+        center = (
+            center_x + rng.uniform(-8000, 8000),
+            center_y + rng.uniform(-8000, 8000)
+        )
+        radius = rng.uniform(40, 250)
+        polygons = [[self._ring(rng, center, radius)]]
+        if rng.random() < self.multipolygon_ratio:
+            satellite = (center[0] + radius * 3, center[1])
+            polygons.append([self._ring(rng, satellite, radius / 2)])
+
+        if not geojson:
+            return center, {
+                'rings': [ring for polygon in polygons for ring in polygon]
+            }
+        if len(polygons) == 1:
+            return center, {'type': 'Polygon', 'coordinates': polygons[0]}
+        return center, {'type': 'MultiPolygon', 'coordinates': polygons}
+
+    def facil_rows(self):
+        """Generate Banner facil rows
+
+        :returns: Facil rows keyed by building ID
+        :rtype: dict
+        """
+        rng = self._random('facil')
+        campuses = ['OSUCORVALLIS'] * 8 + ['CASCADESCAMPUS', 'HMSC', 'OTHER']
+        rows = {}
+        for index in range(self.counts['facil']):
+            bldg_id = get_bldg_id(index)
+            rows[bldg_id] = {
+                'id': bldg_id,
+                'abbreviation': f'B{index:04d}',
+                'name': f'Building {index}',
+                'campus': rng.choice(campuses),
+                'address1': f'{rng.randint(100, 3999)} SW Campus Way',
+                'address2': rng.choice([None, f'Suite {index}']),
+                'city': 'Corvallis',
+                'state': 'OR',
+                'zip': '97331'
+            }
+        return rows
+
+    def building_geometries(self):
+        """Generate ArcGIS building geometries in EPSG:2913 as pGeoJSON
+
+        :returns: Feature collection
+        :rtype: dict
+        """
+        rng = self._random('buildings')
+        features = []
+        for index in range(self.counts['buildings']):
+            center, geometry = self._geometry(rng, 2913)
+            features.append({
+                'type': 'Feature',
+                'id': index + 1,
+                'geometry': geometry,
+                'properties': {
+                    'OBJECTID': index + 1,
+                    'BldID': get_bldg_id(index),
+                    'BldNamAbr': f'B{index:04d}',
+                    'Cent_Lat': center[1],
+                    'Cent_Lon': center[0]
+                }
+            })
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def parking_geometries(self):
+        """Generate ArcGIS parking geometries in EPSG:2913 as pGeoJSON
+
+        :returns: Feature collection
+        :rtype: dict
+        """
+        rng = self._random('parkings')
+        zone_groups = ['A1', 'A2', 'B1', 'B2', 'C', 'Pay']
+        features = []
+        for index in range(self.counts['parkings']):
+            center, geometry = self._geometry(rng, 2913)
+            features.append({
+                'type': 'Feature',
+                'id': index + 1,
+                'geometry': geometry,
+                'properties': {
+                    'OBJECTID': index + 1,
+                    'Prop_ID': f'P{index:05d}',
+                    'ZoneGroup': rng.choice(zone_groups),
+                    'AiM_Desc': f'Parking Lot {index}',
+                    'ADA_Spc': rng.randint(0, 10),
+                    'MCycle_Spc': rng.randint(0, 5),
+                    'EV_Spc': rng.randint(0, 4),
+                    'Cent_Lat': center[1],
+                    'Cent_Lon': center[0]
+                }
+            })
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def fields(self):
+        """Generate ArcGIS field geometries in EPSG:3857 as Esri JSON
+
+        :returns: Feature set
+        :rtype: dict
+        """
+        rng = self._random('fields')
+        features = []
+        for index in range(self.counts['fields']):
+            _, geometry = self._geometry(rng, 3857, geojson=False)
+            features.append({
+                'attributes': {
+                    'OBJECTID': index + 1,
+                    'Prop_ID': f'F{index:05d}',
+                    'Expose': 'Y' if rng.random() < 0.9 else 'N',
+                    'Field_Nam': f'Field {index}',
+                    'Description': f'Grass field number {index}',
+                    'Notes': None,
+                    'Label_1': 'Intramural',
+                    'Label_2': None,
+                    'Steward': 'Recreational Sports',
+                    'Image': f'https://example.com/fields/{index}.jpg',
+                    'Shape__Area': rng.uniform(1000, 100000),
+                    'Shape__Length': rng.uniform(100, 2000),
+                    'Shape_Acres': rng.uniform(0.1, 5)
+                },
+                'geometry': geometry
+            })
+        return {
+            'geometryType': 'esriGeometryPolygon',
+            'spatialReference': {'wkid': 102100, 'latestWkid': 3857},
+            'features': features
+        }
+
+    def places(self):
+        """Generate ArcGIS places as Esri JSON
+
+        :returns: Feature set
+        :rtype: dict
+        """
+        rng = self._random('places')
+        features = []
+        for index in range(self.counts['places']):
+            features.append({
+                'attributes': {
+                    'OBJECTID': index + 1,
+                    'Prop_ID': f'PL{index:05d}',
+                    'uID': f'{index}',
+                    'Name': f'Place {index}',
+                    'Loca': f'{rng.randint(100, 3999)} SW Jefferson Way',
+                    'Desc_': f'Description of place {index}',
+                    'URL_Home': f'https://example.com/places/{index}',
+                    'Cent_Lat': CENTER_LON_LAT[1] + rng.uniform(-0.02, 0.02),
+                    'Cent_Lon': CENTER_LON_LAT[0] + rng.uniform(-0.02, 0.02)
+                }
+            })
+        return {'features': features}
+
+    def gender_inclusive_restrooms(self):
+        """Generate ArcGIS gender inclusive restroom features as Esri JSON
+
+        :returns: Feature set
+        :rtype: dict
+        """
+        rng = self._random('gender_inclusive_restrooms')
+        features = []
+        count = min(
+            self.counts['gender_inclusive_restrooms'],
+            self.counts['facil']
+        )
+        for index in rng.sample(range(self.counts['facil']), count):
+            features.append({
+                'attributes': {
+                    'OBJECTID': len(features) + 1,
+                    'BldID': get_bldg_id(index),
+                    'BldNamAbr': f'B{index:04d}',
+                    'CntAll': rng.randint(1, 6),
+                    'Limits': rng.choice(['', 'Staff only ']),
+                    'LocaAll': f'Room {rng.randint(100, 499)} '
+                }
+            })
+        return {'features': features}
+
+    def diners(self):
+        """Generate the UHDS calendar index
+
+        :returns: Raw diners
+        :rtype: list
+        """
+        rng = self._random('diners')
+        diners = []
+        for index in range(self.counts['diners']):
+            diners.append({
+                'concept_title': f'Diner {index}',
+                'calendar_id': get_calendar_id('uhds', index),
+                'concept_coord': (
+                    f'{CENTER_LON_LAT[1] + rng.uniform(-0.01, 0.01)}, '
+                    f'{CENTER_LON_LAT[0] + rng.uniform(-0.01, 0.01)}'
+                ),
+                'zone': rng.choice(
+                    ['Arnold', 'McNary', 'West', 'Marketplace']
+                ),
+                'loc_id': index,
+                'start': None,
+                'end': None,
+                'tags': []
+            })
+        return diners
+
+    def extra_data(self):
+        """Generate contrib/extra-data.yaml content. Every fourth extra
+        calendar reuses a UHDS calendar so shared calendars are covered.
+
+        :returns: Extra data
+        :rtype: dict
+        """
+        rng = self._random('extra_data')
+        locations = []
+        for index in range(self.counts['extra_locations']):
+            locations.append({
+                'name': f'Extra Location {index}',
+                'bldgID': f'X{index:04d}',
+                'campus': 'Corvallis',
+                'type': 'other',
+                'tags': ['extra'],
+                'longitude': CENTER_LON_LAT[0] + rng.uniform(-0.02, 0.02),
+                'latitude': CENTER_LON_LAT[1] + rng.uniform(-0.02, 0.02)
+            })
+
+        calendars = []
+        for index in range(self.counts['extra_calendars']):
+            if index % 4 == 0 and index < self.counts['diners']:
+                calendar_id = get_calendar_id('uhds', index)
+            else:
+                calendar_id = get_calendar_id('extra', index)
+            is_service = index % 2 == 0
+            calendars.append({
+                'id': f'Extra Calendar {index}',
+                'calendarId': calendar_id,
+                'tags': ['services'] if is_service else ['other'],
+                'parent': get_bldg_id(index % self.counts['facil']),
+                'merge': False
+            })
+
+        return {'locations': locations, 'calendars': calendars}
+
+    def calendar_ids(self):
+        """Get every distinct calendar ID being served
+
+        :returns: Calendar IDs
+        :rtype: list
+        """
+        calendar_ids = [diner['calendar_id'] for diner in self.diners()]
+        for calendar in self.extra_data()['calendars']:
+            if calendar['calendarId'] not in calendar_ids:
+                calendar_ids.append(calendar['calendarId'])
+        return calendar_ids
+
+    def ical(self, calendar_id):
+        """Generate an iCal feed with events spread around today
+
+        :param calendar_id: Calendar ID
+        :returns: iCal feed
+        :rtype: str
+        """
+        rng = self._random(f'ical-{calendar_id}')
+        start_day = datetime.combine(self.today, datetime.min.time())
+        lines = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//Synthetic//Locations Generator Benchmarks//EN',
+            f'X-WR-CALNAME:{calendar_id}'
+        ]
+        for index in range(self.events_per_calendar):
+            day = rng.randint(-60, 60)
+            hour = rng.randint(6, 20)
+            start = start_day + timedelta(days=day, hours=hour)
+            end = start + timedelta(hours=rng.randint(1, 4))
+            lines += [
+                'BEGIN:VEVENT',
+                f'DTSTART:{start.strftime("%Y%m%dT%H%M%SZ")}',
+                f'DTEND:{end.strftime("%Y%m%dT%H%M%SZ")}',
+                f'DTSTAMP:{start.strftime("%Y%m%dT%H%M%SZ")}',
+                f'UID:{index}-{calendar_id}',
+                f'SEQUENCE:{rng.randint(0, 3)}',
+                'SUMMARY:Open',
+                'END:VEVENT'
+            ]
+        lines.append('END:VCALENDAR')
+        return '\r\n'.join(lines) + '\r\n'
+
+    def library_hours(self):
+        """Generate the library hours API response for the coming week
+
+        :returns: Library hours
+        :rtype: dict
+        """
+        hours = {}
+        for day in range(7):
+            date = self.today + timedelta(days=day)
+            hours[str(day)] = {
+                'sortable_date': date.strftime('%Y-%m-%d'),
+                'open': '7:00am',
+                'close': '10:00pm' if day < 5 else '6:00pm'
+            }
+        return hours
+
+    def extension_xml(self):
+        """Generate the extension locations XML document
+
+        :returns: XML document
+        :rtype: str
+        """
+        rng = self._random('extensions')
+        items = []
+        for index in range(self.counts['extensions']):
+            fields = {
+                'GUID': f'{{{index:08d}-0000-0000-0000-000000000000}}',
+                'GroupName': f'Extension Office {index}',
+                'StreetAddress': f'{rng.randint(100, 3999)} Main St',
+                'City': 'Somewhere',
+                'State': 'OR',
+                'ZIPCode': f'97{rng.randint(100, 999)}',
+                'fax': '541-555-0100',
+                'tel': '541-555-0101',
+                'country': 'Benton',
+                'location_url': f'https://example.com/extension/{index}'
+            }
+            items.append('<item>' + ''.join(
+                f'<{tag}>{escape(value)}</{tag}>'
+                for tag, value in fields.items()
+            ) + '</item>')
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<items>{"".join(items)}</items>'
+        )
+
+    def campus_map(self):
+        """Generate the campus map data of every building
+
+        :returns: Campus map locations
+        :rtype: list
+        """
+        campus_map = []
+        for index in range(self.counts['facil']):
+            bldg_id = get_bldg_id(index)
+            campus_map.append({
+                'id': hashlib.md5(
+                    f'building{bldg_id}'.encode('utf-8')
+                ).hexdigest(),
+                'address': f'{index} SW Campus Way',
+                'description': f'Description of building {index}',
+                'descriptionHTML': f'<p>Description of building {index}</p>',
+                'images': [f'https://example.com/images/{bldg_id}.jpg'],
+                'thumbnail': [f'https://example.com/thumbs/{bldg_id}.jpg'],
+                'mapUrl': f'https://map.example.com/#!b{bldg_id}',
+                'synonyms': [f'Bldg {index}', f'B{index:04d}']
+            })
+        return campus_map
+
+    def payloads(self):
+        """Encode every static upstream response
+
+        :returns: Response bodies and content types keyed by route path
+        :rtype: dict
+        """
+        def _json(data):
+            return json.dumps(data).encode('utf-8'), 'application/json'
+
+        return {
+            ROUTES['genderInclusiveRR']: _json(
+                self.gender_inclusive_restrooms()
+            ),
+            ROUTES['buildingGeometries']: _json(self.building_geometries()),
+            ROUTES['parkingGeometries']: _json(self.parking_geometries()),
+            ROUTES['fields']: _json(self.fields()),
+            ROUTES['places']: _json(self.places()),
+            ROUTES['campusMap']: _json(self.campus_map()),
+            ROUTES['library']: _json(self.library_hours()),
+            ROUTES['uhdsCalendar']: _json(self.diners()),
+            ROUTES['extension']: (
+                self.extension_xml().encode('utf-8'),
+                'application/xml'
+            )
+        }
+
+    def write_contrib(self, folder):
+        """Write the contrib files the generator reads at start-up
+
+        :param folder: Contrib folder
+        """
+        with open(f'{folder}/extra-data.yaml', 'w') as file:
+            yaml.safe_dump(self.extra_data(), file)
+        with open(f'{folder}/get_facil_locations.sql', 'w') as file:
+            file.write('SELECT * FROM facil_locations')
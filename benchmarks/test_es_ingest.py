@@ -0,0 +1,96 @@
+import asyncio
+import tracemalloc
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def documents(generator, dataset):
+    """Build the resources of the dataset once, as they are published
+    """
+    extra_calendars = asyncio.run(generator.get_extra_calendars())
+    facil_locations = generator.merge_facil_locations(
+        dataset.facil_rows(),
+        generator.get_gender_inclusive_restrooms(),
+        generator.get_arcgis_geometries()
+    )
+    sources = {
+        'extension_locations': generator.get_extension_locations(),
+        'parking_locations': generator.get_parking_locations(),
+        'field_locations': generator.get_fields(),
+        'place_locations': generator.get_places()
+    }
+    locations = generator.merge_locations(
+        generator.concatenate_locations(
+            facil_locations,
+            sources,
+            asyncio.run(generator.get_dining_locations()),
+            generator.get_extra_locations(),
+            extra_calendars
+        ),
+        generator.get_campus_map_data(),
+        extra_calendars['services'],
+        generator.get_library_hours()
+    )
+    generator.set_geo_cells(locations)
+    resources, services, _ = generator.build_resources(
+        locations, extra_calendars['services']
+    )
+    return {'locations': resources, 'services': services}
+
+
+def _sync(es_config, documents):
+    from es_manager import ESManager
+
+    es_manager = ESManager(es_config)
+    for index, docs in documents.items():
+        es_manager.sync(index, docs)
+    return es_manager
+
+
+def _get_peak_allocations(function, *args):
+    """Run a function once under tracemalloc, outside of the timed rounds
+
+    :returns: Peak size of the Python allocations in bytes
+    :rtype: int
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('existing', [False, True], ids=['create', 'update'])
+def test_sync(run, benchmark, elasticsearch, es_config, documents, existing):
+    def _setup():
+        elasticsearch.reset()
+        if existing:
+            # Updates also scan the IDs of the indexed documents
+            _sync(es_config, documents)
+        return (es_config, documents), {}
+
+    es_manager = run(_sync, setup=_setup)
+
+    for index, docs in documents.items():
+        assert elasticsearch.count(index) == len({doc['id'] for doc in docs})
+
+    transfer_stats = es_manager.transfer_stats
+    number = sum(len(docs) for docs in documents.values())
+    _setup()
+    benchmark.extra_info.update({
+        'documents': number,
+        'body_bytes': transfer_stats.body_bytes,
+        'sent_bytes': transfer_stats.sent_bytes,
+        'tracemalloc_peak_bytes': _get_peak_allocations(
+            _sync, es_config, documents
+        )
+    })
+    if benchmark.stats:
+        mean = benchmark.stats.stats.mean
+        benchmark.extra_info.update({
+            'documents_per_second': round(number / mean),
+            'body_bytes_per_second': round(transfer_stats.body_bytes / mean),
+            'sent_bytes_per_second': round(transfer_stats.sent_bytes / mean)
+        })
@@ -0,0 +1,86 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import shutil
+import ssl
+import subprocess
+import threading
+
+import pytest
+
+from concurrency import AdaptiveFetcher, AIMDController
+
+
+class CalendarHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def https_server(tmp_path_factory):
+    """Serve the request paths over HTTPS with a self-signed certificate
+
+    :returns: Base URL and certificate file
+    :rtype: tuple
+    """
+    if not shutil.which('openssl'):
+        pytest.skip('openssl is required to create a certificate')
+    folder = tmp_path_factory.mktemp('https')
+    cert_file, key_file = str(folder / 'cert.pem'), str(folder / 'key.pem')
+    subprocess.run(
+        [
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-days', '1', '-subj', '/CN=127.0.0.1',
+            '-addext', 'subjectAltName=IP:127.0.0.1',
+            '-keyout', key_file, '-out', cert_file
+        ],
+        check=True,
+        capture_output=True
+    )
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CalendarHandler)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'https://127.0.0.1:{server.server_port}', cert_file
+    server.shutdown()
+    server.server_close()
+
+
+def test_map_https(https_server, monkeypatch):
+    base_url, cert_file = https_server
+    # The CA bundles of the environment take precedence over session.verify
+    for name in ['REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE']:
+        monkeypatch.delenv(name, raising=False)
+    fetcher = AdaptiveFetcher({'initialLimit': 2, 'maxRetries': 0})
+    fetcher.session.verify = cert_file
+
+    # More calendars than the initial limit of the host
+    urls = [f'{base_url}/cal/{index}' for index in range(10)]
+    responses = fetcher.map(urls)
+
+    assert [response.status_code for response in responses] == [200] * 10
+    assert [response.text for response in responses] == [
+        f'/cal/{index}' for index in range(10)
+    ]
+    host_record = fetcher.pop_stats()[f'127.0.0.1:{base_url.split(":")[-1]}']
+    assert host_record['requests'] == 10
+    assert host_record['failures'] == 0
+
+
+@pytest.mark.parametrize('config', [
+    {'minLimit': 0},
+    {'initialLimit': 0},
+    {'minLimit': 4, 'maxLimit': 2}
+])
+def test_invalid_limits(config):
+    with pytest.raises(ValueError):
+        AIMDController('127.0.0.1', config)
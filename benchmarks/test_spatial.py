@@ -0,0 +1,101 @@
+import math
+
+import pytest
+
+from locations.Locations import FacilLocation, PlaceLocation
+from spatial import STRtree, _min_distance
+
+# Unit boxes on a 10 x 10 grid, 3 units apart
+GRID = [
+    ((x * 3, y * 3, x * 3 + 1, y * 3 + 1), f'{x},{y}')
+    for x in range(10) for y in range(10)
+]
+
+
+def _building(bldg_id, bounds):
+    min_lon, min_lat, max_lon, max_lat = bounds
+    ring = [
+        [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat],
+        [min_lon, max_lat], [min_lon, min_lat]
+    ]
+    return FacilLocation(
+        {'id': bldg_id, 'name': f'Building {bldg_id}', 'campus': 'OTHER'},
+        None,
+        {
+            'longitude': (min_lon + max_lon) / 2,
+            'latitude': (min_lat + max_lat) / 2,
+            'coordinatesType': 'Polygon',
+            'coordinates': [ring]
+        },
+        lambda lon, lat, inverse: (lon, lat)
+    )
+
+
+def _place(uid, lon, lat):
+    return PlaceLocation({
+        'attributes': {
+            'Prop_ID': 'PL', 'uID': uid, 'Name': f'Place {uid}', 'Loca': None,
+            'URL_Home': None, 'Cent_Lat': lat, 'Cent_Lon': lon
+        }
+    })
+
+
+@pytest.mark.parametrize('bounds', [
+    (0, 0, 1, 1),
+    (2, 2, 7.5, 4),
+    (-5, -5, -1, -1),
+    (10.5, 0, 11.5, 30)
+])
+def test_strtree_query(bounds):
+    tree = STRtree(GRID, node_capacity=4)
+    expected = {
+        item for item_bounds, item in GRID
+        if item_bounds[0] <= bounds[2] and bounds[0] <= item_bounds[2]
+        and item_bounds[1] <= bounds[3] and bounds[1] <= item_bounds[3]
+    }
+    assert set(tree.query(bounds)) == expected
+
+
+@pytest.mark.parametrize('point', [(0.5, 0.5), (2, 2), (13.7, 20.1),
+                                   (-4, 14), (40, 40)])
+def test_strtree_nearest(point):
+    tree = STRtree(GRID, node_capacity=4)
+    expected = min(_min_distance(bounds, point) for bounds, _ in GRID)
+
+    item, distance = tree.nearest(point)
+    assert distance == pytest.approx(expected)
+    bounds_by_item = {item: bounds for bounds, item in GRID}
+    assert _min_distance(bounds_by_item[item], point) == distance
+
+
+def test_strtree_nearest_max_distance():
+    tree = STRtree(GRID)
+    assert tree.nearest((-3, 0), max_distance=2) == (None, None)
+    assert tree.nearest((-3, 0), max_distance=3)[1] == 3
+    assert STRtree([]).nearest((0, 0)) == (None, None)
+    assert STRtree([]).query((0, 0, 1, 1)) == []
+
+
+def test_link_buildings(generator, monkeypatch):
+    monkeypatch.setitem(generator.config, 'spatialJoin', {'maxDistance': 250})
+    # About 80 meters wide, 800 meters apart
+    west = _building('0001', (-123.2800, 44.5600, -123.2790, 44.5607))
+    east = _building('0002', (-123.2700, 44.5600, -123.2690, 44.5607))
+    inside = _place('1', -123.2795, 44.56035)
+    # 0.00045 degrees, about 50 meters north of the east building
+    near = _place('2', -123.2695, 44.56115)
+    # About a kilometer south of the west building
+    far = _place('3', -123.2795, 44.5510)
+
+    generator.link_buildings([west, east, inside, near, far])
+
+    link = inside.relationships['buildings']
+    assert link['data'][0]['id'] == west.calculate_hash_id()
+    assert link['meta'] == {'relation': 'within', 'distance': 0.0}
+
+    link = near.relationships['buildings']
+    assert link['data'][0]['id'] == east.calculate_hash_id()
+    assert link['meta']['relation'] == 'nearest'
+    assert math.isclose(link['meta']['distance'], 50, abs_tol=1)
+
+    assert 'buildings' not in far.relationships
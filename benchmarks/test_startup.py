@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that must only be imported by the stage using them
+HEAVY_MODULES = {
+    'build_and_publish': [
+        'cx_Oracle',
+        'elasticsearch',
+        'pyproj',
+        'tabulate'
+    ],
+    'build_artifacts': [
+        'cx_Oracle',
+        'icalendar',
+        'pyproj',
+        'tabulate'
+    ],
+    'es_manager': [
+        'elasticsearch',
+        'requests_aws4auth',
+        'tabulate'
+    ],
+    'watch_extra_data': [
+        'cx_Oracle',
+        'elasticsearch',
+        'pyproj',
+        'tabulate'
+    ]
+}
+
+
+def _run_python(*args):
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=REPO_FOLDER,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+
+def _get_import_time(module):
+    """Get the cumulative import time of a module in a cold interpreter
+
+    :param module: Module name
+    :returns: Cumulative import time in microseconds
+    :rtype: int
+    """
+    result = _run_python('-X', 'importtime', '-c', f'import {module}')
+    for line in result.stderr.splitlines():
+        # e.g. "import time:       120 |       3456 | build_artifacts"
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise AssertionError(f'No import time reported for {module}')
+
+
+@pytest.mark.parametrize('module', sorted(HEAVY_MODULES))
+def test_heavy_modules_not_imported(module):
+    result = _run_python(
+        '-c',
+        f'import sys, {module}; '
+        f'print(",".join(m for m in {HEAVY_MODULES[module]!r} '
+        'if m in sys.modules))'
+    )
+    assert result.stdout.strip() == ''
+
+
+@pytest.mark.parametrize('module', sorted(HEAVY_MODULES))
+def test_cold_start(benchmark, module):
+    benchmark.extra_info['importtime_us'] = _get_import_time(module)
+    benchmark.pedantic(_run_python, args=('-c', f'import {module}'), rounds=10)
@@ -0,0 +1,447 @@
+import asyncio
+import logging
+import multiprocessing
+import sqlite3
+
+import pytest
+import requests
+import yaml
+
+from arcgis_state import LayerState
+from fake_upstream import EDIT_DATE, ROUTES, FakeUpstream, write_facil_database
+from generators import get_calendar_id
+from projection_cache import ProjectionCache
+
+# Projected layers and the WKID of their coordinates
+PROJECTED_LAYERS = [
+    ('buildingGeometries', 2913),
+    ('parkingGeometries', 2913),
+    ('fields', 3857)
+]
+
+# Dataset counts of the features of the projected layers
+LAYER_COUNTS = {
+    'buildingGeometries': 'buildings',
+    'parkingGeometries': 'parkings',
+    'fields': 'fields'
+}
+
+
+def _arcgis_layer(generator, name):
+    config = generator.config['locations']['arcGIS']
+    return f"{config['url']}{config[name]['endpoint']}", config[name]['params']
+
+
+def test_gender_inclusive_restrooms(run, generator, dataset):
+    result = run(generator.get_gender_inclusive_restrooms)
+    assert len(result) == dataset.counts['gender_inclusive_restrooms']
+
+
+def test_arcgis_geometries(run, generator, dataset):
+    result = run(generator.get_arcgis_geometries)
+    assert len(result) == dataset.counts['buildings']
+
+
+def test_parking_locations(run, generator, dataset):
+    result = run(generator.get_parking_locations)
+    assert len(result) == dataset.counts['parkings']
+
+
+def test_fields(run, generator, dataset):
+    result = run(generator.get_fields)
+    # Only the exposed fields are published
+    assert len(result) == sum(
+        feature['attributes']['Expose'] == 'Y'
+        for feature in dataset.fields()['features']
+    )
+
+
+def test_places(run, generator, dataset):
+    result = run(generator.get_places)
+    assert len(result) == dataset.counts['places']
+
+
+def test_campus_map_data(run, generator, dataset):
+    result = run(generator.get_campus_map_data)
+    assert len(result) == dataset.counts['facil']
+
+
+def test_extension_locations(run, generator, dataset):
+    result = run(generator.get_extension_locations)
+    assert len(result) == dataset.counts['extensions']
+
+
+def test_extra_locations(run, generator, dataset):
+    result = run(generator.get_extra_locations)
+    assert len(result) == dataset.counts['extra_locations']
+
+
+def test_library_hours(run, generator, dataset):
+    result = run(generator.get_library_hours)
+    assert len(result) == len(dataset.library_hours())
+
+
+@pytest.mark.parametrize('layer, wkid', PROJECTED_LAYERS)
+def test_converted_coordinates(run, generator, dataset, layer, wkid):
+    url, params = _arcgis_layer(generator, layer)
+    proj = generator.proj_2913 if wkid == 2913 else generator.proj_3857
+
+    result = run(
+        lambda: list(generator.get_converted_coordinates(url, params, proj))
+    )
+    assert len(result) == dataset.counts[LAYER_COUNTS[layer]]
+
+
+@pytest.mark.parametrize('layer, wkid', PROJECTED_LAYERS)
+def test_converted_coordinates_cached(run, generator, layer, wkid, tmp_path):
+    url, params = _arcgis_layer(generator, layer)
+    proj = generator.proj_2913 if wkid == 2913 else generator.proj_3857
+
+    def _convert():
+        cache = ProjectionCache(str(tmp_path / layer), proj.srs)
+        return list(
+            generator.get_converted_coordinates(url, params, proj, cache)
+        )
+
+    # Every geometry is served from the cache filled by the first run
+    expected = _convert()
+    result = run(_convert)
+    assert result == expected
+
+
+@pytest.mark.parametrize('layer, wkid', PROJECTED_LAYERS)
+def test_converted_coordinates_paged(run, generator, upstream, monkeypatch,
+                                     layer, wkid):
+    url, params = _arcgis_layer(generator, layer)
+    proj = generator.proj_2913 if wkid == 2913 else generator.proj_3857
+    expected = list(generator.get_converted_coordinates(url, params, proj))
+
+    # Every page but the last one exceeds the transfer limit
+    monkeypatch.setattr(
+        upstream.upstream, 'max_record_count', len(expected) // 3 + 1
+    )
+    result = run(
+        lambda: list(generator.get_converted_coordinates(url, params, proj))
+    )
+    assert result == expected
+
+
+def test_location_open_hours(run, generator):
+    url = generator.config['locations']['ical']['url'].replace(
+        'calendar-id', get_calendar_id('uhds', 0)
+    )
+    response = requests.get(url)
+
+    result = run(generator.get_location_open_hours, response)
+    assert len(result.days) == 7
+
+
+def _clear_calendars(generator):
+    """Forget the calendars fetched by the previous round
+    """
+    def _setup():
+        generator.calendar_open_hours = {}
+    return _setup
+
+
+def test_dining_locations(run, generator, dataset):
+    result = run(
+        lambda: asyncio.run(generator.get_dining_locations()),
+        setup=_clear_calendars(generator)
+    )
+    assert len(result) == dataset.counts['diners']
+
+
+def test_extra_calendars(run, generator):
+    result = run(
+        lambda: asyncio.run(generator.get_extra_calendars()),
+        setup=_clear_calendars(generator)
+    )
+    assert result
+
+
+def test_facil_locations_delta(generator, dataset, monkeypatch, tmp_path,
+                               caplog):
+    database = str(tmp_path / 'banner.sqlite3')
+    write_facil_database(dataset, database)
+    monkeypatch.setitem(generator.config, 'database', {
+        'driver': 'sqlite',
+        'url': database,
+        'delta': {
+            'enabled': True,
+            'snapshot': str(tmp_path / 'facil-snapshot.json')
+        }
+    })
+    expected = generator.get_facil_locations()
+    assert len(expected) == len(dataset.facil_rows())
+
+    changed_id = next(iter(expected))
+    connection = sqlite3.connect(database)
+    with connection:
+        connection.execute(
+            "UPDATE facil_locations SET name = 'Renamed', "
+            "activity_date = '2019-02-01T00:00:00' WHERE id = ?",
+            [changed_id]
+        )
+    connection.close()
+    expected[changed_id]['name'] = 'Renamed'
+    expected[changed_id]['activity_date'] = '2019-02-01T00:00:00'
+
+    caplog.set_level(logging.INFO, logger='build_artifacts')
+    # Rows changed within the same second as the mark are fetched again
+    assert generator.get_facil_locations() == expected
+    assert generator.get_facil_locations() == expected
+    assert caplog.messages[-1] == '[FACIL] delta: 1 rows fetched'
+
+
+def test_facil_delta_query(generator, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        generator, 'facil_query', 'SELECT id "id" FROM facil_locations;\n'
+    )
+    # Quoted so Oracle keeps the lowercase alias of the facil query
+    assert generator.get_facil_delta_query('activity_date') == (
+        'SELECT * FROM (SELECT id "id" FROM facil_locations) facil '
+        'WHERE facil."activity_date" >= :since'
+    )
+    assert generator.get_facil_delta_query('odd"name').endswith(
+        'WHERE facil."odd""name" >= :since'
+    )
+
+    delta_query_file = tmp_path / 'get_facil_locations_delta.sql'
+    delta_query_file.write_text('SELECT 1 FROM dual WHERE :since IS NULL')
+    monkeypatch.setitem(
+        generator.config, 'contrib', {'facilDeltaQuery': str(delta_query_file)}
+    )
+    assert generator.get_facil_delta_query('activity_date') == (
+        'SELECT 1 FROM dual WHERE :since IS NULL'
+    )
+
+
+def test_facil_locations_delta_without_mark(generator, dataset, monkeypatch,
+                                            tmp_path, caplog):
+    database = str(tmp_path / 'banner.sqlite3')
+    write_facil_database(dataset, database)
+    connection = sqlite3.connect(database)
+    with connection:
+        connection.execute('UPDATE facil_locations SET activity_date = NULL')
+    connection.close()
+    monkeypatch.setitem(generator.config, 'database', {
+        'driver': 'sqlite',
+        'url': database,
+        'delta': {
+            'enabled': True,
+            'snapshot': str(tmp_path / 'facil-snapshot.json')
+        }
+    })
+
+    generator.get_facil_locations()
+    assert any(
+        record.levelno == logging.WARNING
+        and 'No activity_date in the fetched rows' in record.message
+        for record in caplog.records
+    )
+
+
+@pytest.fixture(scope='module')
+def raw_sources(generator, dataset):
+    """Fetch every source once so the merge benchmarks only measure merging
+    """
+    return {
+        'facil': dataset.facil_rows(),
+        'gender_inclusive_restrooms': (
+            generator.get_gender_inclusive_restrooms()
+        ),
+        'arcgis_geometries': generator.get_arcgis_geometries(),
+        'campus_map': generator.get_campus_map_data(),
+        'extra_calendars': asyncio.run(generator.get_extra_calendars()),
+        'dining': asyncio.run(generator.get_dining_locations()),
+        'library_hours': generator.get_library_hours()
+    }
+
+
+def _build_locations(generator, raw_sources):
+    locations = generator.merge_facil_locations(
+        raw_sources['facil'],
+        raw_sources['gender_inclusive_restrooms'],
+        raw_sources['arcgis_geometries']
+    )
+    locations += generator.get_extra_locations()
+    locations += generator.get_extension_locations()
+    locations += generator.get_parking_locations()
+    locations += generator.get_fields()
+    locations += generator.get_places()
+    locations += raw_sources['dining']
+    locations += raw_sources['extra_calendars']['locations']
+    return locations
+
+
+def test_merge_facil_locations(run, generator, raw_sources):
+    result = run(
+        generator.merge_facil_locations,
+        raw_sources['facil'],
+        raw_sources['gender_inclusive_restrooms'],
+        raw_sources['arcgis_geometries']
+    )
+    assert len(result) == len(raw_sources['facil'])
+
+
+def test_merge_locations(run, generator, raw_sources):
+    def _setup():
+        locations = _build_locations(generator, raw_sources)
+        return (
+            locations,
+            raw_sources['campus_map'],
+            raw_sources['extra_calendars']['services'],
+            raw_sources['library_hours']
+        ), {}
+
+    result = run(generator.merge_locations, setup=_setup)
+    assert result
+
+
+def test_build_resource(run, generator, raw_sources):
+    base_url = generator.config['locationsApi']['url']
+    locations = generator.merge_locations(
+        _build_locations(generator, raw_sources),
+        raw_sources['campus_map'],
+        raw_sources['extra_calendars']['services'],
+        raw_sources['library_hours']
+    )
+
+    result = run(lambda: [
+        location.build_resource(base_url) for location in locations
+    ])
+    assert len(result) == len(locations)
+
+
+def test_set_geo_cells(run, generator, raw_sources):
+    locations = _build_locations(generator, raw_sources)
+
+    run(generator.set_geo_cells, locations)
+    assert any(location.geo_cells for location in locations)
+
+
+def test_rebuild_extra_data_existing_parent(generator, dataset, monkeypatch,
+                                            tmp_path):
+    database = str(tmp_path / 'banner.sqlite3')
+    write_facil_database(dataset, database)
+    monkeypatch.setitem(
+        generator.config, 'database', {'driver': 'sqlite', 'url': database}
+    )
+    monkeypatch.setattr(generator, 'keep_state', True)
+    generator.generate_json_resources(write_files=False)
+
+    # Move a service to the building of another calendar
+    extra_data = dataset.extra_data()
+    calendars = extra_data['calendars']
+    service = next(
+        calendar for calendar in calendars if 'services' in calendar['tags']
+    )
+    service['parent'] = next(
+        calendar['parent'] for calendar in calendars
+        if calendar['parent'] != service['parent']
+    )
+    extra_data_file = tmp_path / 'extra-data.yaml'
+    with open(extra_data_file, 'w') as file:
+        yaml.safe_dump(extra_data, file)
+    monkeypatch.setattr(generator, 'extra_data_file', str(extra_data_file))
+
+    changes = generator.rebuild_extra_data(write_files=False)
+    changed_services, removed_services = changes['services']
+    changed_locations, removed_locations = changes['locations']
+    assert len(changed_services) == 1
+    assert not removed_services and not removed_locations
+
+    # Both the previous and the new building list the services they hold
+    parent = changed_services[0]['relationships']['location']['data'][0]
+    assert parent['id'] in [location['id'] for location in changed_locations]
+    assert len(changed_locations) == 2
+
+
+def test_worker_pool_stopped_on_failure(generator, monkeypatch):
+    import build_artifacts
+
+    monkeypatch.setattr(generator, 'workers', 1)
+    monkeypatch.setattr(
+        build_artifacts, 'SOURCE_STAGES', [('facil', 'get_missing_source')]
+    )
+    with pytest.raises(AttributeError):
+        generator.generate_json_resources(write_files=False)
+    assert not multiprocessing.active_children()
+
+
+def test_layer_features_delta(generator, dataset, upstream, monkeypatch,
+                              tmp_path, caplog):
+    # A fresh layer, as the features are edited and deleted
+    fake = FakeUpstream(dataset)
+    monkeypatch.setattr(upstream, 'upstream', fake)
+    monkeypatch.setitem(generator.config['locations']['arcGIS'], 'delta', {
+        'enabled': True,
+        'stateFolder': str(tmp_path)
+    })
+    queries = []
+    query_layer = fake._query_layer
+
+    def _query_layer(path, query):
+        queries.append(query)
+        return query_layer(path, query)
+
+    monkeypatch.setattr(fake, '_query_layer', _query_layer)
+    url, params = _arcgis_layer(generator, 'places')
+    path = ROUTES['places']
+
+    features = generator.get_layer_features('places', url, params)
+    assert len(features) == dataset.counts['places']
+
+    fake.edit_features(path, [1, 2], Name='Edited')
+    fake.delete_features(path, [3])
+    queries.clear()
+    caplog.set_level(logging.INFO, logger='build_artifacts')
+    features = generator.get_layer_features('places', url, params)
+
+    assert queries[0]['returnIdsOnly'] == ['true']
+    assert queries[1]['where'] == [
+        "(1=1) AND EditDate > TIMESTAMP '2019-01-01 00:00:00'"
+    ]
+    assert caplog.messages[-1] == '[ARCGIS] places delta: 2 edited, 1 deleted'
+    names = {
+        feature['attributes']['OBJECTID']: feature['attributes']['Name']
+        for feature in features
+    }
+    assert len(names) == dataset.counts['places'] - 1
+    assert 3 not in names
+    assert names[1] == names[2] == 'Edited'
+
+    state = LayerState(str(tmp_path / 'places.json'), 'OBJECTID', 'EditDate')
+    assert state.high_water_mark > EDIT_DATE
+    assert state.features == {
+        feature['attributes']['OBJECTID']: feature for feature in features
+    }
+
+
+def test_layer_features_delta_ids_error(generator, dataset, upstream,
+                                        monkeypatch, tmp_path, caplog):
+    fake = FakeUpstream(dataset)
+    monkeypatch.setattr(upstream, 'upstream', fake)
+    monkeypatch.setitem(generator.config['locations']['arcGIS'], 'delta', {
+        'enabled': True,
+        'stateFolder': str(tmp_path)
+    })
+    url, params = _arcgis_layer(generator, 'places')
+    generator.get_layer_features('places', url, params)
+
+    query_layer = fake._query_layer
+
+    def _query_layer(path, query):
+        if query.get('returnIdsOnly') == ['true']:
+            raise ValueError('Invalid query')
+        return query_layer(path, query)
+
+    monkeypatch.setattr(fake, '_query_layer', _query_layer)
+    # Answered with a 200 and an error object, the stored features are kept
+    features = generator.get_layer_features('places', url, params)
+    assert len(features) == dataset.counts['places']
+    assert 'unable to query the object IDs' in caplog.text
+
+    state = LayerState(str(tmp_path / 'places.json'), 'OBJECTID', 'EditDate')
+    assert len(state.features) == dataset.counts['places']
@@ -0,0 +1,45 @@
+"""
+Build the resources and publish them to Elasticsearch in a single process,
+indexing them in chunked bulk requests while the rest are being built
+instead of reading the build artifacts back in es_manager.py:
+
+    $ python build_and_publish.py --config=configuration.yaml
+"""
+import logging
+
+from build_artifacts import LocationsGenerator
+from es_manager import BulkPublisher, ESManager
+import utils
+
+
+def build_and_publish(locations_generator, config, write_files=True):
+    """Build the resources and publish them as they are built
+
+    :param locations_generator: LocationsGenerator instance
+    :param config: Path to the config file
+    :param write_files: Whether to also write the build artifacts
+    """
+    es_manager = ESManager(
+        config,
+        locations_generator.profiler,
+        locations_generator.tracer
+    )
+    publisher = BulkPublisher(es_manager)
+    locations_generator.generate_json_resources(publisher, write_files)
+
+
+if __name__ == '__main__':
+    arguments = utils.parse_arguments(generator=True, publisher=True)
+
+    # Setup logging level
+    logging.basicConfig(
+        level=(logging.DEBUG if arguments.debug else logging.INFO)
+    )
+
+    locations_generator = LocationsGenerator(arguments)
+    locations_generator.profiler.run(
+        build_and_publish,
+        locations_generator,
+        arguments.config,
+        not arguments.skip_files
+    )
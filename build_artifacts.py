@@ -1,18 +1,23 @@
-import asyncio
 from collections import defaultdict
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from copy import copy
+from datetime import datetime
+from functools import cached_property
 import json
 import logging
+import multiprocessing
 import os
+import re
+import shutil
+import sqlite3
 import xml.etree.ElementTree as et
 
-from cx_Oracle import connect
-import grequests
-from icalendar import Calendar
-from pyproj import Proj
-import requests
-from tabulate import tabulate
+import ijson
 
+from arcgis_state import LayerState
+from artifacts import write_artifact
+from concurrency import AdaptiveFetcher
+from facil_snapshot import FacilSnapshot
 from locations.Locations import (
     ExtensionLocation,
     ExtraLocation,
@@ -22,40 +27,207 @@ from locations.Locations import (
     PlaceLocation,
     ServiceLocation
 )
+from geocells import GeoCells
+from geometry import (
+    contains_point,
+    get_bounds,
+    get_center,
+    get_distance,
+    get_encoded_size,
+    GeometrySimplifier,
+    LocalProjection
+)
+from metrics import Metrics
+from open_hours import OpenHours, WeekDays
+from open_intervals import OpenIntervalIndex
+from profiling import Profiler
+from projection_cache import ProjectionCache
+from spatial import STRtree
+from suggestions import Suggestions
+from tracing import TracedSession, Tracer
 import utils
 
 
+logger = logging.getLogger(__name__)
+
+# Sources of the locations linked to the building they sit in or next to
+BUILDING_LINKED_SOURCES = [
+    'parking-location',
+    'field-location',
+    'place-location'
+]
+
+# Sources fetched and transformed independently of each other, as
+# (stage name, LocationsGenerator method) pairs in the order they are combined
+SOURCE_STAGES = [
+    ('facil', 'get_facil_locations'),
+    ('gender_inclusive_restrooms', 'get_gender_inclusive_restrooms'),
+    ('arcgis_geometries', 'get_arcgis_geometries'),
+    ('extension_locations', 'get_extension_locations'),
+    ('parking_locations', 'get_parking_locations'),
+    ('field_locations', 'get_fields'),
+    ('place_locations', 'get_places')
+]
+
+# Set by ArcGIS in a query result when more features match than a page holds,
+# at the top level or in the GeoJSON properties. Quotes are escaped within
+# strings, so only the key matches.
+TRANSFER_LIMIT_EXCEEDED = re.compile(rb'"exceededTransferLimit"\s*:\s*true')
+
+# Generator of a worker process, created by the pool initializer
+_worker_generator = None
+
+
+def _init_worker(arguments, today):
+    """Initialize a worker process of the transformation pool
+
+    :param arguments: Parsed arguments of the main process
+    :param today: Date of the run in the main process
+    """
+    global _worker_generator
+
+    logging.basicConfig(
+        level=(logging.DEBUG if arguments.debug else logging.INFO)
+    )
+
+    # Profiles are only collected by the main process
+    arguments = copy(arguments)
+    arguments.profile = None
+    _worker_generator = LocationsGenerator(arguments)
+    _worker_generator.today = today
+
+
+def _run_source(stage, method):
+    """Fetch and transform a source in a worker process
+
+    :param stage: Stage name
+    :param method: LocationsGenerator method getting the source
+    :returns: Source data, the metrics record of the stage, the records of
+              the hosts fetched from and the spans of the requests
+    :rtype: tuple
+    """
+    metrics = _worker_generator.metrics
+    tracer = _worker_generator.tracer
+    with metrics.stage(stage):
+        result = getattr(_worker_generator, method)()
+    hosts = _worker_generator.fetcher.pop_stats()
+    spans = tracer.pop_spans() if tracer else []
+    return result, metrics.stages.pop(stage), hosts, spans
+
+
+def _get_resource_hashes(resources):
+    """Helper function to hash the content of the resources, which the
+    next builds reuse and modify the objects of
+
+    :param resources: Resources
+    :returns: Content hashes keyed by resource ID
+    :rtype: dict
+    """
+    return {
+        resource['id']: utils.get_md5_hash(
+            json.dumps(resource, sort_keys=True)
+        )
+        for resource in resources
+    }
+
+
 class LocationsGenerator:
-    def __init__(self, arguments):
+    def __init__(self, arguments, keep_state=False):
+        """
+        :param arguments: Parsed arguments
+        :param keep_state: Keep the sources and resource hashes of the full
+                           builds, so rebuild_extra_data can reuse them
+        """
         self.today = datetime.utcnow().date()
+        self.arguments = arguments
+        self.workers = arguments.workers
+        self.profiler = Profiler.from_arguments(arguments, 'build_artifacts')
         self.config = utils.load_yaml(arguments.config)
-        self.extra_data = utils.load_yaml('contrib/extra-data.yaml')
-        self.facil_query = utils.load_file('contrib/get_facil_locations.sql')
+        self.metrics = self.create_metrics()
+        contrib = self.config.get('contrib', {})
+        self.extra_data_file = contrib.get(
+            'extraData', 'contrib/extra-data.yaml'
+        )
+        self.extra_data = utils.load_yaml(self.extra_data_file)
+        self.facil_query = utils.load_file(
+            contrib.get('facilQuery', 'contrib/get_facil_locations.sql')
+        )
+        geometry_config = self.config['locations']['arcGIS'].get('geometry')
+        self.geometry_simplifier = None
+        self.keep_full_geometry = False
+        if geometry_config:
+            self.geometry_simplifier = GeometrySimplifier(geometry_config)
+            self.keep_full_geometry = geometry_config.get(
+                'keepFullResolution', False
+            )
+        # Open hours of the calendars fetched in this run, keyed by URL
+        self.calendar_open_hours = {}
+        # Spans of the upstream requests, None if tracing is disabled
+        self.tracer = Tracer.from_config(self.config, 'build_artifacts')
+        self.session = TracedSession(self.tracer)
+        # Retries and per-host concurrency of the iCal and ArcGIS requests
+        self.fetcher = AdaptiveFetcher(
+            self.config.get('concurrency', {}),
+            self.tracer
+        )
+        # Sources and resources of the last full build, to rebuild the extra
+        # data alone. Only kept in watch mode, as hashing every resource and
+        # holding on to the sources is wasted on a single build.
+        self.keep_state = keep_state
+        self.last_build = None
+
+    def create_metrics(self):
+        """Create the metrics of a run
+
+        :returns: Metrics instance
+        :rtype: Metrics
+        """
+        return Metrics.from_config(
+            self.config,
+            trace_memory=self.arguments.trace_memory,
+            profiler=self.profiler
+        )
+
+    @cached_property
+    def week_days(self):
+        # Date keys of the open hours, shared by every location of the run
+        return WeekDays(self.today)
+
+    @cached_property
+    def proj_2913(self):
         # NAD_1983_HARN_StatePlane_Oregon_North_FIPS_3601_Feet_Intl WKID: 2913
-        self.proj_2913 = Proj(('+proj=lcc '
-                               '+lat_0=43.66666666666666 '
-                               '+lat_1=46 '
-                               '+lat_2=44.33333333333334 '
-                               '+lon_0=-120.5 '
-                               '+x_0=2500000.0001424 '
-                               '+y_0=0 '
-                               '+ellps=GRS80 '
-                               '+towgs84=0,0,0,0,0,0,0 '
-                               '+units=ft '
-                               '+no_defs'))
+        # pyproj is slow to import, so it's only loaded on first use
+        from pyproj import Proj
+
+        return Proj(('+proj=lcc '
+                     '+lat_0=43.66666666666666 '
+                     '+lat_1=46 '
+                     '+lat_2=44.33333333333334 '
+                     '+lon_0=-120.5 '
+                     '+x_0=2500000.0001424 '
+                     '+y_0=0 '
+                     '+ellps=GRS80 '
+                     '+towgs84=0,0,0,0,0,0,0 '
+                     '+units=ft '
+                     '+no_defs'))
+
+    @cached_property
+    def proj_3857(self):
         # WGS_1984_Web_Mercator_Auxiliary_Sphere WKID: 3857
-        self.proj_3857 = Proj(('+proj=merc '
-                               '+a=6378137 '
-                               '+b=6378137 '
-                               '+lat_ts=0.0 '
-                               '+lon_0=0.0 '
-                               '+x_0=0.0 '
-                               '+y_0=0 '
-                               '+k=1.0 '
-                               '+units=ft '
-                               '+nadgrids=@null '
-                               '+wktext '
-                               '+no_defs'))
+        from pyproj import Proj
+
+        return Proj(('+proj=merc '
+                     '+a=6378137 '
+                     '+b=6378137 '
+                     '+lat_ts=0.0 '
+                     '+lon_0=0.0 '
+                     '+x_0=0.0 '
+                     '+y_0=0 '
+                     '+k=1.0 '
+                     '+units=ft '
+                     '+nadgrids=@null '
+                     '+wktext '
+                     '+no_defs'))
 
     def get_gender_inclusive_restrooms(self):
         """Get gender inclusive restrooms data via arcGIS API
@@ -67,19 +239,19 @@ class LocationsGenerator:
         url = f"{config['url']}{config['genderInclusiveRR']['endpoint']}"
         params = config['genderInclusiveRR']['params']
 
-        response = requests.get(url, params=params)
         gender_inclusive_restrooms = {}
 
-        if response.status_code == 200:
-            for feature in response.json()['features']:
-                attributes = feature['attributes']
-
-                gender_inclusive_restrooms[attributes['BldID']] = {
-                    'abbreviation': attributes.get('BldNamAbr'),
-                    'count': attributes.get('CntAll'),
-                    'limit': attributes.get('Limits'),
-                    'all': attributes.get('LocaAll')
-                }
+        for feature in self.get_layer_features(
+            'genderInclusiveRR', url, params
+        ):
+            attributes = feature['attributes']
+
+            gender_inclusive_restrooms[attributes['BldID']] = {
+                'abbreviation': attributes.get('BldNamAbr'),
+                'count': attributes.get('CntAll'),
+                'limit': attributes.get('Limits'),
+                'all': attributes.get('LocaAll')
+            }
 
         return gender_inclusive_restrooms
 
@@ -92,14 +264,13 @@ class LocationsGenerator:
         config = self.config['locations']['arcGIS']
         url = f"{config['url']}{config['fields']['endpoint']}"
         params = config['fields']['params']
-        field_coordinates = self.get_converted_coordinates(
-            url, params, self.proj_3857
-        )
 
         field_locations = []
         ignored_fields = []
 
-        for feature in field_coordinates['features']:
+        for feature in self.get_layer_features(
+            'fields', url, params, self.proj_3857
+        ):
             attrs = feature['attributes']
             # Only fetch the location has a valid Prop_ID and Expose is 'Y'
             if (
@@ -128,30 +299,28 @@ class LocationsGenerator:
         config = self.config['locations']['arcGIS']
         url = f"{config['url']}{config['places']['endpoint']}"
         params = config['fields']['params']
-        response = requests.get(url, params=params)
 
         place_locations = []
         ignored_places = []
 
-        if response.status_code == 200:
-            for feature in response.json()['features']:
-                attrs = feature['attributes']
-                # Only fetch the location if Prop_ID and uID are valid
-                if (
-                    utils.is_valid_field(attrs['Prop_ID'])
-                    and utils.is_valid_field(attrs['uID'])
-                ):
-                    place_location = PlaceLocation(feature)
-                    place_locations.append(place_location)
-                else:
-                    place_locations.append(attrs['OBJECTID'])
+        for feature in self.get_layer_features('places', url, params):
+            attrs = feature['attributes']
+            # Only fetch the location if Prop_ID and uID are valid
+            if (
+                utils.is_valid_field(attrs['Prop_ID'])
+                and utils.is_valid_field(attrs['uID'])
+            ):
+                place_location = PlaceLocation(feature)
+                place_locations.append(place_location)
+            else:
+                place_locations.append(attrs['OBJECTID'])
 
-            if ignored_places:
-                logger.warning((
-                    "These places OBJECTID's were ignored because they don't "
-                    "have a valid Prop_ID or shouldn't be exposed: "
-                    f"{ignored_places}\n"
-                ))
+        if ignored_places:
+            logger.warning((
+                "These places OBJECTID's were ignored because they don't "
+                "have a valid Prop_ID or shouldn't be exposed: "
+                f"{ignored_places}\n"
+            ))
 
         return place_locations
 
@@ -164,13 +333,12 @@ class LocationsGenerator:
         config = self.config['locations']['arcGIS']
         url = f"{config['url']}{config['buildingGeometries']['endpoint']}"
         params = config['buildingGeometries']['params']
-        buildings_coordinates = self.get_converted_coordinates(
-            url, params, self.proj_2913
-        )
 
         arcgis_coordinates = {}
 
-        for feature in buildings_coordinates['features']:
+        for feature in self.get_layer_features(
+            'buildingGeometries', url, params, self.proj_2913
+        ):
             prop = feature['properties']
 
             arcgis_location = {
@@ -185,6 +353,9 @@ class LocationsGenerator:
                 geometry = feature['geometry']
                 arcgis_location['coordinates'] = geometry.get('coordinates')
                 arcgis_location['coordinatesType'] = geometry.get('type')
+                arcgis_location['fullCoordinates'] = geometry.get(
+                    'fullCoordinates'
+                )
 
             arcgis_coordinates[prop['BldID']] = arcgis_location
 
@@ -200,14 +371,13 @@ class LocationsGenerator:
         config = self.config['locations']['arcGIS']
         url = f"{config['url']}{config['parkingGeometries']['endpoint']}"
         params = config['parkingGeometries']['params']
-        parkings_coordinates = self.get_converted_coordinates(
-            url, params, self.proj_2913
-        )
 
         parking_locations = []
         ignored_parkings = []
 
-        for feature in parkings_coordinates['features']:
+        for feature in self.get_layer_features(
+            'parkingGeometries', url, params, self.proj_2913
+        ):
             props = feature['properties']
             # Only fetch the location if Prop_ID and ZoneGroup are valid
             if (
@@ -234,22 +404,90 @@ class LocationsGenerator:
         :rtype: dict
         """
         config = self.config['database']
-        connection = connect(config['user'], config['password'], config['url'])
+        if config.get('driver') == 'sqlite':
+            # Local stand-in of Banner for offline runs and load tests
+            connection = sqlite3.connect(config['url'])
+        else:
+            from cx_Oracle import connect
+
+            connection = connect(
+                config['user'], config['password'], config['url']
+            )
         cursor = connection.cursor()
 
-        cursor.execute(self.facil_query)
+        # Only fetch the rows changed since the last run in delta mode, with
+        # a full refresh on schedule
+        delta_config = config.get('delta', {})
+        snapshot = None
+        full_refresh = True
+        if delta_config.get('enabled'):
+            snapshot = FacilSnapshot(
+                delta_config.get('snapshot', 'build/facil-snapshot.json'),
+                delta_config.get('highWaterMarkColumn', 'activity_date')
+            )
+            full_refresh = snapshot.needs_full_refresh(
+                delta_config.get('fullRefreshHours', 24)
+            )
+
+        if full_refresh:
+            cursor.execute(self.facil_query)
+        else:
+            cursor.execute(
+                self.get_facil_delta_query(snapshot.column),
+                {'since': snapshot.high_water_mark}
+            )
 
         col_names = [row[0] for row in cursor.description]
         facil_locations = {}
 
         for row in cursor:
+            self.metrics.increment('features_processed')
             facil_location = {}
             for index, col_name in enumerate(col_names):
                 facil_location[col_name] = row[index]
             facil_locations[facil_location['id']] = facil_location
+        connection.close()
+
+        if snapshot:
+            logger.info(
+                f"[FACIL] {'full refresh' if full_refresh else 'delta'}: "
+                f'{len(facil_locations)} rows fetched'
+            )
+            facil_locations = snapshot.update(facil_locations, full_refresh)
+            if snapshot.high_water_mark is None:
+                logger.warning(
+                    f'[FACIL] No {snapshot.column} in the fetched rows, the '
+                    'next run will be a full refresh again. Select the '
+                    'column in the facil query to fetch the changed rows only.'
+                )
+            snapshot.save()
 
         return facil_locations
 
+    def get_facil_delta_query(self, column):
+        """Get the query of the facil rows changed since the :since bind
+        variable, contrib.facilDeltaQuery if set, otherwise the facil query
+        filtered on the high-water mark column
+
+        :param column: High-water mark column selected by the facil query,
+                       named as in the cursor description
+        :returns: Delta query
+        :rtype: str
+        """
+        contrib = self.config.get('contrib', {})
+        if contrib.get('facilDeltaQuery'):
+            return utils.load_file(contrib['facilDeltaQuery'])
+
+        # Quoted since the rows are keyed by the lowercase aliases of the
+        # facil query, which Oracle would uppercase otherwise. >= so rows
+        # changed within the same second as the mark are not missed.
+        facil_query = self.facil_query.strip().rstrip(';')
+        quoted_column = column.replace('"', '""')
+        return (
+            f'SELECT * FROM ({facil_query}) facil '
+            f'WHERE facil."{quoted_column}" >= :since'
+        )
+
     def get_campus_map_data(self):
         """Get campus map data by parsing JSON file
 
@@ -258,11 +496,10 @@ class LocationsGenerator:
         """
         config = self.config['locations']['campusMap']
 
-        response = requests.get(config['url'])
         campus_map_data = {}
 
-        if response.status_code == 200:
-            for location in response.json():
+        with self.session.get(config['url'], stream=True) as response:
+            for location in self.get_json_items(response, 'item'):
                 campus_map_data[location['id']] = location
 
         return campus_map_data
@@ -275,21 +512,63 @@ class LocationsGenerator:
         """
         config = self.config['locations']['extension']
 
-        response = requests.get(config['url'])
         extension_data = []
 
-        if response.status_code == 200:
-            root = et.fromstring(response.content)
-
-            for item in root:
+        with self.session.get(config['url'], stream=True) as response:
+            if response.status_code != 200:
+                self.metrics.increment('bytes_fetched', len(response.content))
+                return extension_data
+
+            reader = utils.ResponseReader(response)
+            events = et.iterparse(reader, events=('start', 'end'))
+            _, root = next(events)
+            depth = 1
+
+            for event, item in events:
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+                # Only handle complete children of the root element
+                if depth != 1:
+                    continue
+
+                self.metrics.increment('features_processed')
                 raw_data = {}
                 for attribute in item:
                     raw_data[attribute.tag] = attribute.text
                 extension_location = ExtensionLocation(raw_data)
                 extension_data.append(extension_location)
 
+                # Drop the parsed items so the tree never grows
+                root.clear()
+
+            self.metrics.increment('bytes_fetched', reader.bytes_read)
+
         return extension_data
 
+    def get_json_items(self, response, prefix, reader=None):
+        """Parse the items of a streamed JSON response one at a time
+
+        :param response: Response requested with stream=True
+        :param prefix: ijson prefix of the items, e.g. features.item
+        :param reader: ResponseReader of the response, to inspect it once
+                       parsed
+        :returns: Parsed items, nothing if the request failed
+        :rtype: generator
+        """
+        if response.status_code != 200:
+            self.metrics.increment('bytes_fetched', len(response.content))
+            return
+
+        reader = reader or utils.ResponseReader(response)
+        try:
+            for item in ijson.items(reader, prefix, use_float=True):
+                self.metrics.increment('features_processed')
+                yield item
+        finally:
+            self.metrics.increment('bytes_fetched', reader.bytes_read)
+
     async def get_dining_locations(self):
         """An async function to get dining locations via UHDS
 
@@ -300,7 +579,8 @@ class LocationsGenerator:
         calendar_url = f"{config['url']}/{config['calendar']}"
         week_menu_url = f"{config['url']}/{config['weeklyMenu']}"
 
-        response = requests.get(calendar_url)
+        response = self.session.get(calendar_url)
+        self.metrics.increment('bytes_fetched', len(response.content))
         diners_data = {}
 
         if response.status_code == 200:
@@ -317,18 +597,11 @@ class LocationsGenerator:
                     calendar_ids.append(calendar_id)
                     diners_data[calendar_id] = diner
 
-            # Create a set of unsent asynchronous requests
-            diners_hours_responses = []
+            calendars_open_hours = self.get_calendars_open_hours(
+                calendar_ids
+            )
             for calendar_id in calendar_ids:
-                url = utils.get_calendar_url(calendar_id)
-                diners_hours_responses.append(grequests.get(url))
-
-            # Send requests all at once
-            for calendar_id, response in zip(
-                calendar_ids,
-                grequests.map(diners_hours_responses)
-            ):
-                open_hours = self.get_location_open_hours(response)
+                open_hours = calendars_open_hours[calendar_id]
                 diners_data[calendar_id].open_hours = open_hours
 
             return list(diners_data.values())
@@ -342,6 +615,7 @@ class LocationsGenerator:
         extra_locations = []
 
         for raw_location in self.extra_data['locations']:
+            self.metrics.increment('features_processed')
             extra_location = ExtraLocation(raw_location)
             extra_locations.append(extra_location)
 
@@ -371,19 +645,9 @@ class LocationsGenerator:
                 calendar_ids.append(calendar_id)
                 data[calendar_id] = service_location
 
-        # Create a set of unsent asynchronous requests
-        service_locations_hours_responses = []
+        calendars_open_hours = self.get_calendars_open_hours(calendar_ids)
         for calendar_id in calendar_ids:
-            url = utils.get_calendar_url(calendar_id)
-            service_locations_hours_responses.append(grequests.get(url))
-
-        # Send requests all at once
-        for calendar_id, response in zip(
-            calendar_ids,
-            grequests.map(service_locations_hours_responses)
-        ):
-            open_hours = self.get_location_open_hours(response)
-            data[calendar_id].open_hours = open_hours
+            data[calendar_id].open_hours = calendars_open_hours[calendar_id]
 
         for item in data.values():
             if item.type == 'services':
@@ -393,44 +657,82 @@ class LocationsGenerator:
 
         return extra_data
 
+    def get_calendars_open_hours(self, calendar_ids):
+        """Get the open hours of calendars, fetching each distinct calendar
+        only once per run and sharing the parsed result
+
+        :param calendar_ids: Calendar IDs
+        :returns: Open hours keyed by calendar ID
+        :rtype: dict
+        """
+        ical_url = self.config['locations']['ical']['url']
+        urls = {
+            calendar_id: utils.get_calendar_url(ical_url, calendar_id)
+            for calendar_id in calendar_ids
+        }
+        missing_urls = [
+            url for url in dict.fromkeys(urls.values())
+            if url not in self.calendar_open_hours
+        ]
+
+        # Send the requests of the calendars not fetched yet concurrently, as
+        # many at once as the calendar host keeps up with
+        for url, response in zip(
+            missing_urls,
+            self.fetcher.map(missing_urls)
+        ):
+            self.calendar_open_hours[url] = self.get_location_open_hours(
+                response
+            )
+
+        return {
+            calendar_id: self.calendar_open_hours[url]
+            for calendar_id, url in urls.items()
+        }
+
     def get_location_open_hours(self, response):
         """Get location open hour by parsing iCalendar files
 
         :returns: Locations open hours
-        :rtype: dict
+        :rtype: OpenHours
         """
-        open_hours = {}
-
         # Only fetch the events within a week
-        for day in range(7):
-            week_day = self.today + timedelta(days=day)
-            open_hours[utils.to_date(week_day)] = []
-
-        if response.status_code == 200:
-            calendar = Calendar.from_ical(response.text)
-
-            for event in calendar.walk():
-                if event.name == 'VEVENT':
-                    utc_start = utils.to_utc(event.get('dtstart').dt)
-                    event_day = utils.to_date(utc_start)
-                    if event_day in open_hours:
-                        event_hours = {
-                            'summary': str(event.get('summary')),
-                            'uid': str(event.get('uid')),
-                            'start': utils.to_utc_string(utc_start),
-                            'end': utils.to_utc_string(event.get('dtend').dt),
-                            'sequence': event.get('sequence'),
-                            'recurrenceId': event.get('recurrenceId'),
-                            'lastModified': event.get('lastModified')
-                        }
-                        open_hours[event_day].append(event_hours)
+        open_hours = OpenHours(self.week_days)
+
+        if response is not None and response.status_code == 200:
+            self.metrics.increment('bytes_fetched', len(response.content))
+            self.metrics.increment('features_processed')
+
+            from icalendar import Calendar
+
+            with self.profiler.stage('open_hours'):
+                calendar = Calendar.from_ical(response.text)
+
+                for event in calendar.walk():
+                    if event.name == 'VEVENT':
+                        sequence = event.get('sequence')
+                        open_hours.add_event(
+                            utils.to_utc(event.get('dtstart').dt),
+                            event.get('dtend').dt,
+                            str(event.get('summary')),
+                            str(event.get('uid')),
+                            None if sequence is None else int(sequence),
+                            event.get('recurrenceId'),
+                            event.get('lastModified')
+                        )
             return open_hours
 
-    def get_converted_coordinates(self, url, params, proj):
-        """Convert ArcGIS coordinates to latitude and longitude
-
-        :returns: Convert ArcGIS coordinates
-        :rtype: dict
+    def get_converted_coordinates(self, url, params, proj, cache=None):
+        """Stream ArcGIS features with their coordinates converted to latitude
+        and longitude
+
+        :param url: ArcGIS query URL
+        :param params: Query parameters
+        :param proj: PROJ object of the source coordinates
+        :param cache: ProjectionCache of the converted coordinates, saved once
+                      every feature is streamed
+        :returns: Converted features, one at a time
+        :rtype: generator
         """
         def _convert_polygon(polygon):
             """The helper function to convert a polygon location
@@ -454,37 +756,230 @@ class LocationsGenerator:
                 coordinates.append(pairs)
             return coordinates
 
-        response = requests.get(url, params=params)
+        def _convert_geometry(feature):
+            """The helper function to convert the geometry of a feature
 
-        if response.status_code == 200:
-            response_json = response.json()
+            :param feature: Feature to be converted
+            :returns: Converted coordinates
+            :rtype: list
+            """
+            geometry = feature['geometry']
+            coordinates = []
+
+            if 'type' in geometry:
+                geometry_type = geometry['type']
+
+                if geometry_type == 'Polygon':
+                    coordinates = _convert_polygon(geometry['coordinates'])
+                elif geometry_type == 'MultiPolygon':
+                    for polygon in geometry['coordinates']:
+                        coordinates.append(_convert_polygon(polygon))
+                else:
+                    logger.warning((
+                        'Ignoring unknown geometry type: '
+                        f'{geometry_type}. (id: {feature["id"]})'
+                    ))
+            elif 'rings' in geometry:
+                coordinates = _convert_polygon(geometry['rings'])
+                feature['geometry']['type'] = 'rings'
+            return coordinates
 
-            for feature in response_json['features']:
+        def _get_cached_coordinates(feature):
+            """The helper function to get the converted coordinates of a
+            feature from the cache, converting them on a miss
+
+            :param feature: Feature to be converted
+            :returns: Converted coordinates
+            :rtype: list
+            """
+            geometry = feature['geometry']
+            geometry_type = geometry.get('type')
+            if geometry_type in ('Polygon', 'MultiPolygon'):
+                raw_coordinates = geometry['coordinates']
+            elif geometry_type is None and 'rings' in geometry:
+                geometry_type, raw_coordinates = 'rings', geometry['rings']
+            else:
+                return _convert_geometry(feature)
+
+            key = cache.get_key(geometry_type, raw_coordinates)
+            if key is None:
+                return _convert_geometry(feature)
+            coordinates = cache.get(key)
+            if coordinates is None:
+                coordinates = _convert_geometry(feature)
+                cache.put(key, coordinates)
+            else:
+                geometry['type'] = geometry_type
+            return coordinates
+
+        for feature in self.get_layer_items(url, params, True):
+            with self.profiler.stage('converted_coordinates'):
                 geometry = feature['geometry']
                 if geometry:
-                    coordinates = []
-
-                    if 'type' in geometry:
-                        geometry_type = geometry['type']
-
-                        if geometry_type == 'Polygon':
-                            coordinates = _convert_polygon(geometry['coordinates'])
-                        elif geometry_type == 'MultiPolygon':
-                            for polygon in geometry['coordinates']:
-                                coordinates.append(_convert_polygon(polygon))
-                        else:
-                            logger.warning((
-                                f'Ignoring unknown geometry type: {geometry_type}.'
-                                f' (id: {feature["id"]})'
-                            ))
-                    elif 'rings' in geometry:
-                        coordinates = _convert_polygon(geometry['rings'])
-                        feature['geometry']['type'] = 'rings'
+                    if cache:
+                        coordinates = _get_cached_coordinates(feature)
+                    else:
+                        coordinates = _convert_geometry(feature)
+
+                    if self.geometry_simplifier and coordinates:
+                        full_coordinates = coordinates
+                        coordinates = self.geometry_simplifier.simplify(
+                            feature['geometry']['type'], coordinates
+                        )
+                        self.metrics.increment(
+                            'geometry_bytes_saved',
+                            get_encoded_size(full_coordinates)
+                            - get_encoded_size(coordinates)
+                        )
+                        if self.keep_full_geometry:
+                            feature['geometry']['fullCoordinates'] = (
+                                full_coordinates
+                            )
                     feature['geometry']['coordinates'] = coordinates
-        else:
-            response.raise_for_status()
+            yield feature
+
+        if cache:
+            cache.save()
 
-        return response_json
+    def get_layer_items(self, url, params, raise_for_status=False):
+        """Stream the features of an ArcGIS query, requesting the following
+        pages while the server reports that its transfer limit was exceeded
+
+        :param url: ArcGIS query URL
+        :param params: Query parameters
+        :param raise_for_status: Whether to raise on an error response, which
+                                 is skipped otherwise
+        :returns: Features, one at a time
+        :rtype: generator
+        """
+        offset = 0
+        while True:
+            page_params = params
+            if offset:
+                page_params = dict(params, resultOffset=offset)
+            with self.fetcher.get(
+                url, params=page_params, stream=True
+            ) as response:
+                if raise_for_status:
+                    response.raise_for_status()
+                reader = utils.ResponseReader(
+                    response, pattern=TRANSFER_LIMIT_EXCEEDED
+                )
+                count = 0
+                for feature in self.get_json_items(
+                    response, 'features.item', reader
+                ):
+                    count += 1
+                    yield feature
+
+            # An empty page would be requested again forever
+            if not reader.matched or not count:
+                return
+            offset += count
+
+    def _stream_layer(self, url, params, proj=None, cache=None):
+        """Stream the features of an ArcGIS query
+
+        :param url: ArcGIS query URL
+        :param params: Query parameters
+        :param proj: PROJ object of the source coordinates, to convert them
+        :param cache: ProjectionCache of the converted coordinates
+        :returns: Features, one at a time
+        :rtype: generator
+        """
+        if proj:
+            yield from self.get_converted_coordinates(
+                url, params, proj, cache
+            )
+            return
+        yield from self.get_layer_items(url, params)
+
+    def get_projection_cache(self, layer, proj):
+        """Get the cache of the converted coordinates of an ArcGIS layer
+
+        :param layer: Layer key of the arcGIS config
+        :param proj: PROJ object of the source coordinates
+        :returns: Projection cache, None if disabled
+        :rtype: ProjectionCache
+        """
+        config = self.config['locations']['arcGIS'].get('projectionCache', {})
+        if not proj or not config.get('enabled'):
+            return None
+        return ProjectionCache(
+            os.path.join(
+                config.get('folder', 'build/projection-cache'), layer
+            ),
+            proj.srs
+        )
+
+    def get_layer_features(self, layer, url, params, proj=None):
+        """Get the features of an ArcGIS layer. In delta mode, only the
+        features edited since the last run are queried and converted, merged
+        into the stored features of the layer without the deleted ones.
+
+        :param layer: Layer key of the arcGIS config
+        :param url: ArcGIS query URL
+        :param params: Query parameters
+        :param proj: PROJ object of the source coordinates, to convert them
+        :returns: Features
+        :rtype: iterable
+        """
+        cache = self.get_projection_cache(layer, proj)
+        delta_config = self.config['locations']['arcGIS'].get('delta', {})
+        if not delta_config.get('enabled'):
+            return self._stream_layer(url, params, proj, cache)
+
+        state = LayerState(
+            os.path.join(
+                delta_config.get('stateFolder', 'build/arcgis-state'),
+                f'{layer}.json'
+            ),
+            delta_config.get('objectIdField', 'OBJECTID'),
+            delta_config.get('editDateField', 'EditDate')
+        )
+        full_refresh = state.needs_full_refresh(
+            delta_config.get('fullRefreshHours', 24)
+        )
+
+        if not full_refresh:
+            # Current IDs of the layer, to drop the deleted features
+            with self.fetcher.get(url, params={
+                'where': params.get('where', '1=1'),
+                'returnIdsOnly': 'true',
+                'f': 'json'
+            }) as response:
+                response.raise_for_status()
+                ids_result = response.json()
+            # ArcGIS answers query errors with a 200 and an error object,
+            # which must not be taken for a layer without features
+            if 'error' in ids_result or 'objectIds' not in ids_result:
+                logger.warning(
+                    f'[ARCGIS] {layer}: unable to query the object IDs '
+                    f"({ids_result.get('error')}), running a full refresh"
+                )
+                full_refresh = True
+
+        if full_refresh:
+            features = list(self._stream_layer(url, params, proj, cache))
+            state.update(features, full_refresh)
+            state.save()
+            return features
+
+        # The edited features are converted without the cache, as saving it
+        # would drop the others. objectIds is null when no feature matches.
+        object_ids = ids_result['objectIds'] or []
+        features = list(self._stream_layer(
+            url,
+            dict(params, where=state.get_delta_where(params.get('where'))),
+            proj
+        ))
+        deleted = state.update(features, full_refresh, object_ids)
+        logger.info(
+            f'[ARCGIS] {layer} delta: {len(features)} edited, '
+            f'{deleted} deleted'
+        )
+        state.save()
+        return list(state.features.values())
 
     def get_library_hours(self):
         """Get library open hours via library API
@@ -498,20 +993,18 @@ class LocationsGenerator:
             'Content-Type': 'application/json',
             'Accept': 'application/vnd.kiosks.v1'
         }
-        body = {'dates': []}
-
-        for day in range(7):
-            week_day = self.today + timedelta(days=day)
-            body['dates'].append(utils.to_date(week_day))
+        body = {'dates': list(self.week_days.keys)}
 
-        response = requests.post(config['url'], headers=headers, json=body)
+        response = self.session.post(
+            config['url'], headers=headers, json=body
+        )
+        # Fetched in the background while other stages are active
+        self.metrics.increment(
+            'bytes_fetched', len(response.content), stage='library_hours'
+        )
 
         if response.status_code == 200:
-            open_hours = {}
-
-            for day in range(7):
-                week_day = self.today + timedelta(days=day)
-                open_hours[utils.to_date(week_day)] = []
+            open_hours = {key: [] for key in self.week_days.keys}
 
             for value in response.json().values():
                 datetime_format = '%Y-%m-%d %I:%M%p'
@@ -541,17 +1034,20 @@ class LocationsGenerator:
                 }
             return open_hours
 
-    def generate_json_resources(self):
-        """
-        Generate resources and write to JSON files
+    def merge_facil_locations(
+        self, facil_locations, gender_inclusive_restrooms, arcgis_geometries
+    ):
+        """Merge facil locations with gender inclusive restrooms and geometry
+        data
+
+        :param facil_locations: Facil locations from Banner
+        :param gender_inclusive_restrooms: Gender inclusive restrooms data
+        :param arcgis_geometries: Locations arcGIS coordinates
+        :returns: Facil locations
+        :rtype: list
         """
-        base_url = self.config['locationsApi']['url']
-        facil_locations = self.get_facil_locations()
-        gender_inclusive_restrooms = self.get_gender_inclusive_restrooms()
-        arcgis_geometries = self.get_arcgis_geometries()
         locations = []
 
-        # Merge facil locations, gender inclusive restrooms and geometry data
         for location_id, raw_facil in facil_locations.items():
             raw_gir = gender_inclusive_restrooms.get(location_id)
             raw_geo = arcgis_geometries.get(location_id)
@@ -561,26 +1057,21 @@ class LocationsGenerator:
 
             locations.append(facil_location)
 
-        # Send async calls and collect results
-        concurrent_calls = asyncio.gather(
-            self.get_dining_locations(),
-            self.get_extra_calendars()
-        )
-        loop = asyncio.get_event_loop()
-        concurrent_res = loop.run_until_complete(concurrent_calls)
-        loop.close()
-
-        # Concatenate locations
-        locations += self.get_extra_locations()  # extra locations
-        locations += self.get_extension_locations()  # extension locations
-        locations += self.get_parking_locations()  # parking locations
-        locations += self.get_fields()  # field locations
-        locations += self.get_places()  # place locations
-        locations += concurrent_res[0]  # dining locations
-        locations += concurrent_res[1]['locations']  # extra service locations
-
-        extra_services = concurrent_res[1]['services']
-        campus_map_data = self.get_campus_map_data()
+        return locations
+
+    def merge_locations(
+        self, locations, campus_map_data, extra_services, library_hours=None
+    ):
+        """Merge locations from all sources with campus map data and service
+        relationships
+
+        :param locations: Locations from all sources
+        :param campus_map_data: Campus map data
+        :param extra_services: Extra service locations
+        :param library_hours: Open hours of The Valley Library
+        :returns: Combined locations
+        :rtype: list
+        """
         combined_locations = []
         merge_data = []
         for location in locations:
@@ -599,7 +1090,7 @@ class LocationsGenerator:
 
                 # Add open hours to The Valley Library (Building ID: 0036)
                 if location.bldg_id == '0036':
-                    location.open_hours = self.get_library_hours()
+                    location.open_hours = library_hours
 
             if location.merge:
                 merge_data.append(location)
@@ -628,13 +1119,389 @@ class LocationsGenerator:
                         'type': service.type
                     })
 
+        return combined_locations
+
+    def link_buildings(self, locations):
+        """Link parking, field and place locations to the building containing
+        them or, failing that, to the nearest building within the configured
+        distance
+
+        :param locations: Combined locations
+        """
+        config = self.config.get('spatialJoin', {})
+        max_distance = config.get('maxDistance', 250)
+
+        buildings = []
+        for location in locations:
+            if location.source == 'facil-location':
+                bounds = get_bounds(location.geometry)
+                if bounds:
+                    buildings.append((bounds, location))
+        if not buildings:
+            return
+
+        projection = LocalProjection(buildings[0][0][1])
+        tree = STRtree([
+            (projection.project_bounds(bounds), building)
+            for bounds, building in buildings
+        ])
+
+        for location in locations:
+            if location.source not in BUILDING_LINKED_SOURCES:
+                continue
+
+            geo_location = getattr(location, 'geo_location', None)
+            if geo_location:
+                point = (
+                    float(geo_location['lon']),
+                    float(geo_location['lat'])
+                )
+            else:
+                point = get_center(location.geometry)
+            if not point:
+                continue
+
+            target = projection.project(*point)
+            relation, building, distance = 'within', None, 0.0
+            for candidate in tree.query(target + target):
+                if contains_point(candidate.geometry, point):
+                    building = candidate
+                    break
+
+            if not building:
+                relation = 'nearest'
+                building, distance = tree.nearest(
+                    target,
+                    lambda candidate: get_distance(
+                        candidate.geometry, point, projection
+                    ),
+                    max_distance
+                )
+
+            if building:
+                location.relationships['buildings'] = {
+                    'data': [{
+                        'id': building.calculate_hash_id(),
+                        'type': 'locations'
+                    }],
+                    'meta': {
+                        'relation': relation,
+                        'distance': round(distance, 1)
+                    }
+                }
+
+    def set_geo_cells(self, locations):
+        """Set the geohash prefixes, covering geohashes and H3 cells of the
+        locations with a point or a geometry
+
+        :param locations: Combined locations
+        """
+        config = self.config.get('geoCells', {})
+        if not config.get('enabled', True):
+            return
+
+        geo_cells = GeoCells(config)
+        for location in locations:
+            geo_location = getattr(location, 'geo_location', None)
+            point = None
+            if geo_location:
+                point = (
+                    float(geo_location['lon']),
+                    float(geo_location['lat'])
+                )
+            location.geo_cells = geo_cells.get_cells(
+                point, getattr(location, 'geometry', None)
+            )
+
+    def concatenate_locations(self, facil_locations, sources,
+                              dining_locations, extra_locations,
+                              extra_calendars):
+        """Concatenate the locations of every source in the order they are
+        merged
+
+        :param facil_locations: Merged facil locations
+        :param sources: Locations of the independent sources keyed by stage
+        :param dining_locations: Dining locations
+        :param extra_locations: Extra locations
+        :param extra_calendars: Extra calendars data
+        :returns: Locations
+        :rtype: list
+        """
+        return (
+            facil_locations
+            + extra_locations
+            + sources['extension_locations']
+            + sources['parking_locations']
+            + sources['field_locations']
+            + sources['place_locations']
+            + dining_locations
+            + extra_calendars['locations']  # extra service locations
+        )
+
+    def build_resources(self, combined_locations, extra_services,
+                        publisher=None):
+        """Build the location and service resources
+
+        :param combined_locations: Combined locations
+        :param extra_services: Services
+        :param publisher: es_manager.BulkPublisher the resources are published
+                          to as soon as they are built
+        :returns: Location resources, service resources and the number of
+                  locations of each source
+        :rtype: tuple
+        """
+        base_url = self.config['locationsApi']['url']
+        slim_open_hours = self.config.get('openHours', {}).get('slim', False)
+
+        # Type-ahead inputs of the completion suggester
+        suggestions_config = self.config.get('suggestions', {})
+        suggestions = None
+        if suggestions_config.get('enabled', True):
+            suggestions = Suggestions(suggestions_config)
+
         # Build location resources
         combined_resources = []
         summary = defaultdict(int)
         for location in combined_locations:
             summary[location.source] += 1
-            resource = location.build_resource(base_url)
+            resource = location.build_resource(base_url, slim_open_hours)
+            if suggestions:
+                attributes = resource['attributes']
+                attributes['suggest'] = suggestions.get_inputs(attributes)
             combined_resources.append(resource)
+            if publisher:
+                publisher.publish('locations', resource)
+
+        # Build service resources
+        services = []
+        for service in extra_services:
+            resource = service.build_resource(base_url, slim_open_hours)
+            if suggestions:
+                attributes = resource['attributes']
+                attributes['suggest'] = suggestions.get_inputs(attributes)
+            services.append(resource)
+            if publisher:
+                publisher.publish('services', resource)
+
+        return combined_resources, services, summary
+
+    def start_worker_pool(self):
+        """Start the pool of worker processes fetching and transforming the
+        sources
+
+        :returns: Process pool
+        :rtype: ProcessPoolExecutor
+        """
+        # Workers are spawned rather than forked, so they don't inherit the
+        # locks held by other threads
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.arguments, self.today)
+        )
+
+    def write_resources(self, output_folder, combined_locations,
+                        combined_resources, extra_services, services):
+        """
+        Write resources to JSON files and sharded artifacts
+
+        :param output_folder: Build folder
+        :param combined_locations: Combined locations
+        :param combined_resources: Location resources
+        :param extra_services: Services
+        :param services: Service resources
+        """
+        # Write location data to output file
+        locations_output = f'{output_folder}/locations-combined.json'
+        os.makedirs(os.path.dirname(locations_output), exist_ok=True)
+        with open(locations_output, 'w') as file:
+            json.dump(combined_resources, file)
+
+        # Write services data to output file
+        services_output = f'{output_folder}/services.json'
+        os.makedirs(os.path.dirname(services_output), exist_ok=True)
+        with open(services_output, 'w') as file:
+            json.dump(services, file)
+
+        # Write full resolution geometries beside the simplified ones
+        if self.keep_full_geometry:
+            geometries_output = f'{output_folder}/geometries-full.json'
+            with open(geometries_output, 'w') as file:
+                json.dump({
+                    location.calculate_hash_id(): location.full_geometry
+                    for location in combined_locations
+                    if location.full_geometry
+                }, file)
+
+        # Write the merged open intervals with an index of what is open when
+        open_intervals = {
+            location.calculate_hash_id(): location.open_intervals
+            for location in combined_locations + extra_services
+            if location.open_intervals
+        }
+        OpenIntervalIndex.build(open_intervals).write(
+            f'{output_folder}/open-intervals.json',
+            open_intervals
+        )
+
+        # Write sharded artifacts with an ID index for random access. Stale
+        # ones are removed since es_manager.py prefers them if present.
+        artifacts_config = self.config.get('artifacts', {})
+        artifacts_output = f'{output_folder}/artifacts'
+        if artifacts_config.get('sharded'):
+            shard_bytes = artifacts_config.get('shardBytes', 4 * 1024 ** 2)
+            for name, resources in [
+                ('locations', combined_resources),
+                ('services', services)
+            ]:
+                write_artifact(
+                    f'{artifacts_output}/{name}',
+                    resources,
+                    shard_bytes
+                )
+        elif os.path.isdir(artifacts_output):
+            shutil.rmtree(artifacts_output)
+
+    def generate_json_resources(self, publisher=None, write_files=True):
+        """
+        Generate resources and write to JSON files
+
+        :param publisher: es_manager.BulkPublisher the resources are published
+                          to as soon as they are built
+        :param write_files: Whether to write the resources to the build folder
+        """
+        # Only needed once the sources are fetched, keep start-up fast
+        import asyncio
+        from tabulate import tabulate
+
+        metrics = self.metrics
+
+        # Fetch each calendar once per run
+        self.calendar_open_hours = {}
+
+        # The library hours are only needed by the merge, fetch them in the
+        # background meanwhile
+        library_executor = ThreadPoolExecutor(max_workers=1)
+        library_hours = library_executor.submit(self.get_library_hours)
+        library_executor.shutdown(wait=False)
+
+        # Fetch and transform the independent sources, in a pool of worker
+        # processes while the calendars are fetched if enabled
+        pool = None
+        try:
+            if self.workers:
+                pool = self.start_worker_pool()
+                futures = [
+                    pool.submit(_run_source, stage, method)
+                    for stage, method in SOURCE_STAGES
+                ]
+            else:
+                sources = {}
+                for stage, method in SOURCE_STAGES:
+                    with metrics.stage(stage):
+                        sources[stage] = getattr(self, method)()
+
+            # Send async calls and collect results
+            with metrics.stage('calendars'):
+                # The loop is closed below, use a new one on every run
+                asyncio.set_event_loop(asyncio.new_event_loop())
+                concurrent_calls = asyncio.gather(
+                    self.get_dining_locations(),
+                    self.get_extra_calendars()
+                )
+                loop = asyncio.get_event_loop()
+                concurrent_res = loop.run_until_complete(concurrent_calls)
+                loop.close()
+
+            with metrics.stage('extra_locations'):
+                extra_locations = self.get_extra_locations()
+
+            if pool:
+                with metrics.stage('transform_wait'):
+                    sources = {}
+                    for (stage, _), future in zip(SOURCE_STAGES, futures):
+                        sources[stage], record, hosts, spans = future.result()
+                        metrics.merge_stage(stage, record)
+                        for host, host_record in hosts.items():
+                            metrics.merge_host(host, host_record)
+                        if self.tracer:
+                            self.tracer.add_spans(spans)
+        finally:
+            # Stop the workers even if a source failed, so they never outlive
+            # the build
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        # Merge facil locations, gender inclusive restrooms and geometry data
+        with metrics.stage('facil_merge'):
+            facil_locations = self.merge_facil_locations(
+                sources['facil'],
+                sources['gender_inclusive_restrooms'],
+                sources['arcgis_geometries']
+            )
+
+        dining_locations, extra_calendars = concurrent_res
+        locations = self.concatenate_locations(
+            facil_locations,
+            sources,
+            dining_locations,
+            extra_locations,
+            extra_calendars
+        )
+        extra_services = extra_calendars['services']
+        with metrics.stage('campus_map'):
+            campus_map_data = self.get_campus_map_data()
+
+        with metrics.stage('library_hours'):
+            library_hours = library_hours.result()
+
+        with metrics.stage('merge'):
+            combined_locations = self.merge_locations(
+                locations, campus_map_data, extra_services, library_hours
+            )
+
+        # Link locations to nearby buildings
+        with metrics.stage('spatial_join'):
+            self.link_buildings(combined_locations)
+
+        # Precompute the grid cell keys of proximity queries
+        with metrics.stage('geo_cells'):
+            self.set_geo_cells(combined_locations)
+
+        with metrics.stage('build_resources'):
+            combined_resources, services, summary = self.build_resources(
+                combined_locations, extra_services, publisher
+            )
+
+        if self.keep_state:
+            self.last_build = {
+                'facil_locations': facil_locations,
+                'sources': sources,
+                'dining_locations': dining_locations,
+                'campus_map_data': campus_map_data,
+                'library_hours': library_hours,
+                'resource_hashes': {
+                    'locations': _get_resource_hashes(combined_resources),
+                    'services': _get_resource_hashes(services)
+                }
+            }
+
+        output_folder = 'build'
+        if write_files:
+            with metrics.stage('write'):
+                self.write_resources(
+                    output_folder,
+                    combined_locations,
+                    combined_resources,
+                    extra_services,
+                    services
+                )
+
+        # Wait for the rest of the resources to be indexed
+        if publisher:
+            with metrics.stage('publish'):
+                publisher.close()
 
         total_number = 0
         summary_table = []
@@ -648,35 +1515,129 @@ class LocationsGenerator:
             tablefmt='fancy_grid'
         )
         logger.info(f"\n{table_output}")
+        for host, host_record in self.fetcher.pop_stats().items():
+            metrics.merge_host(host, host_record)
+        spans = self.tracer.pop_spans() if self.tracer else []
+        metrics.merge_spans(spans)
+        logger.info(f"\n{metrics.summary_table()}")
+        if metrics.hosts:
+            logger.info(f"\n{metrics.hosts_table()}")
+        if metrics.requests:
+            logger.info(f"\n{metrics.latency_table()}")
+            logger.info(f"\n{metrics.slowest_table()}")
+
+        # Write run metrics for scraping, and the spans of the requests
+        metrics.write_json(f'{output_folder}/metrics.json')
+        metrics.write_prometheus(f'{output_folder}/metrics.prom')
+        if self.tracer:
+            self.tracer.write_otlp(f'{output_folder}/trace.json', spans)
+
+    def rebuild_extra_data(self, write_files=True):
+        """Rebuild the resources after the extra data changed, reusing the
+        sources of the last full build. Only the extra locations and
+        calendars are read again, and only the new calendars are fetched.
+
+        :param write_files: Whether to write the resources to the build folder
+        :returns: Changed resources and IDs of the removed ones, as a tuple
+                  keyed by index
+        :rtype: dict
+        """
+        import asyncio
 
-        output_folder = 'build'
-        # Write location data to output file
-        locations_output = f'{output_folder}/locations-combined.json'
-        os.makedirs(os.path.dirname(locations_output), exist_ok=True)
-        with open(locations_output, 'w') as file:
-            json.dump(combined_resources, file)
+        last_build = self.last_build
+        if last_build is None:
+            raise RuntimeError(
+                'The extra data can only be rebuilt after a full build of a '
+                'generator keeping its state'
+            )
+        metrics = self.metrics = self.create_metrics()
+        self.extra_data = utils.load_yaml(self.extra_data_file)
 
-        # Build service resources
-        services = []
-        for service in extra_services:
-            resource = service.build_resource(base_url)
-            services.append(resource)
+        with metrics.stage('calendars'):
+            extra_calendars = asyncio.run(self.get_extra_calendars())
 
-        # Write services data to output file
-        services_output = f'{output_folder}/services.json'
-        os.makedirs(os.path.dirname(services_output), exist_ok=True)
-        with open(services_output, 'w') as file:
-            json.dump(services, file)
+        with metrics.stage('extra_locations'):
+            extra_locations = self.get_extra_locations()
+
+        locations = self.concatenate_locations(
+            last_build['facil_locations'],
+            last_build['sources'],
+            last_build['dining_locations'],
+            extra_locations,
+            extra_calendars
+        )
+        extra_services = extra_calendars['services']
+        with metrics.stage('merge'):
+            # Drop the services of the previous merge before adding them
+            for location in locations:
+                services = location.relationships.get('services')
+                if services:
+                    services['data'] = []
+            combined_locations = self.merge_locations(
+                locations,
+                last_build['campus_map_data'],
+                extra_services,
+                last_build['library_hours']
+            )
+
+        # The other locations kept the cells set by the full build
+        with metrics.stage('geo_cells'):
+            self.set_geo_cells(extra_locations + extra_calendars['locations'])
+
+        with metrics.stage('build_resources'):
+            combined_resources, services, _ = self.build_resources(
+                combined_locations, extra_services
+            )
+
+        if write_files:
+            with metrics.stage('write'):
+                self.write_resources(
+                    'build',
+                    combined_locations,
+                    combined_resources,
+                    extra_services,
+                    services
+                )
+
+        changes = {}
+        for index, resources in [
+            ('locations', combined_resources),
+            ('services', services)
+        ]:
+            # Compared by content, the resources of the last build share
+            # the relationships of the locations modified since then
+            previous = last_build['resource_hashes'][index]
+            current = _get_resource_hashes(resources)
+            changes[index] = (
+                [
+                    resource for resource in resources
+                    if previous.get(resource['id']) != current[resource['id']]
+                ],
+                [
+                    resource_id for resource_id in previous
+                    if resource_id not in current
+                ]
+            )
+            last_build['resource_hashes'][index] = current
+
+        if self.tracer:
+            metrics.merge_spans(self.tracer.pop_spans())
+        logger.info(f"\n{metrics.summary_table()}")
+        if metrics.requests:
+            logger.info(f"\n{metrics.latency_table()}")
+            logger.info(f"\n{metrics.slowest_table()}")
+        return changes
 
 
 if __name__ == '__main__':
-    arguments = utils.parse_arguments()
+    arguments = utils.parse_arguments(generator=True)
 
     # Setup logging level
     logging.basicConfig(
         level=(logging.DEBUG if arguments.debug else logging.INFO)
     )
-    logger = logging.getLogger(__name__)
 
     locations_generator = LocationsGenerator(arguments)
-    locations_generator.generate_json_resources()
+    locations_generator.profiler.run(
+        locations_generator.generate_json_resources
+    )
@@ -0,0 +1,306 @@
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from tracing import TimedHTTPAdapter, TracedSession
+
+
+logger = logging.getLogger(__name__)
+
+# Counters of each host, in the order they are displayed
+HOST_COUNTERS = [
+    'requests',
+    'retries',
+    'throttled',
+    'server_errors',
+    'failures',
+    'increases',
+    'decreases'
+]
+
+
+def is_retryable(status):
+    """Helper function to check if a request should be retried
+
+    :param status: Response status code, None if the request failed
+    :returns: Whether the host is throttling or failing
+    :rtype: bool
+    """
+    return status is None or status == 429 or status >= 500
+
+
+class AIMDController:
+    """
+    Additive increase, multiplicative decrease controller of the number of
+    concurrent requests to a host. The limit grows by one request per window
+    of healthy responses, holds while the latency exceeds latencyTolerance
+    times the lowest one seen, and is cut by backoffFactor on a 429, a 5xx or
+    a connection failure, at most once per window.
+    """
+    def __init__(self, host, config):
+        """
+        :param host: Host name
+        :param config: concurrency config object
+        """
+        self.host = host
+        self.min_limit = config.get('minLimit', 1)
+        self.max_limit = config.get('maxLimit', 32)
+        self.backoff_factor = config.get('backoffFactor', 0.5)
+        self.latency_tolerance = config.get('latencyTolerance', 2.0)
+        self.limit = float(config.get('initialLimit', 4))
+        # At least one request has to be in flight, and the increase of
+        # the limit is inversely proportional to it
+        for key, default in [('minLimit', 1), ('initialLimit', 4)]:
+            value = config.get(key, default)
+            if value < 1:
+                raise ValueError(f'{key} must be at least 1, not {value}.')
+        if self.max_limit < self.min_limit:
+            raise ValueError(
+                f'maxLimit must be at least minLimit, not {self.max_limit}.'
+            )
+        self.min_latency = None
+        self.stats = Counter()
+        self.max_concurrency = self.concurrency
+        self.decisions = []
+        self._start = time.monotonic()
+        self._decreased_at = self._start
+        # Requests of the host are recorded from the threads of map
+        self._lock = threading.Lock()
+
+    @property
+    def concurrency(self):
+        return max(self.min_limit, int(self.limit))
+
+    def _set_limit(self, limit, reason):
+        before = self.concurrency
+        self.limit = limit
+        if self.concurrency != before:
+            if self.concurrency > before:
+                self.stats['increases'] += 1
+            else:
+                self.stats['decreases'] += 1
+            self.decisions.append({
+                'at': round(time.monotonic() - self._start, 3),
+                'concurrency': self.concurrency,
+                'reason': reason
+            })
+            self.max_concurrency = max(self.max_concurrency, self.concurrency)
+            logger.debug(
+                f'{self.host} concurrency {before} -> {self.concurrency} '
+                f'({reason})'
+            )
+
+    def record(self, status, started, latency):
+        """Adjust the limit with the outcome of a request
+
+        :param status: Response status code, None if the request failed
+        :param started: Monotonic time the request was sent at
+        :param latency: Seconds until the response was received
+        """
+        with self._lock:
+            self._record(status, started, latency)
+
+    def record_retry(self):
+        """Count a request sent again
+        """
+        with self._lock:
+            self.stats['retries'] += 1
+
+    def _record(self, status, started, latency):
+        self.stats['requests'] += 1
+        if is_retryable(status):
+            if status is None:
+                reason = 'failures'
+            elif status == 429:
+                reason = 'throttled'
+            else:
+                reason = 'server_errors'
+            self.stats[reason] += 1
+
+            # Requests sent before the last decrease did not see it yet
+            if started >= self._decreased_at:
+                self._decreased_at = time.monotonic()
+                self._set_limit(
+                    max(self.min_limit, self.limit * self.backoff_factor),
+                    reason
+                )
+            return
+
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        # Hold the limit while the host is slower than usual
+        if latency <= self.min_latency * self.latency_tolerance + 0.05:
+            self._set_limit(
+                min(self.max_limit, self.limit + 1 / self.limit),
+                'healthy'
+            )
+
+    def pop_stats(self):
+        """Get the counters and decisions since the last call
+
+        :returns: Host record
+        :rtype: dict
+        """
+        with self._lock:
+            record = {
+                counter: self.stats[counter] for counter in HOST_COUNTERS
+            }
+            record['concurrency'] = self.concurrency
+            record['max_concurrency'] = self.max_concurrency
+            record['decisions'] = self.decisions
+            self.stats = Counter()
+            self.decisions = []
+        return record
+
+
+class AdaptiveFetcher:
+    """
+    HTTP client sharing a pool of keep-alive connections, which retries
+    throttled and failed requests with an exponential backoff and limits the
+    concurrent requests of each host with an AIMDController
+    """
+    def __init__(self, config, tracer=None):
+        """
+        :param config: concurrency config object
+        :param tracer: Tracer to record the requests into
+        """
+        self.config = config
+        self.max_retries = config.get('maxRetries', 3)
+        self.retry_backoff = config.get('retryBackoff', 0.5)
+        self.timeout = config.get('timeout', 30)
+        self.controllers = {}
+
+        self.session = TracedSession(tracer)
+        adapter = TimedHTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=config.get('maxLimit', 32)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_controller(self, url):
+        """Get the controller of the host of a URL
+
+        :param url: Request URL
+        :returns: Controller of the host
+        :rtype: AIMDController
+        """
+        host = urlparse(url).netloc
+        if host not in self.controllers:
+            self.controllers[host] = AIMDController(host, self.config)
+        return self.controllers[host]
+
+    def _get_retry_delay(self, response, attempt):
+        retry_after = None
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), 60)
+        return self.retry_backoff * 2 ** attempt
+
+    def request(self, method, url, **kwargs):
+        """Send a request, retrying it while the host throttles or fails
+
+        :param method: HTTP method
+        :param url: Request URL
+        :returns: Last response, None if the last attempt failed to connect
+        :rtype: requests.Response
+        """
+        controller = self.get_controller(url)
+        kwargs.setdefault('timeout', self.timeout)
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._get_retry_delay(response, attempt - 1))
+                controller.record_retry()
+                if response is not None:
+                    response.close()
+
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+                status = response.status_code
+            except requests.RequestException as error:
+                logger.debug(f'{url} {error}')
+                response, status = None, None
+            controller.record(status, started, time.monotonic() - started)
+            if not is_retryable(status):
+                break
+        return response
+
+    def get(self, url, **kwargs):
+        """Send a GET request like requests.get, with retries
+
+        :param url: Request URL
+        :returns: Response
+        :rtype: requests.Response
+        """
+        response = self.request('GET', url, **kwargs)
+        if response is None:
+            raise requests.ConnectionError(f'Unable to connect to {url}')
+        return response
+
+    def map(self, urls):
+        """Send GET requests concurrently, as many at once to each host as
+        its controller allows
+
+        :param urls: Request URLs
+        :returns: Responses in the order of the URLs, None for failures
+        :rtype: list
+        """
+        pending = {}
+        for position, url in enumerate(urls):
+            controller = self.get_controller(url)
+            pending.setdefault(controller, deque()).append((position, url))
+        if not pending:
+            return []
+
+        responses = [None] * len(urls)
+        active = {}
+        in_flight = Counter()
+        # Threads are only started as requests are submitted, at most the
+        # highest limit of every host
+        executor = ThreadPoolExecutor(
+            max_workers=self.config.get('maxLimit', 32) * len(pending),
+            thread_name_prefix='fetcher'
+        )
+        with executor:
+            while pending or active:
+                for controller in list(pending):
+                    queue = pending[controller]
+                    while (
+                        queue
+                        and in_flight[controller] < controller.concurrency
+                    ):
+                        position, url = queue.popleft()
+                        future = executor.submit(self.request, 'GET', url)
+                        active[future] = (controller, position)
+                        in_flight[controller] += 1
+                    if not queue:
+                        del pending[controller]
+
+                done, _ = wait(active, return_when=FIRST_COMPLETED)
+                for future in done:
+                    controller, position = active.pop(future)
+                    in_flight[controller] -= 1
+                    try:
+                        responses[position] = future.result()
+                    except Exception:
+                        logger.exception(f'Unable to fetch {urls[position]}')
+        return responses
+
+    def pop_stats(self):
+        """Get the records of the hosts since the last call
+
+        :returns: Host records keyed by host name
+        :rtype: dict
+        """
+        return {
+            host: controller.pop_stats()
+            for host, controller in self.controllers.items()
+        }
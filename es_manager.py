@@ -1,34 +1,121 @@
 import io
 import json
 import logging
+import os
 from pprint import pformat
+import queue
 import sys
+import threading
 
-from elasticsearch import Elasticsearch, RequestsHttpConnection, helpers
-from requests_aws4auth import AWS4Auth
-from tabulate import tabulate
-
+from artifacts import ArtifactReader
+from es_templates import (
+    get_index_name,
+    get_index_template,
+    INDICES,
+    TEMPLATE_VERSION
+)
+from profiling import Profiler
 from utils import load_json, load_yaml, parse_arguments
 
 
+logger = logging.getLogger(__name__)
+
+
 class ESManager:
-    def __init__(self, config):
-        config = load_yaml(config)['elasticsearch']
-        self.es = Elasticsearch('http://localhost:9201')
+    def __init__(self, config, profiler=None, tracer=None):
+        # The Elasticsearch client is slow to import, only load it when used
+        from elasticsearch import helpers
+        from es_transport import create_client, TransferStats
+
+        config = load_yaml(config)['awsElasticsearch']
+        self.profiler = profiler or Profiler('es_manager')
+        # Bulk bodies are sent once they reach this size
+        self.chunk_bytes = config.get('bulkChunkBytes', 5 * 1024 ** 2)
+        self.transfer_stats = TransferStats()
+        self.es = create_client(config, self.transfer_stats, tracer)
+
+        # Indices of the current template version, keyed by alias
+        self.indices = {}
+        self.pending_aliases = {}
+        with self.profiler.stage('templates'):
+            for index in INDICES:
+                self.indices[index] = self.prepare_index(index)
+
         self.current_ids = {}
-        for index in ['locations', 'services']:
-            scan = helpers.scan(
-                self.es,
-                index=index,
-                doc_type=index,
-                _source=False  # don't include bodies
-            )
-            self.current_ids[index] = set([doc['_id'] for doc in scan])
+        with self.profiler.stage('scan'):
+            for index in INDICES:
+                scan = helpers.scan(
+                    self.es,
+                    index=self.indices[index],
+                    doc_type=index,
+                    _source=False  # don't include bodies
+                )
+                self.current_ids[index] = set([doc['_id'] for doc in scan])
+        self.synced_ids = {index: set() for index in INDICES}
         self.bulk_body = {
             'locations': io.StringIO(),
             'services': io.StringIO()
         }
 
+    def prepare_index(self, index):
+        """A function to update the index template if its version changed and
+        create the index of the current version
+
+        :param index: Index alias
+        :returns: Name of the index of the current version
+        :rtype: str
+        """
+        template_name = f'{index}-template'
+        templates = self.es.indices.get_template(
+            name=template_name,
+            ignore=404
+        )
+        current_version = templates.get(template_name, {}).get('version')
+        if current_version != TEMPLATE_VERSION:
+            logger.info(
+                f'[TEMPLATE] {template_name} '
+                f'v{current_version} -> v{TEMPLATE_VERSION}'
+            )
+            self.es.indices.put_template(
+                name=template_name,
+                body=get_index_template(index)
+            )
+
+        index_name = get_index_name(index)
+        if not self.es.indices.exists(index=index_name):
+            logger.info(f'[CREATE INDEX] {index_name}')
+            self.es.indices.create(index=index_name)
+        if not self.es.indices.exists_alias(name=index, index=index_name):
+            # The alias is only moved once the new index is filled
+            self.pending_aliases[index] = index_name
+        return index_name
+
+    def swap_alias(self, index):
+        """A function to point the alias of an index to the index of the
+        current version. Previous versions are kept for rollbacks.
+
+        :param index: Index alias
+        """
+        index_name = self.pending_aliases.pop(index, None)
+        if not index_name:
+            return
+
+        actions = []
+        if self.es.indices.exists_alias(name=index):
+            for old_index in self.es.indices.get_alias(name=index):
+                actions.append({
+                    'remove': {'index': old_index, 'alias': index}
+                })
+        elif self.es.indices.exists(index=index):
+            # Replace the index created before the templates were managed
+            actions.append({'remove_index': {'index': index}})
+        actions.append({'add': {'index': index_name, 'alias': index}})
+
+        # Make the new documents searchable before they are served
+        self.es.indices.refresh(index=index_name)
+        logger.info(f'[ALIAS] {index} -> {index_name}')
+        self.es.indices.update_aliases(body={'actions': actions})
+
     def create_or_update_doc(self, index, doc):
         """A function to write ES query to either create or update a document
 
@@ -52,81 +139,244 @@ class ESManager:
         body.write('\n')
 
     def bulk_query(self, index):
-        """A function to bulk the ES query
+        """A function to send the pending bulk body of an index
 
         :param index: The index key of bulk query
         """
-        result = self.es.bulk(
-            body=self.bulk_body[index].getvalue(),
-            index=index,
-            doc_type=index
-        )
+        body = self.bulk_body[index].getvalue()
+        if not body:
+            return
+        self.bulk_body[index] = io.StringIO()
+
+        with self.profiler.stage('bulk'):
+            result = self.es.bulk(
+                body=body,
+                index=self.indices[index],
+                doc_type=index
+            )
         logging.debug(pformat(result))
         self.parse_bulk_errors(result)
 
     def parse_bulk_errors(self, result):
         if result['errors']:
             for doc in result['items']:
-                doc_index = doc['index']
+                # Items are keyed by their action, e.g. index or delete
+                doc_index = next(iter(doc.values()))
                 if 'error' in doc_index:
                     index = doc_index['_index']
                     doc_id = doc_index['_id']
-                    reason = doc_index['error']['caused_by']['reason']
+                    error = doc_index['error']
+                    reason = error.get('caused_by', error).get('reason')
                     logger.error(f"[ERROR] {index} {doc_id} '{reason}'")
             sys.exit(1)
 
+    def sync_doc(self, index, doc):
+        """A function to create or update a document, sending the bulk body
+        of the index once it reaches the chunk size
 
-if __name__ == '__main__':
-    arguments = parse_arguments()
+        :param index: The index of the document
+        :param doc: Document object
+        """
+        doc_id = doc['id']
+        self.synced_ids[index].add(doc_id)
+        if doc_id not in self.current_ids[index]:
+            # Perform a CREATE if document ID not in current ID set
+            logger.info(f'[CREATE] {index} {doc_id}')
+        else:
+            # Perform a UPDATE if document ID in current ID set
+            logger.info(f'[UPDATE] {index} {doc_id}')
+        self.create_or_update_doc(index, doc)
 
-    # Setup logging level
-    logging.basicConfig(
-        level=(logging.DEBUG if arguments.debug else logging.INFO)
-    )
-    logger = logging.getLogger(__name__)
-    # Set logging level to WARNING for the logger of elasticsearch package
-    logging.getLogger('elasticsearch').setLevel(logging.WARNING)
+        if self.bulk_body[index].tell() >= self.chunk_bytes:
+            self.bulk_query(index)
 
-    # create ES manager instance
-    es_manager = ESManager(arguments.config)
+    def finish_sync(self, index):
+        """A function to delete the documents which were not synced, send the
+        rest of the bulk body and point the alias to the synced index
 
-    # Load data from build artifacts
-    output_folder = 'build'
-    locations = load_json(f'{output_folder}/locations-combined.json')
-    services = load_json(f'{output_folder}/services.json')
+        :param index: The index to finish
+        """
+        from tabulate import tabulate
 
-    for index, docs in [('locations', locations), ('services', services)]:
-        current_ids = es_manager.current_ids[index]
-        artifact_ids = set()
-        create_ids = set()
-        update_ids = set()
+        current_ids = self.current_ids[index]
+        synced_ids = self.synced_ids[index]
 
-        for doc in docs:
-            doc_id = doc['id']
-            artifact_ids.add(doc_id)
-            if doc_id not in current_ids:
-                # Perform a CREATE if document ID not in current ID set
-                logger.info(f'[CREATE] {index} {doc_id}')
-                create_ids.add(doc_id)
-            else:
-                # Perform a UPDATE if document ID in current ID set
-                logger.info(f'[UPDATE] {index} {doc_id}')
-                update_ids.add(doc_id)
-            es_manager.create_or_update_doc(index, doc)
-
-        delete_ids = current_ids - artifact_ids
+        delete_ids = current_ids - synced_ids
         for delete_id in delete_ids:
             # Perform a DELETE for each ID in delete ID set
             logger.info(f'[DELETE] {index} {delete_id}')
-            es_manager.delete_doc(index, delete_id)
+            self.delete_doc(index, delete_id)
 
         summary_table = [
             ['index', index],
-            ['number of creating document', len(create_ids)],
-            ['number of updating document', len(update_ids)],
+            ['number of creating document', len(synced_ids - current_ids)],
+            ['number of updating document', len(synced_ids & current_ids)],
             ['number of deleting document', len(delete_ids)],
             ['size of current ES instance', len(current_ids)],
-            ['size of new ES instance', len(artifact_ids)]
+            ['size of new ES instance', len(synced_ids)]
         ]
         logger.info(f"\n{tabulate(summary_table, tablefmt='fancy_grid')}\n")
-        es_manager.bulk_query(index)
+        self.bulk_query(index)
+        self.swap_alias(index)
+
+        # The synced documents are the current ones of the next sync
+        self.current_ids[index] = synced_ids
+        self.synced_ids[index] = set()
+
+    def publish_changes(self, index, docs, delete_ids):
+        """A function to create, update and delete some documents of an
+        index, keeping the other ones
+
+        :param index: The index of the documents
+        :param docs: Created or updated documents
+        :param delete_ids: IDs of the documents to be deleted
+        """
+        for doc in docs:
+            self.sync_doc(index, doc)
+        for delete_id in delete_ids:
+            logger.info(f'[DELETE] {index} {delete_id}')
+            self.delete_doc(index, delete_id)
+        self.bulk_query(index)
+
+        self.current_ids[index] |= self.synced_ids[index]
+        self.current_ids[index] -= set(delete_ids)
+        self.synced_ids[index] = set()
+
+    def sync(self, index, docs):
+        """A function to sync an index with the documents of a build
+
+        :param index: The index to sync
+        :param docs: Documents of the build
+        """
+        for doc in docs:
+            self.sync_doc(index, doc)
+        self.finish_sync(index)
+
+    def log_transfer_stats(self):
+        from tabulate import tabulate
+
+        transfer_table = self.transfer_stats.summary_table()
+        logger.info(f"\n{tabulate(transfer_table, tablefmt='fancy_grid')}\n")
+
+
+class BulkPublisher:
+    """
+    Publisher of documents to Elasticsearch from a background thread, so the
+    documents are indexed while the following ones are built
+    """
+    def __init__(self, es_manager, queue_size=1000):
+        """
+        :param es_manager: ESManager syncing the documents
+        :param queue_size: Maximum number of documents waiting to be synced
+        """
+        self.es_manager = es_manager
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                index, doc = item
+                self.es_manager.sync_doc(index, doc)
+        except BaseException as error:
+            # Also catches the exit of parse_bulk_errors, reraised by close()
+            self._error = error
+            # Keep consuming so publish() never blocks
+            while self._queue.get() is not None:
+                pass
+
+    def publish(self, index, doc):
+        """Queue a document to be synced
+
+        :param index: The index of the document
+        :param doc: Document object
+        """
+        self._queue.put((index, doc))
+
+    def close(self):
+        """Wait for the queued documents, then finish syncing every index
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error:
+            raise self._error
+
+        for index in INDICES:
+            self.es_manager.finish_sync(index)
+        self.es_manager.log_transfer_stats()
+
+
+def load_documents(output_folder, index):
+    """Load the documents of an index from the build artifacts, reading the
+    sharded artifacts if they were written
+
+    :param output_folder: Folder of the build artifacts
+    :param index: Index alias
+    :returns: Documents
+    :rtype: iterable
+    """
+    artifact_folder = f'{output_folder}/artifacts/{index}'
+    if os.path.isdir(artifact_folder):
+        return ArtifactReader(artifact_folder)
+
+    file_name = {
+        'locations': 'locations-combined.json',
+        'services': 'services.json'
+    }[index]
+    return load_json(f'{output_folder}/{file_name}')
+
+
+def update_indices(config, profiler):
+    """Sync the build artifacts to the Elasticsearch indices
+
+    :param config: Path to the config file
+    :param profiler: Profiler of the run
+    """
+    from metrics import Metrics
+    from tracing import Tracer
+
+    config_object = load_yaml(config)
+    tracer = Tracer.from_config(config_object, 'es_manager')
+
+    # create ES manager instance
+    es_manager = ESManager(config, profiler, tracer)
+
+    # Load data from build artifacts
+    output_folder = 'build'
+    for index in INDICES:
+        es_manager.sync(index, load_documents(output_folder, index))
+    es_manager.log_transfer_stats()
+
+    if tracer:
+        spans = tracer.pop_spans()
+        metrics = Metrics.from_config(config_object)
+        metrics.merge_spans(spans)
+        if metrics.requests:
+            logger.info(f"\n{metrics.latency_table()}")
+            logger.info(f"\n{metrics.slowest_table()}")
+        tracer.write_otlp(f'{output_folder}/es-trace.json', spans)
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+
+    # Setup logging level
+    logging.basicConfig(
+        level=(logging.DEBUG if arguments.debug else logging.INFO)
+    )
+    # Set logging level to WARNING for the logger of elasticsearch package
+    logging.getLogger('elasticsearch').setLevel(logging.WARNING)
+
+    profiler = Profiler.from_arguments(arguments, 'es_manager')
+    profiler.run(update_indices, arguments.config, profiler)
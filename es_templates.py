@@ -0,0 +1,139 @@
+"""
+Index templates of the Locations API indices. Bump TEMPLATE_VERSION whenever
+a mapping changes: es_manager.py then builds new {index}-v{version} indices
+from the artifacts and swaps the index aliases to them.
+"""
+from suggestions import MAX_INPUT_LENGTH
+
+TEMPLATE_VERSION = 4
+
+# Indices synced by es_manager.py, also used as their alias and doc type
+INDICES = ['locations', 'services']
+
+_KEYWORD = {'type': 'keyword'}
+_INTEGER = {'type': 'integer', 'ignore_malformed': True}
+
+# Only stored to be returned by the API, neither searched nor aggregated
+_STORED_TEXT = {'type': 'text', 'index': False}
+_STORED_KEYWORD = {'type': 'keyword', 'index': False}
+_STORED_OBJECT = {'type': 'object', 'enabled': False}
+
+_SEARCHABLE_TEXT = {
+    'type': 'text',
+    'fields': {
+        'keyword': {'type': 'keyword', 'ignore_above': 256}
+    }
+}
+
+ATTRIBUTES_MAPPING = {
+    'type': 'object',
+    # Attributes missing below are kept in _source but not indexed
+    'dynamic': False,
+    'properties': {
+        'name': _SEARCHABLE_TEXT,
+        'tags': _KEYWORD,
+        'openHours': _STORED_OBJECT,
+        # Merged open periods of openHours, e.g. for "open now" filters
+        'openIntervals': {'type': 'date_range'},
+        'type': _KEYWORD,
+        'parent': _KEYWORD,
+        'locationId': _KEYWORD,
+        'bannerAbbreviation': _KEYWORD,
+        'arcGisAbbreviation': _KEYWORD,
+        'geoLocation': {'type': 'geo_point', 'ignore_malformed': True},
+        'geometry': {'type': 'geo_shape', 'ignore_malformed': True},
+        'summary': {'type': 'text'},
+        'description': {'type': 'text'},
+        'descriptionHtml': _STORED_TEXT,
+        'address': {'type': 'text'},
+        'city': _KEYWORD,
+        'state': _KEYWORD,
+        'zip': _KEYWORD,
+        'county': _KEYWORD,
+        'telephone': _STORED_KEYWORD,
+        'fax': _STORED_KEYWORD,
+        'thumbnails': _STORED_KEYWORD,
+        'images': _STORED_KEYWORD,
+        'departments': _KEYWORD,
+        'website': _STORED_KEYWORD,
+        'sqft': {'type': 'float', 'ignore_malformed': True},
+        'calendar': _KEYWORD,
+        'campus': _KEYWORD,
+        'girCount': _INTEGER,
+        'girLimit': {'type': 'boolean'},
+        'girLocations': {'type': 'text'},
+        'synonyms': {'type': 'text'},
+        'bldgId': _KEYWORD,
+        'parkingZoneGroup': _KEYWORD,
+        'propId': _KEYWORD,
+        'adaParkingSpaceCount': _INTEGER,
+        'motorcycleParkingSpaceCount': _INTEGER,
+        'evParkingSpaceCount': _INTEGER,
+        'weeklyMenu': _STORED_KEYWORD,
+        'notes': {'type': 'text'},
+        'labels': _STORED_OBJECT,
+        'steward': _KEYWORD,
+        'shape': _STORED_OBJECT,
+        # Grid cell keys of geocells.py, matched with term filters
+        'geohash': _KEYWORD,
+        'geohashCells': _KEYWORD,
+        'h3Cells': _KEYWORD,
+        # Type-ahead inputs of suggestions.py
+        'suggest': {
+            'type': 'completion',
+            'analyzer': 'simple',
+            'max_input_length': MAX_INPUT_LENGTH
+        }
+    }
+}
+
+DOCUMENT_MAPPING = {
+    'dynamic': False,
+    'dynamic_templates': [{
+        # IDs and types of related resources, e.g. relationships.services
+        'relationship_strings': {
+            'path_match': 'relationships.*',
+            'match_mapping_type': 'string',
+            'mapping': _KEYWORD
+        }
+    }],
+    'properties': {
+        'id': _KEYWORD,
+        'type': _KEYWORD,
+        'attributes': ATTRIBUTES_MAPPING,
+        'links': _STORED_OBJECT,
+        'relationships': {'type': 'object', 'dynamic': True}
+    }
+}
+
+
+def get_index_name(index, version=TEMPLATE_VERSION):
+    """Helper function to get the name of an index version
+
+    :param index: Index alias, one of INDICES
+    :param version: Template version
+    :returns: Index name
+    :rtype: str
+    """
+    return f'{index}-v{version}'
+
+
+def get_index_template(index, version=TEMPLATE_VERSION):
+    """Helper function to get the index template of an index
+
+    :param index: Index alias, one of INDICES
+    :param version: Template version
+    :returns: Index template body
+    :rtype: dict
+    """
+    return {
+        'index_patterns': [f'{index}-v*'],
+        'version': version,
+        'settings': {
+            # A few thousand documents easily fit a single shard
+            'number_of_shards': 1
+        },
+        'mappings': {
+            index: DOCUMENT_MAPPING
+        }
+    }
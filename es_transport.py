@@ -0,0 +1,127 @@
+from elasticsearch import Elasticsearch, RequestsHttpConnection
+from requests_aws4auth import AWS4Auth
+
+from tracing import TimedHTTPAdapter, TracedSession
+
+
+class TransferStats:
+    """
+    Sizes of the requests and responses of an Elasticsearch client, shared by
+    all the connections of the client
+    """
+    def __init__(self):
+        self.requests = 0
+        self.body_bytes = 0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+
+    def add(self, body_bytes, sent_bytes, received_bytes):
+        """Record a request
+
+        :param body_bytes: Size of the request body
+        :param sent_bytes: Size of the request body sent, once compressed
+        :param received_bytes: Size of the decoded response body
+        """
+        self.requests += 1
+        self.body_bytes += body_bytes
+        self.sent_bytes += sent_bytes
+        self.received_bytes += received_bytes
+
+    @property
+    def compression_ratio(self):
+        if not self.sent_bytes:
+            return None
+        return round(self.body_bytes / self.sent_bytes, 2)
+
+    def summary_table(self):
+        """Render the transfer sizes as rows of a table
+
+        :returns: Table rows
+        :rtype: list
+        """
+        return [
+            ['number of requests', self.requests],
+            ['request body bytes', self.body_bytes],
+            ['request bytes sent', self.sent_bytes],
+            ['compression ratio', self.compression_ratio],
+            ['response bytes received', self.received_bytes]
+        ]
+
+
+class PooledConnection(RequestsHttpConnection):
+    """
+    Requests based connection with a tuned pool of keep-alive connections,
+    recording the size of what it transfers and tracing its requests
+    """
+    def __init__(self, *args, pool_maxsize=10, transfer_stats=None,
+                 tracer=None, **kwargs):
+        """
+        :param pool_maxsize: Maximum number of keep-alive connections to the
+                             node
+        :param transfer_stats: TransferStats to record the requests into
+        :param tracer: Tracer to record the requests into
+        """
+        super().__init__(*args, **kwargs)
+        if tracer:
+            self.session = TracedSession.from_session(self.session, tracer)
+        adapter = TimedHTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.transfer_stats = transfer_stats or TransferStats()
+        self._sent_bytes = 0
+
+    def _gzip_compress(self, body):
+        body = super()._gzip_compress(body)
+        self._sent_bytes = len(body)
+        return body
+
+    def perform_request(self, method, url, params=None, body=None, **kwargs):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        body_bytes = self._sent_bytes = len(body) if body else 0
+
+        status, headers, data = super().perform_request(
+            method, url, params, body, **kwargs
+        )
+        self.transfer_stats.add(body_bytes, self._sent_bytes, len(data))
+        return status, headers, data
+
+
+def create_client(config, transfer_stats=None, tracer=None):
+    """Create an Elasticsearch client with compressed request bodies and a
+    pool of keep-alive connections
+
+    :param config: awsElasticsearch config object
+    :param transfer_stats: TransferStats to record the requests into
+    :param tracer: Tracer to record the requests into
+    :returns: Elasticsearch client
+    :rtype: Elasticsearch
+    """
+    http_auth = None
+    if config.get('accessId'):
+        # Requests are signed after compression, so the signature covers the
+        # body actually sent
+        http_auth = AWS4Auth(
+            config['accessId'],
+            config['accessKey'],
+            config['region'],
+            'es'
+        )
+
+    return Elasticsearch(
+        hosts=[{'host': config['host'], 'port': config['port']}],
+        http_auth=http_auth,
+        use_ssl=config.get('useSsl', True),
+        verify_certs=config.get('verifyCerts', True),
+        connection_class=PooledConnection,
+        http_compress=config.get('compress', True),
+        pool_maxsize=config.get('poolMaxSize', 10),
+        timeout=config.get('timeout', 30),
+        sniff_on_start=config.get('sniffOnStart', False),
+        sniff_on_connection_fail=config.get('sniffOnConnectionFail', False),
+        sniffer_timeout=config.get('snifferTimeout'),
+        transfer_stats=transfer_stats,
+        tracer=tracer
+    )
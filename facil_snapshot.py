@@ -0,0 +1,132 @@
+from datetime import date, datetime, timedelta
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def _encode_value(value):
+    """Helper function to encode a Banner value to JSON, keeping the type of
+    dates so they can be bound back to the delta query
+
+    :param value: Column value
+    :returns: JSON value
+    """
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    """Helper function to decode a value encoded by _encode_value
+
+    :param value: JSON value
+    :returns: Column value
+    """
+    if isinstance(value, dict):
+        if '$datetime' in value:
+            return datetime.fromisoformat(value['$datetime'])
+        if '$date' in value:
+            return date.fromisoformat(value['$date'])
+    return value
+
+
+class FacilSnapshot:
+    """
+    Facil rows of the last successful fetch from Banner and the high-water
+    mark of their change column, so following runs only fetch the rows
+    changed since then. Rows deleted from Banner are only dropped by a full
+    refresh.
+    """
+    def __init__(self, file_name, column):
+        """
+        :param file_name: Snapshot file name
+        :param column: Column of the rows holding the change marker, e.g. an
+                       activity date or ORA_ROWSCN
+        """
+        self.file_name = file_name
+        self.column = column
+        self.refreshed_at = None
+        self.high_water_mark = None
+        self.rows = {}
+
+        if os.path.exists(file_name):
+            with open(file_name) as file:
+                snapshot = json.load(file)
+            if (
+                snapshot.get('version') == FORMAT_VERSION
+                and snapshot.get('column') == column
+            ):
+                self.refreshed_at = datetime.fromisoformat(
+                    snapshot['refreshedAt']
+                )
+                self.high_water_mark = _decode_value(snapshot['highWaterMark'])
+                # Rows are stored as a list since JSON keys are strings
+                for row in snapshot['rows']:
+                    row = {
+                        key: _decode_value(value) for key, value in row.items()
+                    }
+                    self.rows[row['id']] = row
+            else:
+                logger.info(f'Ignoring outdated snapshot {file_name}')
+
+    def needs_full_refresh(self, full_refresh_hours, now=None):
+        """Check if all the rows should be fetched again
+
+        :param full_refresh_hours: Hours between full refreshes
+        :param now: Current datetime, in UTC
+        :returns: Whether there is no usable snapshot or it is due
+        :rtype: bool
+        """
+        if self.refreshed_at is None or self.high_water_mark is None:
+            return True
+        now = now or datetime.utcnow()
+        return now - self.refreshed_at >= timedelta(hours=full_refresh_hours)
+
+    def update(self, rows, full_refresh):
+        """Merge fetched rows into the snapshot and advance the high-water
+        mark
+
+        :param rows: Fetched rows keyed by ID
+        :param full_refresh: Whether the rows are all the rows, replacing the
+                             snapshot
+        :returns: Rows of the snapshot keyed by ID
+        :rtype: dict
+        """
+        if full_refresh:
+            self.rows = {}
+            self.refreshed_at = datetime.utcnow()
+            self.high_water_mark = None
+        self.rows.update(rows)
+
+        for row in rows.values():
+            marker = row.get(self.column)
+            if marker is not None and (
+                self.high_water_mark is None or marker > self.high_water_mark
+            ):
+                self.high_water_mark = marker
+        return self.rows
+
+    def save(self):
+        """Write the snapshot, replacing the previous one atomically
+        """
+        os.makedirs(os.path.dirname(self.file_name) or '.', exist_ok=True)
+        temporary_file = f'{self.file_name}.tmp'
+        with open(temporary_file, 'w') as file:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'column': self.column,
+                'refreshedAt': self.refreshed_at.isoformat(),
+                'highWaterMark': _encode_value(self.high_water_mark),
+                'rows': [
+                    {key: _encode_value(value) for key, value in row.items()}
+                    for row in self.rows.values()
+                ]
+            }, file)
+        os.replace(temporary_file, self.file_name)
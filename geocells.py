@@ -0,0 +1,224 @@
+import logging
+
+from geometry import contains_point, get_bounds, get_center, get_polygons
+
+
+logger = logging.getLogger(__name__)
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(lon, lat, precision):
+    """Helper function to get the geohash of a point
+
+    :param lon: Longitude
+    :param lat: Latitude
+    :param precision: Number of characters of the geohash
+    :returns: Geohash string
+    :rtype: str
+    """
+    lon_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    geohash = []
+    bits, bit_count, even = 0, 0, True
+    while len(geohash) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+
+def get_geohash_size(precision):
+    """Helper function to get the size of the geohash cells of a precision
+
+    :param precision: Number of characters of the geohash
+    :returns: (width, height) in degrees
+    :rtype: tuple
+    """
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 360.0 / 2 ** lon_bits, 180.0 / 2 ** lat_bits
+
+
+def _segment_intersects_box(start, end, box):
+    """Helper function to check if a segment crosses a box with the
+    Liang-Barsky clipping algorithm
+
+    :param start: (x, y) start point
+    :param end: (x, y) end point
+    :param box: (min_x, min_y, max_x, max_y) bounds
+    :returns: Whether any part of the segment is inside the box
+    :rtype: bool
+    """
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    t0, t1 = 0.0, 1.0
+    for p, q in [
+        (-dx, start[0] - box[0]),
+        (dx, box[2] - start[0]),
+        (-dy, start[1] - box[1]),
+        (dy, box[3] - start[1])
+    ]:
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                return False
+    return True
+
+
+def _intersects_box(geometry, box):
+    """Helper function to check if a geometry overlaps a box
+
+    :param geometry: Geometry object of a location
+    :param box: (min_lon, min_lat, max_lon, max_lat) bounds
+    :returns: Whether the geometry and the box overlap
+    :rtype: bool
+    """
+    center = ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+    if contains_point(geometry, center):
+        return True
+    for polygon in get_polygons(geometry):
+        for ring in polygon:
+            for start, end in zip(ring, ring[1:] + ring[:1]):
+                if _segment_intersects_box(start[:2], end[:2], box):
+                    return True
+    return False
+
+
+def get_covering_geohashes(geometry, precision, max_cells=64):
+    """Helper function to get the geohash cells overlapping a geometry,
+    coarsening the precision until at most max_cells are needed
+
+    :param geometry: Geometry object of a location
+    :param precision: Number of characters of the geohashes
+    :param max_cells: Maximum number of cells
+    :returns: Sorted geohashes
+    :rtype: list
+    """
+    bounds = get_bounds(geometry)
+    if not bounds:
+        return []
+
+    while True:
+        width, height = get_geohash_size(precision)
+        columns = int(bounds[2] // width - bounds[0] // width) + 1
+        rows = int(bounds[3] // height - bounds[1] // height) + 1
+        if columns * rows <= max_cells or precision == 1:
+            break
+        precision -= 1
+
+    min_x = bounds[0] // width * width
+    min_y = bounds[1] // height * height
+    cells = set()
+    for column in range(columns):
+        for row in range(rows):
+            box = (
+                min_x + column * width,
+                min_y + row * height,
+                min_x + (column + 1) * width,
+                min_y + (row + 1) * height
+            )
+            if _intersects_box(geometry, box):
+                center = ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+                cells.add(encode_geohash(*center, precision))
+    return sorted(cells)
+
+
+class GeoCells:
+    """
+    Computes the grid cell keys of locations: geohash prefixes of their point
+    at several precisions, the geohashes covering their polygons and, if the
+    h3 package is installed, H3 hexagonal cells
+    """
+    def __init__(self, config):
+        """
+        :param config: geoCells config object
+        """
+        self.precisions = config.get('geohashPrecisions', [5, 6, 7])
+        self.cover_precision = config.get('coverPrecision', 7)
+        self.max_cover_cells = config.get('maxCoverCells', 64)
+        self.h3_resolutions = config.get('h3Resolutions', [])
+        self.h3_cover_resolution = config.get('h3CoverResolution')
+
+        self.h3 = None
+        if self.h3_resolutions or self.h3_cover_resolution is not None:
+            try:
+                # Optional dependency, only required when H3 cells are enabled
+                import h3
+                self.h3 = h3
+            except ImportError:
+                logger.warning('h3 is not installed, skipping H3 cells.')
+
+    def _get_h3_cell(self, lon, lat, resolution):
+        if hasattr(self.h3, 'latlng_to_cell'):
+            return self.h3.latlng_to_cell(lat, lon, resolution)
+        # h3 < 4
+        return self.h3.geo_to_h3(lat, lon, resolution)
+
+    def _get_h3_cover(self, geometry, resolution):
+        cells = set()
+        for polygon in get_polygons(geometry):
+            rings = [[pair[:2] for pair in ring] for ring in polygon]
+            if hasattr(self.h3, 'geo_to_cells'):
+                cells.update(self.h3.geo_to_cells({
+                    'type': 'Polygon',
+                    'coordinates': rings
+                }, resolution))
+            else:
+                # h3 < 4
+                cells.update(self.h3.polyfill({
+                    'type': 'Polygon',
+                    'coordinates': rings
+                }, resolution, geo_json_conformant=True))
+        return cells
+
+    def get_cells(self, point, geometry):
+        """Get the cell keys of a location
+
+        :param point: (lon, lat) point of the location or None
+        :param geometry: Geometry object of the location or None
+        :returns: Cell key attributes
+        :rtype: dict
+        """
+        if not point:
+            point = get_center(geometry)
+        if not point:
+            return {}
+
+        lon, lat = point
+        geohash = encode_geohash(lon, lat, max(self.precisions))
+        cells = {
+            'geohash': [geohash[:precision] for precision in self.precisions],
+            'geohashCells': get_covering_geohashes(
+                geometry, self.cover_precision, self.max_cover_cells
+            )
+        }
+
+        if self.h3:
+            h3_cells = set(
+                self._get_h3_cell(lon, lat, resolution)
+                for resolution in self.h3_resolutions
+            )
+            if self.h3_cover_resolution is not None:
+                h3_cells.update(
+                    self._get_h3_cover(geometry, self.h3_cover_resolution)
+                )
+            cells['h3Cells'] = sorted(h3_cells)
+        return cells
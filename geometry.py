@@ -0,0 +1,339 @@
+import heapq
+import json
+import math
+
+
+# Approximate length in meters of a degree of latitude and of longitude at
+# the equator, enough for campus-sized geometries
+METERS_PER_DEGREE_LAT = 110540
+METERS_PER_DEGREE_LON = 111320
+
+SIMPLIFICATIONS = ['douglas-peucker', 'visvalingam']
+
+
+def _to_meters(ring):
+    """Helper function to project a lon/lat ring onto a local plane in meters
+
+    :param ring: List of [lon, lat, ...] pairs
+    :returns: List of (x, y) points in meters
+    :rtype: list
+    """
+    origin_lat = math.radians(ring[0][1])
+    lon_scale = METERS_PER_DEGREE_LON * math.cos(origin_lat)
+    return [
+        (pair[0] * lon_scale, pair[1] * METERS_PER_DEGREE_LAT)
+        for pair in ring
+    ]
+
+
+def _segment_distance(point, start, end):
+    """Helper function to get the distance of a point to a segment
+
+    :param point: Point
+    :param start: Segment start point
+    :param end: Segment end point
+    :returns: Distance
+    :rtype: float
+    """
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = dx * dx + dy * dy
+    if length:
+        ratio = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy)
+        ratio = max(0.0, min(1.0, ratio / length))
+        x, y = start[0] + ratio * dx, start[1] + ratio * dy
+    else:
+        x, y = start
+    return math.hypot(point[0] - x, point[1] - y)
+
+
+def _triangle_area(a, b, c):
+    return abs(
+        (b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])
+    ) / 2
+
+
+def douglas_peucker(points, tolerance):
+    """Select the vertices to keep with the Douglas-Peucker algorithm
+
+    :param points: List of (x, y) points in meters
+    :param tolerance: Maximum distance in meters of a removed vertex to the
+                      simplified line
+    :returns: Whether to keep each vertex
+    :rtype: list
+    """
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        max_distance, index = 0.0, None
+        for i in range(start + 1, end):
+            distance = _segment_distance(points[i], points[start], points[end])
+            if distance > max_distance:
+                max_distance, index = distance, i
+
+        if index is not None and max_distance > tolerance:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return keep
+
+
+def visvalingam(points, tolerance):
+    """Select the vertices to keep with the Visvalingam-Whyatt algorithm
+
+    :param points: List of (x, y) points in meters
+    :param tolerance: Vertices whose triangle is smaller than the square of
+                      the tolerance in meters are removed
+    :returns: Whether to keep each vertex
+    :rtype: list
+    """
+    count = len(points)
+    keep = [True] * count
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    areas = [math.inf] * count
+    min_area = tolerance * tolerance
+
+    heap = []
+    for i in range(1, count - 1):
+        areas[i] = _triangle_area(points[i - 1], points[i], points[i + 1])
+        heap.append((areas[i], i))
+    heapq.heapify(heap)
+
+    while heap:
+        area, i = heapq.heappop(heap)
+        # Skip removed vertices and outdated areas
+        if not keep[i] or area != areas[i]:
+            continue
+        if area >= min_area:
+            break
+
+        keep[i] = False
+        before, after = previous[i], following[i]
+        following[before], previous[after] = after, before
+
+        for j in (before, after):
+            if 0 < j < count - 1:
+                # The area of a neighbour never drops below the removed one
+                areas[j] = max(area, _triangle_area(
+                    points[previous[j]], points[j], points[following[j]]
+                ))
+                heapq.heappush(heap, (areas[j], j))
+
+    return keep
+
+
+class GeometrySimplifier:
+    """
+    Post-projection reduction of polygon geometries: simplification,
+    coordinate rounding and duplicate vertex removal
+    """
+    def __init__(self, config):
+        """
+        :param config: Geometry config object with the optional keys
+                       simplification, tolerance (meters), precision
+                       (decimals) and removeDuplicates
+        """
+        self.simplification = config.get('simplification')
+        self.tolerance = config.get('tolerance', 0)
+        self.precision = config.get('precision')
+        self.remove_duplicates = config.get('removeDuplicates', False)
+
+        if (
+            self.simplification
+            and self.simplification not in SIMPLIFICATIONS
+        ):
+            raise ValueError(
+                f'{self.simplification} is not a supported simplification.'
+            )
+
+    def _simplify_ring(self, ring):
+        """Reduce a single ring
+
+        :param ring: List of [lon, lat, ...] pairs
+        :returns: Reduced ring
+        :rtype: list
+        """
+        if self.simplification and self.tolerance and len(ring) > 4:
+            algorithm = (
+                douglas_peucker
+                if self.simplification == 'douglas-peucker'
+                else visvalingam
+            )
+            keep = algorithm(_to_meters(ring), self.tolerance)
+            # A closed ring needs at least 4 vertices, keep it as it is
+            if sum(keep) >= 4:
+                ring = [pair for pair, kept in zip(ring, keep) if kept]
+
+        if self.precision is not None:
+            ring = [
+                [round(value, self.precision) for value in pair]
+                for pair in ring
+            ]
+
+        if self.remove_duplicates:
+            deduplicated = ring[:1]
+            for pair in ring[1:]:
+                if pair[:2] != deduplicated[-1][:2]:
+                    deduplicated.append(pair)
+            if len(deduplicated) >= 4:
+                ring = deduplicated
+
+        return ring
+
+    def simplify(self, geometry_type, coordinates):
+        """Reduce the coordinates of a converted geometry
+
+        :param geometry_type: Polygon, MultiPolygon or rings
+        :param coordinates: Converted coordinates
+        :returns: Reduced coordinates
+        :rtype: list
+        """
+        if geometry_type == 'MultiPolygon':
+            return [
+                [self._simplify_ring(ring) for ring in polygon]
+                for polygon in coordinates
+            ]
+        return [self._simplify_ring(ring) for ring in coordinates]
+
+
+def get_encoded_size(coordinates):
+    """Helper function to get the size of coordinates in the JSON artifact
+
+    :param coordinates: Coordinates
+    :returns: Encoded size in bytes
+    :rtype: int
+    """
+    return len(json.dumps(coordinates))
+
+
+class LocalProjection:
+    """
+    Equirectangular projection of lon/lat onto a local plane in meters
+    """
+    def __init__(self, origin_lat):
+        """
+        :param origin_lat: Latitude where the projection is exact
+        """
+        self.lon_scale = METERS_PER_DEGREE_LON * math.cos(
+            math.radians(origin_lat)
+        )
+
+    def project(self, lon, lat):
+        """Project a lon/lat pair
+
+        :param lon: Longitude
+        :param lat: Latitude
+        :returns: (x, y) point in meters
+        :rtype: tuple
+        """
+        return lon * self.lon_scale, lat * METERS_PER_DEGREE_LAT
+
+    def project_bounds(self, bounds):
+        """Project lon/lat bounds
+
+        :param bounds: (min_lon, min_lat, max_lon, max_lat) bounds
+        :returns: (min_x, min_y, max_x, max_y) bounds in meters
+        :rtype: tuple
+        """
+        return self.project(*bounds[:2]) + self.project(*bounds[2:])
+
+
+def get_polygons(geometry):
+    """Helper function to get the rings of each polygon of a geometry
+
+    :param geometry: Geometry object of a location
+    :returns: List of polygons, each one a list of rings
+    :rtype: list
+    """
+    if not geometry or not geometry.get('coordinates'):
+        return []
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    # Polygon and Esri rings both are a list of rings
+    return [geometry['coordinates']]
+
+
+def get_bounds(geometry):
+    """Helper function to get the bounds of a geometry
+
+    :param geometry: Geometry object of a location
+    :returns: (min_lon, min_lat, max_lon, max_lat) bounds or None if empty
+    :rtype: tuple
+    """
+    lons, lats = [], []
+    for polygon in get_polygons(geometry):
+        for ring in polygon:
+            for pair in ring:
+                lons.append(pair[0])
+                lats.append(pair[1])
+    if not lons:
+        return None
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def get_center(geometry):
+    """Helper function to get a representative point of a geometry, the
+    vertex average of its first outer ring
+
+    :param geometry: Geometry object of a location
+    :returns: (lon, lat) point or None if empty
+    :rtype: tuple
+    """
+    polygons = get_polygons(geometry)
+    if not polygons or not polygons[0]:
+        return None
+    # Closed rings repeat their first vertex at the end
+    ring = polygons[0][0][:-1] or polygons[0][0]
+    return (
+        sum(pair[0] for pair in ring) / len(ring),
+        sum(pair[1] for pair in ring) / len(ring)
+    )
+
+
+def contains_point(geometry, point):
+    """Helper function to check if a geometry contains a point with the
+    even-odd rule, so holes are excluded
+
+    :param geometry: Geometry object of a location
+    :param point: (lon, lat) point
+    :returns: Whether the point is inside the geometry
+    :rtype: bool
+    """
+    x, y = point
+    for polygon in get_polygons(geometry):
+        inside = False
+        for ring in polygon:
+            for (x1, y1), (x2, y2) in zip(
+                (pair[:2] for pair in ring),
+                (pair[:2] for pair in ring[1:] + ring[:1])
+            ):
+                if (y1 > y) != (y2 > y):
+                    if x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                        inside = not inside
+        if inside:
+            return True
+    return False
+
+
+def get_distance(geometry, point, projection):
+    """Helper function to get the distance of a point to the boundary of a
+    geometry
+
+    :param geometry: Geometry object of a location
+    :param point: (lon, lat) point
+    :param projection: LocalProjection to measure the distance in meters
+    :returns: Distance in meters
+    :rtype: float
+    """
+    target = projection.project(*point)
+    distance = math.inf
+    for polygon in get_polygons(geometry):
+        for ring in polygon:
+            points = [projection.project(*pair[:2]) for pair in ring]
+            for start, end in zip(points, points[1:]):
+                distance = min(distance, _segment_distance(target, start, end))
+    return distance
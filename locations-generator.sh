@@ -7,11 +7,6 @@ set -e
 config=$1
 
 echo "*************************************"
-echo "Building locations artifact..."
+echo "Building locations artifact and updating data to AWS Elasticsearch..."
 echo "*************************************"
-python3.9 build_artifacts.py --config=$config
-
-echo "*************************************"
-echo "Updating data to AWS Elasticsearch..."
-echo "*************************************"
-python3.9 es_manager.py --config=$config
+python3.9 build_and_publish.py --config=$config
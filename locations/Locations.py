@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 import re
 
+from open_hours import expand_open_hours
+from open_intervals import get_open_intervals, to_date_ranges
 from utils import get_md5_hash
 
 
@@ -8,6 +10,13 @@ class Location(ABC):
     """
     Base location type
     """
+    # Full resolution geometry when the published one is simplified
+    full_geometry = None
+    # Grid cell keys of the location, see geocells.py
+    geo_cells = None
+    # Merged open intervals in epoch seconds, set by build_resource
+    open_intervals = ()
+
     def _init_attributes(self):
         """
         Default attributes of a location. All fields in attributes should be
@@ -55,7 +64,12 @@ class Location(ABC):
             'notes': None,
             'labels': {},
             'steward': None,
-            'shape': {}
+            'shape': {},
+            'geohash': [],
+            'geohashCells': [],
+            'h3Cells': [],
+            'suggest': [],
+            'openIntervals': []
         }
 
     @abstractmethod
@@ -117,14 +131,25 @@ class Location(ABC):
         """
         return get_md5_hash(f'{self.type}{self.get_primary_id()}')
 
-    def build_resource(self, api_base_url):
+    def build_resource(self, api_base_url, slim_open_hours=False):
         """The function to build location resource
 
         :param api_base_url: API base URL
+        :param slim_open_hours: Whether to leave out the null fields of the
+                                open hours events
         :returns: Location resource adhere to JSONAPI convention
         :rtype: dict
         """
         self._set_attributes()
+        if self.geo_cells:
+            self.attr.update(self.geo_cells)
+        # Open hours are kept compact until serialization
+        if self.attr.get('openHours'):
+            self.open_intervals = get_open_intervals(self.attr['openHours'])
+            self.attr['openIntervals'] = to_date_ranges(self.open_intervals)
+            self.attr['openHours'] = expand_open_hours(
+                self.attr['openHours'], slim_open_hours
+            )
         resource_id = self.calculate_hash_id()
         return {
             'id': resource_id,
@@ -271,6 +296,10 @@ class FacilLocation(Location):
             raw_geo['coordinatesType'] if raw_geo else None,
             raw_geo['coordinates'] if raw_geo else None
         )
+        self.full_geometry = self._create_geometry(
+            raw_geo['coordinatesType'] if raw_geo else None,
+            raw_geo.get('fullCoordinates') if raw_geo else None
+        )
         self.gir_count = raw_gir['count'] if raw_gir else 0
         self.gir_limit = bool(raw_gir['limit'].strip()) if raw_gir and raw_gir['limit'] else None
         self.gir_locations = raw_gir['all'].strip() if raw_gir else None
@@ -379,6 +408,10 @@ class FieldLocation(Location):
             geometry.get('type') if geometry else None,
             geometry.get('coordinates') if geometry else None
         )
+        self.full_geometry = self._create_geometry(
+            geometry.get('type') if geometry else None,
+            geometry.get('fullCoordinates') if geometry else None
+        )
         self.merge = False
         self.bldg_id = None
         self.relationships = {'services': {'data': []}}
@@ -447,6 +480,10 @@ class ParkingLocation(Location):
             geometry.get('type') if geometry else None,
             geometry.get('coordinates') if geometry else None
         )
+        self.full_geometry = self._create_geometry(
+            geometry.get('type') if geometry else None,
+            geometry.get('fullCoordinates') if geometry else None
+        )
         self.relationships = {'services': {'data': []}}
         self.merge = False
         self.bldg_id = None
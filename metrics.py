@@ -0,0 +1,556 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+import heapq
+import json
+import logging
+import os
+import resource
+import time
+import tracemalloc
+
+from concurrency import HOST_COUNTERS
+import utils
+
+
+logger = logging.getLogger(__name__)
+
+# Counters every stage reports, in the order they are displayed
+COUNTERS = ['bytes_fetched', 'features_processed', 'geometry_bytes_saved']
+
+# Upper bounds in seconds of the latency histogram buckets of each host
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+def is_failed_request(span):
+    """Helper function to check if a traced request failed
+
+    :param span: Span of the request
+    :returns: Whether no response or a 5xx response was received
+    :rtype: bool
+    """
+    return bool(span['error']) or (span['status'] or 0) >= 500
+
+
+class Metrics:
+    """
+    Per-stage instrumentation of a run: wall time, counters and memory usage
+    """
+    def __init__(self, trace_memory=False, profiler=None,
+                 latency_buckets=None, slowest_requests=10):
+        """
+        :param trace_memory: Whether to track Python allocations with
+                             tracemalloc (slows down allocation-heavy stages)
+        :param profiler: Profiler to notify of entered stages
+        :param latency_buckets: Upper bounds in seconds of the latency
+                                histogram buckets, defaults to LATENCY_BUCKETS
+        :param slowest_requests: Number of the slowest requests reported
+        """
+        self.trace_memory = trace_memory
+        self.profiler = profiler
+        self.latency_buckets = sorted(latency_buckets or LATENCY_BUCKETS)
+        self.slowest_requests = slowest_requests
+        self.started_at = datetime.utcnow()
+        self._start = time.perf_counter()
+        self.stages = {}
+        # Requests and concurrency decisions of each upstream host
+        self.hosts = {}
+        # Latency histogram of the traced requests of each host, and the
+        # slowest of them
+        self.requests = {}
+        self.slowest = []
+        self._active = []
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def from_config(cls, config, trace_memory=False, profiler=None):
+        """Create the metrics of a run with the tracing config
+
+        :param config: Config object
+        :param trace_memory: Whether to track Python allocations
+        :param profiler: Profiler to notify of entered stages
+        :returns: Metrics instance
+        :rtype: Metrics
+        """
+        tracing_config = config.get('tracing', {})
+        return cls(
+            trace_memory=trace_memory,
+            profiler=profiler,
+            latency_buckets=tracing_config.get('latencyBuckets'),
+            slowest_requests=tracing_config.get('slowestRequests', 10)
+        )
+
+    def _get_stage(self, name):
+        """The helper function to get or create the record of a stage
+
+        :param name: Stage name
+        :returns: Stage record
+        :rtype: dict
+        """
+        if name not in self.stages:
+            self.stages[name] = {
+                'wall_time_seconds': 0.0,
+                'bytes_fetched': 0,
+                'features_processed': 0,
+                'geometry_bytes_saved': 0,
+                # Peak RSS of the process so far when the stage ended, not
+                # of the stage alone
+                'process_peak_rss_bytes': 0,
+                'tracemalloc_delta_bytes': None,
+                'tracemalloc_peak_bytes': None
+            }
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        """A context manager to measure a stage of the run. Entering the same
+        stage several times accumulates its wall time and counters.
+
+        :param name: Stage name
+        """
+        record = self._get_stage(name)
+        parent = self._active[-1] if self._active else None
+
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # Keep the peak seen so far by the enclosing stage before reset
+            if parent:
+                parent['_peak'] = max(parent.get('_peak', 0), peak)
+            tracemalloc.reset_peak()
+            record['_start_memory'] = current
+
+        self._active.append(record)
+        start = time.perf_counter()
+        try:
+            if self.profiler:
+                with self.profiler.stage(name):
+                    yield record
+            else:
+                yield record
+        finally:
+            record['wall_time_seconds'] += time.perf_counter() - start
+            self._active.pop()
+            record['process_peak_rss_bytes'] = get_peak_rss()
+
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, record.pop('_peak', 0))
+                start_memory = record.pop('_start_memory')
+                record['tracemalloc_delta_bytes'] = (
+                    (record['tracemalloc_delta_bytes'] or 0)
+                    + current - start_memory
+                )
+                record['tracemalloc_peak_bytes'] = max(
+                    record['tracemalloc_peak_bytes'] or 0,
+                    peak - start_memory
+                )
+                if parent:
+                    parent['_peak'] = max(parent.get('_peak', 0), peak)
+
+    def increment(self, counter, value=1, stage=None):
+        """Increase a counter of a stage
+
+        :param counter: Counter name, one of COUNTERS
+        :param value: Value to be added
+        :param stage: Stage name, defaults to the innermost active stage
+        """
+        if counter not in COUNTERS:
+            raise KeyError(f'{counter} is not defined in stage counters.')
+
+        if stage:
+            record = self._get_stage(stage)
+        elif self._active:
+            record = self._active[-1]
+        else:
+            logger.debug(f'Dropping {counter} {value} outside of any stage')
+            return
+        record[counter] += value
+
+    def merge_stage(self, name, record):
+        """Add the record of a stage measured in another process, e.g. a
+        worker of the transformation pool
+
+        :param name: Stage name
+        :param record: Stage record of the other process
+        """
+        merged = self._get_stage(name)
+        merged['wall_time_seconds'] += record['wall_time_seconds']
+        for counter in COUNTERS:
+            merged[counter] += record[counter]
+        merged['process_peak_rss_bytes'] = max(
+            merged['process_peak_rss_bytes'],
+            record['process_peak_rss_bytes']
+        )
+        for key in ['tracemalloc_delta_bytes', 'tracemalloc_peak_bytes']:
+            if record[key] is not None:
+                merged[key] = (merged[key] or 0) + record[key]
+
+    def merge_host(self, host, record):
+        """Add the requests of an upstream host, e.g. from
+        AdaptiveFetcher.pop_stats of this or another process
+
+        :param host: Host name
+        :param record: Host record
+        """
+        if host not in self.hosts:
+            self.hosts[host] = {
+                **{counter: 0 for counter in HOST_COUNTERS},
+                'concurrency': None,
+                'max_concurrency': 0,
+                'decisions': []
+            }
+        merged = self.hosts[host]
+        for counter in HOST_COUNTERS:
+            merged[counter] += record[counter]
+        merged['concurrency'] = record['concurrency']
+        merged['max_concurrency'] = max(
+            merged['max_concurrency'], record['max_concurrency']
+        )
+        merged['decisions'] += record['decisions']
+
+    def merge_spans(self, spans):
+        """Add the requests traced by a Tracer to the latency histograms and
+        the slowest requests
+
+        :param spans: Spans of the requests
+        """
+        traced = []
+        for span in spans:
+            # Streamed bodies which were never closed end with their headers
+            seconds = span['total_seconds'] or span['ttfb_seconds']
+            if seconds is None:
+                continue
+            traced.append((seconds, span))
+
+            if span['host'] not in self.requests:
+                self.requests[span['host']] = {
+                    'requests': 0,
+                    'failures': 0,
+                    'sum_seconds': 0.0,
+                    'buckets': [0] * (len(self.latency_buckets) + 1)
+                }
+            record = self.requests[span['host']]
+            record['requests'] += 1
+            record['failures'] += is_failed_request(span)
+            record['sum_seconds'] += seconds
+            record['buckets'][bisect_left(self.latency_buckets, seconds)] += 1
+
+        self.slowest = heapq.nlargest(
+            self.slowest_requests,
+            self.slowest + traced,
+            key=lambda item: item[0]
+        )
+
+    def to_dict(self):
+        """Export the collected metrics
+
+        :returns: Metrics object
+        :rtype: dict
+        """
+        stages = {}
+        for name, record in self.stages.items():
+            stages[name] = {
+                'wallTimeSeconds': round(record['wall_time_seconds'], 6),
+                'bytesFetched': record['bytes_fetched'],
+                'featuresProcessed': record['features_processed'],
+                'geometryBytesSaved': record['geometry_bytes_saved'],
+                'processPeakRssBytes': record['process_peak_rss_bytes'],
+                'tracemallocDeltaBytes': record['tracemalloc_delta_bytes'],
+                'tracemallocPeakBytes': record['tracemalloc_peak_bytes']
+            }
+
+        hosts = {}
+        for host, record in self.hosts.items():
+            hosts[host] = {
+                'requests': record['requests'],
+                'retries': record['retries'],
+                'throttled': record['throttled'],
+                'serverErrors': record['server_errors'],
+                'failures': record['failures'],
+                'increases': record['increases'],
+                'decreases': record['decreases'],
+                'concurrency': record['concurrency'],
+                'maxConcurrency': record['max_concurrency'],
+                'decisions': record['decisions']
+            }
+
+        requests = {}
+        for host, record in self.requests.items():
+            bounds = self.latency_buckets + ['+Inf']
+            requests[host] = {
+                'requests': record['requests'],
+                'failures': record['failures'],
+                'sumSeconds': round(record['sum_seconds'], 6),
+                'latencyBuckets': [
+                    {'le': bound, 'count': count}
+                    for bound, count in zip(bounds, record['buckets'])
+                ]
+            }
+
+        slowest = []
+        for seconds, span in self.slowest:
+            slowest.append({
+                'method': span['method'],
+                'url': span['url'],
+                'status': span['status'],
+                'bytes': span['bytes'],
+                'connectSeconds': _round(span['connect_seconds']),
+                'ttfbSeconds': _round(span['ttfb_seconds']),
+                'totalSeconds': _round(seconds),
+                'error': span['error']
+            })
+
+        return {
+            'startedAt': utils.to_utc_string(self.started_at),
+            'wallTimeSeconds': round(time.perf_counter() - self._start, 6),
+            'peakRssBytes': get_peak_rss(),
+            'stages': stages,
+            'hosts': hosts,
+            'requests': requests,
+            'slowestRequests': slowest
+        }
+
+    def summary_table(self):
+        """Render the collected metrics as a table
+
+        :returns: Table string
+        :rtype: str
+        """
+        from tabulate import tabulate
+
+        def _to_mb(value):
+            return None if value is None else round(value / 1024 ** 2, 2)
+
+        table = []
+        total = {counter: 0 for counter in COUNTERS}
+        for name, record in self.stages.items():
+            table.append([
+                name,
+                round(record['wall_time_seconds'], 3),
+                record['bytes_fetched'],
+                record['features_processed'],
+                record['geometry_bytes_saved'],
+                _to_mb(record['process_peak_rss_bytes']),
+                _to_mb(record['tracemalloc_delta_bytes']),
+                _to_mb(record['tracemalloc_peak_bytes'])
+            ])
+            for key in total:
+                total[key] += record[key]
+        table.append([
+            'total',
+            round(time.perf_counter() - self._start, 3),
+            total['bytes_fetched'],
+            total['features_processed'],
+            total['geometry_bytes_saved'],
+            _to_mb(get_peak_rss()),
+            None,
+            None
+        ])
+
+        return tabulate(
+            table,
+            headers=[
+                'Stage',
+                'Wall Time (s)',
+                'Bytes Fetched',
+                'Features',
+                'Geometry Saved (bytes)',
+                'Process Peak RSS (MB)',
+                'Alloc Delta (MB)',
+                'Alloc Peak (MB)'
+            ],
+            tablefmt='fancy_grid'
+        )
+
+    def hosts_table(self):
+        """Render the requests of the upstream hosts as a table
+
+        :returns: Table string
+        :rtype: str
+        """
+        from tabulate import tabulate
+
+        table = []
+        for host, record in self.hosts.items():
+            table.append(
+                [host]
+                + [record[counter] for counter in HOST_COUNTERS]
+                + [record['concurrency'], record['max_concurrency']]
+            )
+
+        return tabulate(
+            table,
+            headers=[
+                'Host',
+                'Requests',
+                'Retries',
+                '429',
+                '5xx',
+                'Failures',
+                'Increases',
+                'Decreases',
+                'Concurrency',
+                'Max Concurrency'
+            ],
+            tablefmt='fancy_grid'
+        )
+
+    def latency_table(self):
+        """Render the latency histograms of the traced requests of each host
+        as a table
+
+        :returns: Table string
+        :rtype: str
+        """
+        from tabulate import tabulate
+
+        table = []
+        for host, record in self.requests.items():
+            table.append(
+                [
+                    host,
+                    record['requests'],
+                    record['failures'],
+                    round(record['sum_seconds'] / record['requests'], 3)
+                ]
+                + record['buckets']
+            )
+
+        return tabulate(
+            table,
+            headers=(
+                ['Host', 'Requests', 'Failures', 'Mean (s)']
+                + [f'<= {bound} s' for bound in self.latency_buckets]
+                + [f'> {self.latency_buckets[-1]} s']
+            ),
+            tablefmt='fancy_grid'
+        )
+
+    def slowest_table(self):
+        """Render the slowest traced requests as a table
+
+        :returns: Table string
+        :rtype: str
+        """
+        from tabulate import tabulate
+
+        table = []
+        for seconds, span in self.slowest:
+            table.append([
+                span['method'],
+                span['url'],
+                span['error'] or span['status'],
+                span['bytes'],
+                _round(span['connect_seconds'], 3),
+                _round(span['ttfb_seconds'], 3),
+                round(seconds, 3)
+            ])
+
+        return tabulate(
+            table,
+            headers=[
+                'Method',
+                'URL',
+                'Status',
+                'Bytes',
+                'Connect (s)',
+                'TTFB (s)',
+                'Total (s)'
+            ],
+            tablefmt='fancy_grid'
+        )
+
+    def write_json(self, file_name):
+        """Write the collected metrics to a JSON file
+
+        :param file_name: Output file name
+        """
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def write_prometheus(self, file_name, prefix='locations_generator'):
+        """Write the collected metrics in Prometheus text exposition format
+
+        :param file_name: Output file name
+        :param prefix: Metric name prefix
+        """
+        metric_types = [
+            ('wall_time_seconds', 'Wall time spent in the stage'),
+            ('bytes_fetched', 'Bytes fetched from upstream in the stage'),
+            ('features_processed', 'Features processed in the stage'),
+            ('geometry_bytes_saved', 'Geometry bytes saved in the stage'),
+            ('process_peak_rss_bytes',
+             'Peak resident set size of the process when the stage ended'),
+            ('tracemalloc_delta_bytes', 'Net Python allocations of the stage'),
+            ('tracemalloc_peak_bytes', 'Peak Python allocations of the stage')
+        ]
+
+        lines = []
+        for key, description in metric_types:
+            metric = f'{prefix}_stage_{key}'
+            samples = [
+                f'{metric}{{stage="{name}"}} {record[key]}'
+                for name, record in self.stages.items()
+                if record[key] is not None
+            ]
+            if samples:
+                lines.append(f'# HELP {metric} {description}')
+                lines.append(f'# TYPE {metric} gauge')
+                lines += samples
+
+        for key in HOST_COUNTERS + ['concurrency', 'max_concurrency']:
+            metric = f'{prefix}_host_{key}'
+            samples = [
+                f'{metric}{{host="{host}"}} {record[key]}'
+                for host, record in self.hosts.items()
+            ]
+            if samples:
+                lines.append(f'# HELP {metric} Upstream host {key}')
+                lines.append(f'# TYPE {metric} gauge')
+                lines += samples
+
+        metric = f'{prefix}_request_duration_seconds'
+        if self.requests:
+            lines.append(
+                f'# HELP {metric} Duration of the upstream host requests'
+            )
+            lines.append(f'# TYPE {metric} histogram')
+        for host, record in self.requests.items():
+            bounds = self.latency_buckets + ['+Inf']
+            count = 0
+            for bound, bucket_count in zip(bounds, record['buckets']):
+                count += bucket_count
+                lines.append(
+                    f'{metric}_bucket{{host="{host}",le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{metric}_sum{{host="{host}"}} {record["sum_seconds"]}'
+            )
+            lines.append(f'{metric}_count{{host="{host}"}} {count}')
+
+        metric = f'{prefix}_peak_rss_bytes'
+        lines.append(f'# HELP {metric} Peak resident set size of the run')
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric} {get_peak_rss()}')
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as file:
+            file.write('\n'.join(lines))
+            file.write('\n')
+
+
+def _round(value, digits=6):
+    return None if value is None else round(value, digits)
+
+
+def get_peak_rss():
+    """Helper function to get the peak resident set size of the process
+
+    :returns: Peak RSS in bytes
+    :rtype: int
+    """
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,159 @@
+from datetime import datetime, time, timedelta, timezone
+from functools import lru_cache
+import sys
+
+import utils
+
+
+# Fields of an open hours event, in the order they are stored
+EVENT_FIELDS = [
+    'summary',
+    'uid',
+    'start',
+    'end',
+    'sequence',
+    'recurrenceId',
+    'lastModified'
+]
+
+
+def to_epoch(dt):
+    """Helper function to get the epoch seconds of a datetime object, taken
+    as UTC like utils.to_utc_string does
+
+    :param dt: Datetime or date object
+    :returns: Epoch seconds
+    :rtype: int
+    """
+    if not isinstance(dt, datetime):
+        dt = datetime.combine(dt, time())
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+@lru_cache(maxsize=4096)
+def to_utc_string(epoch):
+    """Helper function to stringify epoch seconds to UTC datetime string.
+    Events of the same calendar often share their times, so it is cached.
+
+    :param epoch: Epoch seconds
+    :returns: UTC date string
+    :rtype: str
+    """
+    return utils.to_utc_string(datetime.fromtimestamp(epoch, timezone.utc))
+
+
+class WeekDays:
+    """
+    Date keys of the days of a run, computed once and shared by the open
+    hours of every location
+    """
+    def __init__(self, first_day, days=7):
+        """
+        :param first_day: Date of the first day
+        :param days: Number of days
+        """
+        self.first_day = first_day
+        self.keys = tuple(
+            sys.intern(utils.to_date(first_day + timedelta(days=day)))
+            for day in range(days)
+        )
+
+    def get_index(self, dt):
+        """Get the index of the day of a datetime object
+
+        :param dt: Datetime or date object
+        :returns: Day index or None if outside of the days
+        :rtype: int
+        """
+        if isinstance(dt, datetime):
+            dt = dt.date()
+        index = (dt - self.first_day).days
+        return index if 0 <= index < len(self.keys) else None
+
+
+class OpenHours:
+    """
+    Compact open hours of a location: a list of events for each day of a
+    WeekDays, each event a tuple of EVENT_FIELDS with epoch seconds for its
+    start and end. It is only expanded to the resource shape on serialization.
+    """
+    __slots__ = ('week_days', 'days')
+
+    def __init__(self, week_days):
+        """
+        :param week_days: WeekDays the open hours cover
+        """
+        self.week_days = week_days
+        self.days = [[] for _ in week_days.keys]
+
+    def add_event(self, start, end, summary, uid, sequence=None,
+                  recurrence_id=None, last_modified=None):
+        """Add an event on the day it starts, if that day is covered
+
+        :param start: Start datetime, in UTC
+        :param end: End datetime, in UTC
+        :param summary: Summary string
+        :param uid: UID string
+        :param sequence: Sequence number
+        :param recurrence_id: Recurrence ID
+        :param last_modified: Last modification
+        :returns: Whether the event was added
+        :rtype: bool
+        """
+        index = self.week_days.get_index(start)
+        if index is None:
+            return False
+
+        self.days[index].append((
+            sys.intern(summary),
+            sys.intern(uid),
+            to_epoch(start),
+            to_epoch(end),
+            sequence,
+            recurrence_id,
+            last_modified
+        ))
+        return True
+
+    def to_dict(self, slim=False):
+        """Expand the open hours to the resource shape
+
+        :param slim: Whether to leave out the null fields of the events
+        :returns: List of events keyed by date string
+        :rtype: dict
+        """
+        open_hours = {}
+        for key, events in zip(self.week_days.keys, self.days):
+            open_hours[key] = []
+            for event in events:
+                values = list(event)
+                values[2] = to_utc_string(values[2])
+                values[3] = to_utc_string(values[3])
+                open_hours[key].append({
+                    field: value
+                    for field, value in zip(EVENT_FIELDS, values)
+                    if not (slim and value is None)
+                })
+        return open_hours
+
+
+def expand_open_hours(open_hours, slim=False):
+    """Helper function to expand the open hours of a location to the resource
+    shape
+
+    :param open_hours: OpenHours, or the open hours of the library which are
+                       a single event keyed by date string
+    :param slim: Whether to leave out the null fields of the events
+    :returns: Open hours keyed by date string
+    :rtype: dict
+    """
+    if isinstance(open_hours, OpenHours):
+        return open_hours.to_dict(slim)
+    if not slim or not open_hours:
+        return open_hours
+    return {
+        key: {
+            field: value for field, value in event.items() if value is not None
+        } if isinstance(event, dict) else event
+        for key, event in open_hours.items()
+    }
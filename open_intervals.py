@@ -0,0 +1,201 @@
+"""
+Merged open intervals of the locations and a global index of them, so what
+is open at a given time is found by binary search instead of walking the
+open hours of every location:
+
+    $ python open_intervals.py build/open-intervals.json
+    $ python open_intervals.py build/open-intervals.json \
+        --at=2019-09-02T17:00:00Z
+"""
+import argparse
+from bisect import bisect_right
+from datetime import datetime, timezone
+import json
+import time
+
+from open_hours import OpenHours, to_utc_string
+
+
+FORMAT_VERSION = 1
+
+
+def _parse_utc_string(value):
+    dt = datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def merge_intervals(intervals):
+    """Helper function to merge overlapping and adjacent intervals
+
+    :param intervals: Iterable of (start, end) epoch seconds
+    :returns: Sorted disjoint intervals
+    :rtype: list
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            # Closed days of the library hours start and end at midnight
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def get_open_intervals(open_hours):
+    """Helper function to get the merged open intervals of a location
+
+    :param open_hours: OpenHours, or open hours keyed by date string with a
+                       list of events or a single event for each day
+    :returns: Sorted disjoint (start, end) epoch seconds
+    :rtype: list
+    """
+    if not open_hours:
+        return []
+    if isinstance(open_hours, OpenHours):
+        return merge_intervals(
+            (event[2], event[3])
+            for events in open_hours.days
+            for event in events
+        )
+
+    intervals = []
+    for events in open_hours.values():
+        if isinstance(events, dict):
+            events = [events]
+        for event in events:
+            intervals.append((
+                _parse_utc_string(event['start']),
+                _parse_utc_string(event['end'])
+            ))
+    return merge_intervals(intervals)
+
+
+def to_date_ranges(intervals):
+    """Helper function to get the value of a date_range field
+
+    :param intervals: (start, end) epoch seconds
+    :returns: Ranges including their start and excluding their end
+    :rtype: list
+    """
+    return [
+        {'gte': to_utc_string(start), 'lt': to_utc_string(end)}
+        for start, end in intervals
+    ]
+
+
+class OpenIntervalIndex:
+    """
+    Global index of the open intervals of the locations. The boundaries of
+    all the intervals split time into sorted segments, and the IDs open
+    during each segment are stored once, so a lookup is a binary search over
+    the boundaries.
+    """
+    def __init__(self, ids, times, segments):
+        """
+        :param ids: Location IDs
+        :param times: Sorted boundaries in epoch seconds
+        :param segments: Indices into ids of the locations open from each
+                         boundary to the next one
+        """
+        self.ids = ids
+        self.times = times
+        self.segments = segments
+
+    @classmethod
+    def build(cls, intervals):
+        """Build the index of the open intervals of the locations
+
+        :param intervals: Merged open intervals keyed by location ID
+        :returns: Index
+        :rtype: OpenIntervalIndex
+        """
+        ids = sorted(intervals)
+        changes = {}
+        for index, location_id in enumerate(ids):
+            for start, end in intervals[location_id]:
+                changes.setdefault(start, []).append((index, True))
+                changes.setdefault(end, []).append((index, False))
+
+        times = sorted(changes)
+        segments = []
+        open_ids = set()
+        for boundary in times:
+            for index, is_opening in changes[boundary]:
+                if is_opening:
+                    open_ids.add(index)
+                else:
+                    open_ids.discard(index)
+            segments.append(sorted(open_ids))
+        return cls(ids, times, segments)
+
+    @classmethod
+    def load(cls, file_name):
+        """Load an index written by write
+
+        :param file_name: Index file name
+        :returns: Index
+        :rtype: OpenIntervalIndex
+        """
+        with open(file_name) as file:
+            index = json.load(file)
+        if index['version'] != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported open intervals version {index['version']}."
+            )
+        return cls(index['ids'], index['times'], index['segments'])
+
+    def open_at(self, timestamp):
+        """Get the IDs of the locations open at a time
+
+        :param timestamp: Epoch seconds
+        :returns: Location IDs
+        :rtype: list
+        """
+        position = bisect_right(self.times, timestamp) - 1
+        if position < 0:
+            return []
+        return [self.ids[index] for index in self.segments[position]]
+
+    def write(self, file_name, intervals):
+        """Write the index and the intervals of each location
+
+        :param file_name: Index file name
+        :param intervals: Merged open intervals keyed by location ID
+        """
+        with open(file_name, 'w') as file:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'locations': intervals,
+                'ids': self.ids,
+                'times': self.times,
+                'segments': self.segments
+            }, file)
+
+
+def parse_arguments():
+    """Helper function for parsing command-line arguments
+
+    :returns: Parsed arguments
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('file', help='Open intervals file')
+    parser.add_argument(
+        '--at',
+        help='UTC time, e.g. 2019-09-02T17:00:00Z, now if not set')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+
+    timestamp = (
+        _parse_utc_string(arguments.at) if arguments.at else int(time.time())
+    )
+    for location_id in OpenIntervalIndex.load(arguments.file).open_at(
+        timestamp
+    ):
+        print(location_id)
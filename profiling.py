@@ -0,0 +1,138 @@
+import cProfile
+from contextlib import contextmanager
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ['cprofile', 'pyinstrument']
+
+
+class Profiler:
+    """
+    Opt-in profiler for a whole run or for a single named stage of it
+    """
+    def __init__(self, name, kind=None, stage=None, output_folder='build'):
+        """
+        :param name: Name of the profiled script, used for the output file
+        :param kind: Profiler to use, one of PROFILERS. Profiling is disabled
+                     if not set.
+        :param stage: Only profile the stage with this name if set
+        :param output_folder: Folder to write the profile to
+        """
+        if kind and kind not in PROFILERS:
+            raise ValueError(f'{kind} is not a supported profiler.')
+
+        self.name = name
+        self.kind = kind
+        self.stage_name = stage
+        self.output_folder = output_folder
+        self._depth = 0
+        self._profiler = None
+
+        if self.kind == 'cprofile':
+            self._profiler = cProfile.Profile()
+        elif self.kind == 'pyinstrument':
+            # Only required when pyinstrument profiling is requested
+            from pyinstrument import Profiler as PyinstrumentProfiler
+            self._profiler = PyinstrumentProfiler()
+
+    @classmethod
+    def from_arguments(cls, arguments, name):
+        """Create a profiler from parsed command-line arguments
+
+        :param arguments: Parsed arguments
+        :param name: Name of the profiled script
+        :returns: Profiler instance
+        :rtype: Profiler
+        """
+        return cls(name, arguments.profile, arguments.profile_stage)
+
+    @property
+    def enabled(self):
+        return self._profiler is not None
+
+    def _start(self):
+        if self.kind == 'cprofile':
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def _stop(self):
+        if self.kind == 'cprofile':
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    @contextmanager
+    def stage(self, name):
+        """A context manager to profile a stage if it is the selected one.
+        Time spent in the stage accumulates across repeated entries.
+
+        :param name: Stage name
+        """
+        if not self.enabled or name != self.stage_name:
+            yield
+            return
+
+        # Only the outermost entry of a re-entrant stage toggles the profiler
+        self._depth += 1
+        if self._depth == 1:
+            self._start()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._stop()
+
+    def run(self, function, *args, **kwargs):
+        """Run a function, profiling all of it unless a stage is selected,
+        and write the profile afterwards
+
+        :param function: Function to be run
+        :returns: Return value of the function
+        """
+        if not self.enabled:
+            return function(*args, **kwargs)
+
+        whole_run = self.stage_name is None
+        if whole_run:
+            self._start()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if whole_run:
+                self._stop()
+            self.write()
+
+    def write(self):
+        """Write the collected profile to the output folder. cProfile output
+        is a pstats file (readable by snakeviz, gprof2dot or flameprof) and
+        pyinstrument output is a speedscope flamegraph file.
+
+        :returns: Output file name
+        :rtype: str
+        """
+        suffix = f'-{self.stage_name}' if self.stage_name else ''
+        os.makedirs(self.output_folder, exist_ok=True)
+
+        if self.kind == 'cprofile':
+            output = f'{self.output_folder}/{self.name}{suffix}.prof'
+            self._profiler.dump_stats(output)
+        else:
+            from pyinstrument.renderers import SpeedscopeRenderer
+
+            output = (
+                f'{self.output_folder}/{self.name}{suffix}.speedscope.json'
+            )
+            session = self._profiler.last_session
+            if not session:
+                logger.warning(f'No profile was recorded for {self.name}')
+                return None
+            with open(output, 'w') as file:
+                file.write(SpeedscopeRenderer().render(session))
+
+        logger.info(f'Profile written to {output}')
+        return output
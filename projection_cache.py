@@ -0,0 +1,282 @@
+from array import array
+import hashlib
+import json
+import logging
+import mmap
+import os
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Bytes of a float64 coordinate
+ITEM_SIZE = array('d').itemsize
+
+
+def _flatten(node, values, dims):
+    """Helper function to append the vertices of rings, polygons or
+    multipolygons to a flat array
+
+    :param node: Ring as a list of vertices, or a list of nodes
+    :param values: Array the coordinates are appended to
+    :param dims: Number of coordinates of each vertex
+    :returns: Vertex count of each ring, nested like the node, None if a
+              vertex can't be stored exactly
+    :rtype: list
+    """
+    if node and node[0] and isinstance(node[0][0], list):
+        sizes = []
+        for child in node:
+            child_sizes = _flatten(child, values, dims)
+            if child_sizes is None:
+                return None
+            sizes.append(child_sizes)
+        return sizes
+
+    for vertex in node:
+        # Integers would be read back as floats
+        if len(vertex) != dims or any(
+            type(value) is not float for value in vertex
+        ):
+            return None
+        values.extend(vertex)
+    return len(node)
+
+
+def _flatten_raw(node, values):
+    """Helper function to append the vertices of raw rings, polygons or
+    multipolygons to a flat array
+
+    :param node: Ring as a list of vertices, or a list of nodes
+    :param values: Array the coordinates are appended to
+    :returns: Vertex count of each ring, nested like the node
+    :rtype: list
+    """
+    if node and node[0] and isinstance(node[0][0], list):
+        return [_flatten_raw(child, values) for child in node]
+
+    for vertex in node:
+        values.extend(vertex)
+    return len(node)
+
+
+def _unflatten(sizes, values, position, dims):
+    """Helper function to rebuild the nested coordinates stored by _flatten
+
+    :param sizes: Vertex counts nested like the coordinates
+    :param values: Flat coordinates
+    :param position: Position of the first coordinate in values
+    :param dims: Number of coordinates of each vertex
+    :returns: Coordinates and the position after them
+    :rtype: tuple
+    """
+    if isinstance(sizes, int):
+        end = position + sizes * dims
+        return [
+            values[index:index + dims] for index in range(position, end, dims)
+        ], end
+
+    coordinates = []
+    for child_sizes in sizes:
+        child, position = _unflatten(child_sizes, values, position, dims)
+        coordinates.append(child)
+    return coordinates, position
+
+
+def _get_dims(coordinates):
+    while coordinates and coordinates[0] and isinstance(coordinates[0], list):
+        if not isinstance(coordinates[0][0], list):
+            return len(coordinates[0])
+        coordinates = coordinates[0]
+    return None
+
+
+def _count_values(sizes):
+    if isinstance(sizes, int):
+        return sizes
+    return sum(_count_values(child_sizes) for child_sizes in sizes)
+
+
+class ProjectionCache:
+    """
+    Converted coordinates of the geometries of an ArcGIS layer, kept between
+    runs so the unchanged geometries are not projected again. The coordinates
+    are stored in a flat float64 file which is memory-mapped, with an index of
+    the offset and ring sizes of each geometry keyed by a hash of the
+    projection and the raw coordinates. Only the geometries seen by the last
+    run are kept.
+    """
+    def __init__(self, file_name, projection):
+        """
+        :param file_name: Cache file name, without extension
+        :param projection: Definition of the projection of the raw
+                           coordinates, e.g. the PROJ string
+        """
+        self.values_file = f'{file_name}.f64'
+        self.index_file = f'{file_name}.json'
+        self.projection = projection
+        self.hits = 0
+        self.misses = 0
+        # Offset, dims and ring sizes of the stored geometries, keyed by hash
+        self.entries = {}
+        # Keys of the geometries of this run, stored or new
+        self.used = {}
+        self.new_values = array('d')
+        self._mmap = None
+        self._values = None
+
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as file:
+                index = json.load(file)
+            if (
+                index.get('version') == FORMAT_VERSION
+                and index.get('projection') == projection
+                and os.path.exists(self.values_file)
+                and os.path.getsize(self.values_file) == index['valuesBytes']
+            ):
+                self.entries = index['entries']
+                self._open_values()
+            else:
+                logger.info(f'Ignoring outdated projection cache {file_name}')
+
+    def _open_values(self):
+        if not os.path.getsize(self.values_file):
+            return
+        with open(self.values_file, 'rb') as file:
+            self._mmap = mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        self._values = memoryview(self._mmap).cast('d')
+
+    def close(self):
+        """Unmap the stored coordinates
+        """
+        if self._values is not None:
+            self._values.release()
+            self._values = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def get_key(self, geometry_type, raw_coordinates):
+        """Get the key of a geometry whose vertices are all projected
+
+        :param geometry_type: Geometry type, e.g. Polygon or rings
+        :param raw_coordinates: Coordinates before the conversion
+        :returns: Hash of the projection and the geometry, None if it isn't
+                  two-dimensional or has vertices which are already
+                  longitudes and latitudes
+        :rtype: str
+        """
+        values = array('d')
+        try:
+            sizes = _flatten_raw(raw_coordinates, values)
+        except TypeError:
+            return None
+        if not values or len(values) != 2 * _count_values(sizes):
+            return None
+
+        # Every vertex is converted, so the same coordinates as integers or
+        # floats give the same result
+        xs, ys = values[0::2], values[1::2]
+        if not (
+            min(xs) > 180 or max(xs) < -180 or min(ys) > 90 or max(ys) < -90
+        ):
+            return None
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.projection.encode('utf-8'))
+        digest.update(geometry_type.encode('utf-8'))
+        digest.update(json.dumps(sizes).encode('utf-8'))
+        digest.update(values.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Get the converted coordinates of a geometry
+
+        :param key: Geometry key
+        :returns: Converted coordinates, None if not cached
+        :rtype: list
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.used[key] = entry
+        offset, dims, sizes = entry
+        if offset < 0:
+            # Added by this run
+            values = self.new_values
+            offset = -offset - 1
+        else:
+            values = self._values
+        length = _count_values(sizes) * dims
+        flat = values[offset:offset + length].tolist()
+        return _unflatten(sizes, flat, 0, dims)[0]
+
+    def put(self, key, coordinates):
+        """Store the converted coordinates of a geometry
+
+        :param key: Geometry key
+        :param coordinates: Converted coordinates
+        :returns: Whether they could be stored
+        :rtype: bool
+        """
+        dims = _get_dims(coordinates)
+        if not dims:
+            return False
+        offset = len(self.new_values)
+        sizes = _flatten(coordinates, self.new_values, dims)
+        if sizes is None:
+            del self.new_values[offset:]
+            return False
+        # New coordinates are told apart by a negative offset until saved
+        entry = [-offset - 1, dims, sizes]
+        self.entries[key] = entry
+        self.used[key] = entry
+        return True
+
+    def save(self):
+        """Write the geometries of this run, replacing the previous cache
+        atomically
+        """
+        os.makedirs(
+            os.path.dirname(self.values_file) or '.', exist_ok=True
+        )
+        entries = {}
+        position = 0
+        temporary_file = f'{self.values_file}.tmp'
+        with open(temporary_file, 'wb') as file:
+            for key, (offset, dims, sizes) in self.used.items():
+                length = _count_values(sizes) * dims
+                if offset < 0:
+                    start = -offset - 1
+                    file.write(self.new_values[start:start + length])
+                else:
+                    file.write(self._values[offset:offset + length])
+                entries[key] = [position, dims, sizes]
+                position += length
+        self.close()
+        os.replace(temporary_file, self.values_file)
+
+        temporary_file = f'{self.index_file}.tmp'
+        with open(temporary_file, 'w') as file:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'projection': self.projection,
+                'valuesBytes': position * ITEM_SIZE,
+                'entries': entries
+            }, file)
+        os.replace(temporary_file, self.index_file)
+        logger.info(
+            f'[PROJECTION CACHE] {self.values_file}: {self.hits} hits, '
+            f'{self.misses} misses'
+        )
+
+        self.entries = entries
+        self.used = {}
+        self.new_values = array('d')
+        self._open_values()
@@ -0,0 +1,137 @@
+import heapq
+import math
+
+
+def _merge_bounds(bounds):
+    return (
+        min(bound[0] for bound in bounds),
+        min(bound[1] for bound in bounds),
+        max(bound[2] for bound in bounds),
+        max(bound[3] for bound in bounds)
+    )
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _min_distance(bounds, point):
+    """Helper function to get the minimum distance of a point to a bounding
+    box, zero if the point is inside it
+
+    :param bounds: (min_x, min_y, max_x, max_y) bounds
+    :param point: (x, y) point
+    :returns: Distance
+    :rtype: float
+    """
+    dx = max(bounds[0] - point[0], 0, point[0] - bounds[2])
+    dy = max(bounds[1] - point[1], 0, point[1] - bounds[3])
+    return math.hypot(dx, dy)
+
+
+class STRtree:
+    """
+    Static R-tree bulk loaded with the Sort-Tile-Recursive algorithm. Nodes
+    are (bounds, children) tuples and leaf entries are (bounds, item) tuples.
+    """
+    def __init__(self, entries, node_capacity=10):
+        """
+        :param entries: List of (bounds, item) tuples, bounds being
+                        (min_x, min_y, max_x, max_y)
+        :param node_capacity: Maximum number of children of a node
+        """
+        self.node_capacity = node_capacity
+        self.size = len(entries)
+        self.root = None
+
+        level = [(bounds, item, True) for bounds, item in entries]
+        while len(level) > 1:
+            level = [
+                (_merge_bounds([child[0] for child in group]), group, False)
+                for group in self._pack(level)
+            ]
+        if level:
+            self.root = level[0]
+
+    def _pack(self, nodes):
+        """Group the nodes of a level into tiles sorted by x then y
+
+        :param nodes: Nodes of a level
+        :returns: Groups of at most node_capacity nodes
+        :rtype: list
+        """
+        def _center(node, axis):
+            return (node[0][axis] + node[0][axis + 2]) / 2
+
+        capacity = self.node_capacity
+        node_count = math.ceil(len(nodes) / capacity)
+        slice_size = capacity * math.ceil(math.sqrt(node_count))
+
+        groups = []
+        nodes = sorted(nodes, key=lambda node: _center(node, 0))
+        for i in range(0, len(nodes), slice_size):
+            vertical_slice = sorted(
+                nodes[i:i + slice_size],
+                key=lambda node: _center(node, 1)
+            )
+            for j in range(0, len(vertical_slice), capacity):
+                groups.append(vertical_slice[j:j + capacity])
+        return groups
+
+    def query(self, bounds):
+        """Find the items whose bounds intersect the given bounds
+
+        :param bounds: (min_x, min_y, max_x, max_y) bounds
+        :returns: Matched items
+        :rtype: list
+        """
+        items = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_bounds, content, is_leaf = stack.pop()
+            if not _intersects(node_bounds, bounds):
+                continue
+            if is_leaf:
+                items.append(content)
+            else:
+                stack.extend(content)
+        return items
+
+    def nearest(self, point, distance=None, max_distance=math.inf):
+        """Find the nearest item to a point with a best-first search
+
+        :param point: (x, y) point
+        :param distance: Function returning the exact distance of an item to
+                         the point. The distance to the item bounds is used
+                         if not set.
+        :param max_distance: Items farther than this distance are ignored
+        :returns: Nearest item and its distance, or (None, None)
+        :rtype: tuple
+        """
+        if not self.root:
+            return None, None
+
+        # The counter breaks ties without comparing nodes
+        counter = 0
+        heap = [
+            (_min_distance(self.root[0], point), counter, self.root, False)
+        ]
+        while heap:
+            node_distance, _, node, is_exact = heapq.heappop(heap)
+            if node_distance > max_distance:
+                break
+            if is_exact:
+                return node[1], node_distance
+
+            node_bounds, content, is_leaf = node
+            if is_leaf:
+                exact = distance(content) if distance else node_distance
+                counter += 1
+                heapq.heappush(heap, (exact, counter, node, True))
+            else:
+                for child in content:
+                    counter += 1
+                    heapq.heappush(heap, (
+                        _min_distance(child[0], point), counter, child, False
+                    ))
+        return None, None
@@ -0,0 +1,89 @@
+import re
+import unicodedata
+
+
+# Weights of the suggestion inputs taken from each attribute
+DEFAULT_WEIGHTS = {
+    'name': 10,
+    'bannerAbbreviation': 8,
+    'arcGisAbbreviation': 8,
+    'synonyms': 5,
+    'nameSuffixes': 2
+}
+
+# Inputs longer than the max_input_length of the completion field are
+# truncated by Elasticsearch
+MAX_INPUT_LENGTH = 50
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_input(value):
+    """Helper function to normalize a suggestion input: compatibility
+    characters folded, whitespace collapsed and surrounding punctuation
+    stripped
+
+    :param value: Raw input
+    :returns: Normalized input or None if empty
+    :rtype: str
+    """
+    if not isinstance(value, str):
+        return None
+    value = unicodedata.normalize('NFKC', value)
+    value = _WHITESPACE.sub(' ', value).strip(' .,;:-_/()')
+    return value[:MAX_INPUT_LENGTH] or None
+
+
+class Suggestions:
+    """
+    Builds the inputs of the completion suggester of a resource from its
+    name, abbreviations and synonyms, deduplicated case-insensitively and
+    grouped by weight
+    """
+    def __init__(self, config):
+        """
+        :param config: suggestions config object
+        """
+        self.weights = {**DEFAULT_WEIGHTS, **config.get('weights', {})}
+        self.min_length = config.get('minLength', 2)
+
+    def _get_raw_inputs(self, attributes):
+        name = attributes.get('name')
+        yield name, self.weights['name']
+        for key in ['bannerAbbreviation', 'arcGisAbbreviation']:
+            yield attributes.get(key), self.weights[key]
+        for synonym in attributes.get('synonyms') or []:
+            yield synonym, self.weights['synonyms']
+
+        # Words after the first one, so "Kelley Engineering Center" is also
+        # suggested while typing "engin"
+        if isinstance(name, str) and self.weights['nameSuffixes']:
+            words = name.split()
+            for index in range(1, len(words)):
+                yield ' '.join(words[index:]), self.weights['nameSuffixes']
+
+    def get_inputs(self, attributes):
+        """Get the suggestion inputs of a resource
+
+        :param attributes: Resource attributes
+        :returns: Completion field value, a list of inputs for each weight
+        :rtype: list
+        """
+        weights = {}
+        inputs = {}
+        for value, weight in self._get_raw_inputs(attributes):
+            value = normalize_input(value)
+            if not value or len(value) < self.min_length:
+                continue
+            key = value.casefold()
+            if weight > weights.get(key, -1):
+                weights[key] = weight
+                inputs[key] = value
+
+        grouped = {}
+        for key, weight in weights.items():
+            grouped.setdefault(weight, []).append(inputs[key])
+        return [
+            {'input': grouped[weight], 'weight': weight}
+            for weight in sorted(grouped, reverse=True)
+        ]
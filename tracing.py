@@ -0,0 +1,413 @@
+from contextvars import ContextVar
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+logger = logging.getLogger(__name__)
+
+# Query parameters whose values are left out of the traced URLs
+SECRET_PARAMETERS = ['apikey', 'key', 'password', 'secret', 'signature',
+                     'token']
+
+# Path segments replaced by {id} in the URL templates, e.g. calendar IDs,
+# document IDs or numeric IDs
+ID_SEGMENT = re.compile(r'.*(@|%40).*|\d{4,}|(?=.*\d)[\w.:=-]{16,}')
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+# Set while a traced request follows its redirects, which are part of its
+# span
+_redirecting = ContextVar('redirecting', default=False)
+
+
+def redact_url(url):
+    """Helper function to remove the secrets from the query of a URL
+
+    :param url: Request URL
+    :returns: URL without the values of SECRET_PARAMETERS
+    :rtype: str
+    """
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [
+        (name, 'REDACTED' if name.lower() in SECRET_PARAMETERS else value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+    ]
+    return urlunsplit(parts._replace(query=urlencode(query, safe='*,()')))
+
+
+def get_url_template(url):
+    """Helper function to get the path of a URL without its IDs and query
+    values, which requests to the same endpoint share
+
+    :param url: Request URL
+    :returns: URL template, e.g. /ical/{id} or /arcgis/query?f&where
+    :rtype: str
+    """
+    parts = urlsplit(url)
+    path = '/'.join(
+        '{id}' if ID_SEGMENT.fullmatch(segment) else segment
+        for segment in parts.path.split('/')
+    )
+    names = sorted({
+        name for name, _ in parse_qsl(parts.query, keep_blank_values=True)
+    })
+    return urlunsplit(('', '', path, '&'.join(names), ''))
+
+
+def _get_body_bytes(response):
+    # Bytes read from the connection, before decompression
+    try:
+        return response.raw.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _to_attribute(key, value):
+    if isinstance(value, bool):
+        value = {'boolValue': value}
+    elif isinstance(value, int):
+        value = {'intValue': str(value)}
+    elif isinstance(value, float):
+        value = {'doubleValue': value}
+    else:
+        value = {'stringValue': str(value)}
+    return {'key': key, 'value': value}
+
+
+class TimedConnectionMixin:
+    """
+    Connection recording how long it took to connect, until the next
+    response sent through it is traced
+    """
+    connect_seconds = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        self.connect_seconds = time.perf_counter() - start
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections record how long they took to connect
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool
+        }
+
+
+class Tracer:
+    """
+    Spans of the outbound requests of a run, with their status, size and
+    connect, time to first byte and total timings, exported as OTLP JSON
+    """
+    def __init__(self, service_name):
+        """
+        :param service_name: Name of the traced script
+        """
+        self.service_name = service_name
+        self.started_ns = time.time_ns()
+        self.spans = []
+
+    @classmethod
+    def from_config(cls, config, service_name):
+        """Create a tracer if tracing is enabled in the config
+
+        :param config: Config object
+        :param service_name: Name of the traced script
+        :returns: Tracer instance, None if disabled
+        :rtype: Tracer
+        """
+        if not config.get('tracing', {}).get('enabled', True):
+            return None
+        return cls(service_name)
+
+    def start_span(self, request):
+        """Start the span of a request
+
+        :param request: Prepared request
+        :returns: Span
+        :rtype: dict
+        """
+        url = redact_url(request.url)
+        span = {
+            'method': request.method,
+            'url': url,
+            'template': get_url_template(url),
+            'host': urlsplit(url).netloc,
+            'start_ns': time.time_ns(),
+            'status': None,
+            'bytes': None,
+            'connect_seconds': None,
+            'ttfb_seconds': None,
+            'total_seconds': None,
+            'error': None,
+            '_start': time.perf_counter()
+        }
+        self.spans.append(span)
+        return span
+
+    def receive_headers(self, span, response):
+        """Record the response headers of a request
+
+        :param span: Span of the request
+        :param response: Response whose body is not read yet
+        """
+        span['ttfb_seconds'] = time.perf_counter() - span['_start']
+        span['status'] = response.status_code
+        # Only known for the connections of a TimedHTTPAdapter
+        connection = getattr(response.raw, 'connection', None)
+        connect_seconds = getattr(connection, 'connect_seconds', None)
+        if connect_seconds is not None:
+            span['connect_seconds'] = connect_seconds
+            # Requests reusing the connection don't connect again
+            connection.connect_seconds = 0.0
+
+    def end_span(self, span, response=None, error=None):
+        """End the span of a request once its body is read
+
+        :param span: Span of the request
+        :param response: Response of the request
+        :param error: Exception raised by the request
+        """
+        if '_start' not in span:
+            return
+        span['total_seconds'] = time.perf_counter() - span.pop('_start')
+        if response is not None:
+            span['bytes'] = _get_body_bytes(response)
+        if error is not None:
+            span['error'] = type(error).__name__
+
+    def pop_spans(self):
+        """Get the spans since the last call
+
+        :returns: Spans
+        :rtype: list
+        """
+        spans = self.spans
+        self.spans = []
+        return spans
+
+    def add_spans(self, spans):
+        """Add the spans of another process, e.g. a worker of the
+        transformation pool
+
+        :param spans: Spans
+        """
+        self.spans += spans
+
+    def to_otlp(self, spans=None):
+        """Export spans in the OTLP JSON format, as children of a span
+        covering the run
+
+        :param spans: Spans, defaults to the spans of the tracer
+        :returns: OTLP traces object
+        :rtype: dict
+        """
+        if spans is None:
+            spans = self.spans
+        trace_id = secrets.token_hex(16)
+        root_id = secrets.token_hex(8)
+        otlp_spans = [{
+            'traceId': trace_id,
+            'spanId': root_id,
+            'name': self.service_name,
+            'kind': SPAN_KIND_INTERNAL,
+            'startTimeUnixNano': str(self.started_ns),
+            'endTimeUnixNano': str(time.time_ns()),
+            'attributes': [],
+            'status': {'code': STATUS_CODE_OK}
+        }]
+
+        for span in spans:
+            start_ns = span['start_ns']
+            # Spans of streamed bodies which were never closed end with
+            # their headers
+            total_seconds = span['total_seconds'] or span['ttfb_seconds'] or 0
+            url = urlsplit(span['url'])
+            attributes = [
+                _to_attribute('http.request.method', span['method']),
+                _to_attribute('url.full', span['url']),
+                _to_attribute('url.template', span['template']),
+                _to_attribute('server.address', url.hostname)
+            ]
+            if url.port:
+                attributes.append(_to_attribute('server.port', url.port))
+            events = []
+            if span['status'] is not None:
+                attributes.append(_to_attribute(
+                    'http.response.status_code', span['status']
+                ))
+            if span['bytes'] is not None:
+                attributes.append(_to_attribute(
+                    'http.response.body.size', span['bytes']
+                ))
+            for key, name in [
+                ('connect_seconds', 'connected'),
+                ('ttfb_seconds', 'first_byte')
+            ]:
+                if span[key] is not None:
+                    attributes.append(_to_attribute(
+                        f'http.client.{key}', round(span[key], 6)
+                    ))
+                    # Reused connections did not connect
+                    if span[key]:
+                        events.append({
+                            'timeUnixNano': str(
+                                start_ns + int(span[key] * 1e9)
+                            ),
+                            'name': name
+                        })
+
+            status = {'code': STATUS_CODE_OK}
+            if span['error'] or (span['status'] or 0) >= 400:
+                status = {
+                    'code': STATUS_CODE_ERROR,
+                    'message': span['error'] or str(span['status'])
+                }
+                if span['error']:
+                    attributes.append(_to_attribute(
+                        'error.type', span['error']
+                    ))
+
+            otlp_spans.append({
+                'traceId': trace_id,
+                'spanId': secrets.token_hex(8),
+                'parentSpanId': root_id,
+                'name': f"{span['method']} {span['template']}",
+                'kind': SPAN_KIND_CLIENT,
+                'startTimeUnixNano': str(start_ns),
+                'endTimeUnixNano': str(start_ns + int(total_seconds * 1e9)),
+                'attributes': attributes,
+                'events': events,
+                'status': status
+            })
+
+        return {
+            'resourceSpans': [{
+                'resource': {
+                    'attributes': [
+                        _to_attribute('service.name', self.service_name)
+                    ]
+                },
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': otlp_spans
+                }]
+            }]
+        }
+
+    def write_otlp(self, file_name, spans=None):
+        """Write spans to an OTLP JSON file
+
+        :param file_name: Output file name
+        :param spans: Spans, defaults to the spans of the tracer
+        """
+        if spans is None:
+            spans = self.spans
+        os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+        with open(file_name, 'w') as file:
+            json.dump(self.to_otlp(spans), file)
+        logger.info(f'[TRACE] {len(spans)} requests written to {file_name}')
+
+
+class TracedSession(requests.Session):
+    """
+    Requests session recording a span of every request with a Tracer,
+    ended once the response body is read or the streamed response is closed
+    """
+    def __init__(self, tracer=None):
+        """
+        :param tracer: Tracer to record the requests into, requests are not
+                       traced if not set
+        """
+        super().__init__()
+        self.tracer = tracer
+        self.mount('http://', TimedHTTPAdapter())
+        self.mount('https://', TimedHTTPAdapter())
+
+    @classmethod
+    def from_session(cls, session, tracer):
+        """Create a traced session with the settings and adapters of another
+        session
+
+        :param session: Requests session
+        :param tracer: Tracer to record the requests into
+        :returns: Traced session
+        :rtype: TracedSession
+        """
+        traced_session = cls(tracer)
+        for attribute in requests.Session.__attrs__:
+            setattr(traced_session, attribute, getattr(session, attribute))
+        return traced_session
+
+    def send(self, request, **kwargs):
+        if self.tracer is None or _redirecting.get():
+            return super().send(request, **kwargs)
+
+        stream = kwargs.pop('stream', None)
+        span = self.tracer.start_span(request)
+        token = _redirecting.set(True)
+        try:
+            # Streamed, so the headers are received before the body is read
+            response = super().send(request, stream=True, **kwargs)
+        except Exception as error:
+            self.tracer.end_span(span, error=error)
+            raise
+        finally:
+            _redirecting.reset(token)
+        self.tracer.receive_headers(span, response)
+
+        if not stream:
+            try:
+                response.content
+            except Exception as error:
+                self.tracer.end_span(span, response, error)
+                raise
+            self.tracer.end_span(span, response)
+            return response
+
+        close = response.close
+
+        def _close():
+            # The body size can't be read once closed
+            self.tracer.end_span(span, response)
+            close()
+
+        response.close = _close
+        return response
@@ -10,10 +10,17 @@ import yaml
 
 logger = logging.getLogger(__name__)
 
+# Prefer the LibYAML based loader which is much faster than the pure Python one
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
-def parse_arguments():
+
+def parse_arguments(generator=False, publisher=False):
     """Helper function for parsing command-line arguments
 
+    :param generator: Accept the options of the scripts building the
+                      locations, e.g. --workers
+    :param publisher: Accept the options of the scripts building and
+                      publishing the locations, e.g. --skip-files
     :returns: Parsed arguments
     :rtype: dict
     """
@@ -28,6 +35,41 @@ def parse_arguments():
         dest='debug',
         help='Enable debug logging mode',
         action='store_true')
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        help='Profile the run and write the profile into the build folder',
+        nargs='?',
+        const='cprofile',
+        choices=['cprofile', 'pyinstrument'])
+    parser.add_argument(
+        '--profile-stage',
+        dest='profile_stage',
+        help=('Only profile the named stage, e.g. converted_coordinates, '
+              'open_hours or bulk'))
+
+    if generator:
+        parser.add_argument(
+            '--trace-memory',
+            dest='trace_memory',
+            help=('Track Python memory allocations of each stage with '
+                  'tracemalloc'),
+            action='store_true')
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            help=('Number of worker processes fetching and transforming the '
+                  'sources in parallel, 0 to run them in the main process'),
+            type=int,
+            default=0)
+
+    if publisher:
+        parser.add_argument(
+            '--skip-files',
+            dest='skip_files',
+            help=('Only publish the resources, without writing them to the '
+                  'build folder'),
+            action='store_true')
 
     return parser.parse_args()
 
@@ -41,7 +83,7 @@ def load_yaml(file_name):
     """
     with open(file_name, 'r') as file:
         try:
-            return yaml.safe_load(file)
+            return yaml.load(file, Loader=SafeLoader)
         except yaml.YAMLError as error:
             logger.debug(error)
             sys.exit(f'Unable to parse {file_name}')
@@ -77,17 +119,58 @@ def load_file(file_name):
             sys.exit(f'File {file_name} not found')
 
 
-def get_calendar_url(calendar_id):
+def get_calendar_url(ical_url, calendar_id):
     """Helper function for generating calendar URL
 
+    :param ical_url: iCal URL template from the config file
     :param calendar_id: Calendar ID
     :returns: Calendar URL string
     :rtype: str
     """
-    ical_url = load_yaml('configuration.yaml')['locations']['ical']['url']
     return ical_url.replace('calendar-id', calendar_id)
 
 
+class ResponseReader:
+    """
+    File-like reader of a streamed response body for incremental parsers,
+    counting the bytes read and optionally looking for a pattern in them
+    """
+    def __init__(self, response, chunk_size=64 * 1024, pattern=None,
+                 pattern_bytes=64):
+        """
+        :param response: Response requested with stream=True
+        :param chunk_size: Number of bytes read at a time
+        :param pattern: Compiled bytes regular expression to look for
+        :param pattern_bytes: Maximum length of a match of the pattern, kept
+                              from the end of each chunk to find the matches
+                              spanning two chunks
+        """
+        self._chunks = response.iter_content(chunk_size)
+        self.bytes_read = 0
+        self.pattern = pattern
+        self.pattern_bytes = pattern_bytes
+        self.matched = False
+        self._tail = b''
+
+    def read(self, size=-1):
+        """Read the next chunk of the decoded body. Parsers keep reading until
+        an empty chunk, so it may be shorter or longer than requested.
+
+        :param size: Requested number of bytes, only zero is honoured
+        :returns: Chunk of the body, empty at the end
+        :rtype: bytes
+        """
+        # Parsers such as ijson probe the type of the stream with read(0)
+        if size == 0:
+            return b''
+        chunk = next(self._chunks, b'')
+        self.bytes_read += len(chunk)
+        if self.pattern and not self.matched and chunk:
+            self.matched = bool(self.pattern.search(self._tail + chunk))
+            self._tail = chunk[-self.pattern_bytes:]
+        return chunk
+
+
 def format_library_hour(string):
     """Helper function to format the open hours of the library
 
@@ -0,0 +1,112 @@
+"""
+Build and publish the resources, then watch the extra data of the contrib
+folder and rebuild only the extra locations and calendars when it changes,
+publishing the documents they affect within seconds:
+
+    $ python watch_extra_data.py --config=configuration.yaml
+"""
+import logging
+import os
+import time
+
+from build_artifacts import LocationsGenerator
+from es_manager import BulkPublisher, ESManager
+import utils
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_modified_time(file_name):
+    """Helper function to get the modification time of a file
+
+    :param file_name: File name
+    :returns: Modification time in nanoseconds, None if the file is missing
+    :rtype: int
+    """
+    try:
+        return os.stat(file_name).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def publish_changes(es_manager, changes):
+    """Publish the resources changed by a rebuild
+
+    :param es_manager: ESManager of the watch
+    :param changes: Changed resources and IDs of the removed ones, as a tuple
+                    keyed by index
+    """
+    for index, (docs, delete_ids) in changes.items():
+        if docs or delete_ids:
+            es_manager.publish_changes(index, docs, delete_ids)
+        logger.info(
+            f'[WATCH] {index}: {len(docs)} changed, {len(delete_ids)} removed'
+        )
+
+
+def watch_extra_data(arguments):
+    """Run a full build, then rebuild the extra data whenever it changes
+    until the next full build is due
+
+    :param arguments: Parsed arguments
+    """
+    write_files = not arguments.skip_files
+    es_manager = None
+
+    while True:
+        # A new generator fetches every source again, with today's dates
+        locations_generator = LocationsGenerator(arguments, keep_state=True)
+        watch_config = locations_generator.config.get('watch', {})
+        interval = watch_config.get('interval', 2)
+        full_build_seconds = watch_config.get('fullBuildHours', 24) * 3600
+
+        if not es_manager:
+            # Not traced, the requests would be kept by the tracer of the
+            # first build for the lifetime of the watch
+            es_manager = ESManager(
+                arguments.config, locations_generator.profiler
+            )
+        extra_data_file = locations_generator.extra_data_file
+        modified_time = get_modified_time(extra_data_file)
+        built_at = time.monotonic()
+        locations_generator.generate_json_resources(
+            BulkPublisher(es_manager), write_files
+        )
+        logger.info(f'[WATCH] Watching {extra_data_file}')
+
+        while time.monotonic() - built_at < full_build_seconds:
+            time.sleep(interval)
+            current_time = get_modified_time(extra_data_file)
+            if current_time is None or current_time == modified_time:
+                continue
+            modified_time = current_time
+
+            logger.info(f'[WATCH] {extra_data_file} changed, rebuilding')
+            try:
+                changes = locations_generator.rebuild_extra_data(write_files)
+            except SystemExit as error:
+                # The file may be saved while it is being edited
+                logger.error(f'[WATCH] {error}, keeping the last build')
+                continue
+            except Exception:
+                logger.exception('[WATCH] Rebuild failed, keeping the last '
+                                 'build')
+                continue
+            publish_changes(es_manager, changes)
+
+
+if __name__ == '__main__':
+    arguments = utils.parse_arguments(generator=True, publisher=True)
+
+    # Setup logging level
+    logging.basicConfig(
+        level=(logging.DEBUG if arguments.debug else logging.INFO)
+    )
+    # Set logging level to WARNING for the logger of elasticsearch package
+    logging.getLogger('elasticsearch').setLevel(logging.WARNING)
+
+    try:
+        watch_extra_data(arguments)
+    except KeyboardInterrupt:
+        pass